@@ -0,0 +1,101 @@
+"""Partition events table by month
+
+Revision ID: 017_partition_events
+Revises: 016_add_admin_users
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '017_partition_events'
+down_revision = '016_add_admin_users'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Trasforma `events` in una tabella partizionata RANGE (timestamp) per mese.
+
+    1. Rinomina la tabella esistente in events_legacy
+    2. Crea la nuova tabella partizionata (PK = id + timestamp)
+    3. Crea una partizione per ogni mese presente nei dati + mese corrente e successivo
+    4. Copia i dati e riallinea la sequence degli id
+    5. Elimina events_legacy
+    """
+    op.execute("ALTER TABLE events RENAME TO events_legacy")
+    op.execute("ALTER INDEX IF EXISTS ix_events_id RENAME TO ix_events_legacy_id")
+    op.execute("ALTER SEQUENCE IF EXISTS events_id_seq RENAME TO events_legacy_id_seq")
+
+    op.execute("""
+        CREATE TABLE events (
+            id SERIAL NOT NULL,
+            element_id INTEGER NOT NULL REFERENCES elements (id),
+            session_id INTEGER REFERENCES game_sessions (id),
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            action VARCHAR(100) NOT NULL,
+            value JSON,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.create_index('ix_events_id', 'events', ['id'], unique=False)
+    op.create_index('ix_events_session_id_timestamp', 'events', ['session_id', 'timestamp'], unique=False)
+    op.create_index('ix_events_element_id_timestamp', 'events', ['element_id', 'timestamp'], unique=False)
+
+    # Una partizione per ogni mese con dati + mese corrente e successivo
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start date;
+            first_month date;
+            last_month date;
+        BEGIN
+            SELECT date_trunc('month', COALESCE(MIN(timestamp), now()))::date INTO first_month FROM events_legacy;
+            last_month := (date_trunc('month', now()) + interval '1 month')::date;
+            month_start := first_month;
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                    'events_' || to_char(month_start, 'YYYY_MM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END $$;
+    """)
+
+    op.execute("""
+        INSERT INTO events (id, element_id, session_id, timestamp, action, value)
+        SELECT id, element_id, session_id, COALESCE(timestamp, now()), action, value
+        FROM events_legacy
+    """)
+    op.execute("SELECT setval('events_id_seq', COALESCE((SELECT MAX(id) FROM events), 0) + 1, false)")
+
+    op.execute("DROP TABLE events_legacy")
+
+
+def downgrade():
+    """Ripristina la tabella events non partizionata (i dati già archiviati non vengono reimportati)"""
+    op.execute("""
+        CREATE TABLE events_flat (
+            id SERIAL PRIMARY KEY,
+            element_id INTEGER NOT NULL REFERENCES elements (id),
+            session_id INTEGER REFERENCES game_sessions (id),
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            action VARCHAR(100) NOT NULL,
+            value JSON
+        )
+    """)
+    op.execute("""
+        INSERT INTO events_flat (id, element_id, session_id, timestamp, action, value)
+        SELECT id, element_id, session_id, timestamp, action, value FROM events
+    """)
+    op.execute("SELECT setval('events_flat_id_seq', COALESCE((SELECT MAX(id) FROM events_flat), 0) + 1, false)")
+    op.execute("DROP TABLE events CASCADE")
+    op.execute("ALTER TABLE events_flat RENAME TO events")
+    op.execute("ALTER SEQUENCE events_flat_id_seq RENAME TO events_id_seq")
+    op.execute("ALTER INDEX events_flat_pkey RENAME TO events_pkey")
+    op.create_index(op.f('ix_events_id'), 'events', ['id'], unique=False)
@@ -0,0 +1,36 @@
+"""Move elements.current_state to JSONB
+
+Revision ID: 018_element_state_jsonb
+Revises: 017_partition_events
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '018_element_state_jsonb'
+down_revision = '017_partition_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # JSONB abilita il merge lato server (current_state || :patch) usato da ElementService.merge_state
+    op.alter_column(
+        'elements', 'current_state',
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_type=postgresql.JSON(astext_type=sa.Text()),
+        postgresql_using='current_state::jsonb'
+    )
+
+
+def downgrade():
+    op.alter_column(
+        'elements', 'current_state',
+        type_=postgresql.JSON(astext_type=sa.Text()),
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        postgresql_using='current_state::json'
+    )
@@ -0,0 +1,53 @@
+"""Add session_state_events and session_state_snapshots
+
+Revision ID: 019_session_state_events
+Revises: 018_element_state_jsonb
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '019_session_state_events'
+down_revision = '018_element_state_jsonb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Event log append-only per sessione (seq monotono per sessione)
+    op.create_table(
+        'session_state_events',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('room', sa.String(length=50), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['game_sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('session_id', 'seq', name='uq_session_state_events_session_seq')
+    )
+
+    # Snapshot periodici della proiezione (recovery veloce al riavvio)
+    op.create_table(
+        'session_state_snapshots',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('state', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['game_sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_session_state_snapshots_session_seq', 'session_state_snapshots', ['session_id', 'seq'])
+
+
+def downgrade():
+    op.drop_index('ix_session_state_snapshots_session_seq', table_name='session_state_snapshots')
+    op.drop_table('session_state_snapshots')
+    op.drop_table('session_state_events')
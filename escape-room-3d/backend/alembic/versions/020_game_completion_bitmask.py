@@ -0,0 +1,35 @@
+"""Add completed_mask and version to game_completion_states
+
+Revision ID: 020_game_completion_bitmask
+Revises: 019_session_state_events
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '020_game_completion_bitmask'
+down_revision = '019_session_state_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('game_completion_states', sa.Column('completed_mask', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('game_completion_states', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill dalla JSON rooms_status: cucina=1, camera=2, bagno=4, soggiorno=8
+    op.execute("""
+        UPDATE game_completion_states SET completed_mask =
+              (CASE WHEN (rooms_status->'cucina'->>'completed')::boolean THEN 1 ELSE 0 END)
+            | (CASE WHEN (rooms_status->'camera'->>'completed')::boolean THEN 2 ELSE 0 END)
+            | (CASE WHEN (rooms_status->'bagno'->>'completed')::boolean THEN 4 ELSE 0 END)
+            | (CASE WHEN (rooms_status->'soggiorno'->>'completed')::boolean THEN 8 ELSE 0 END)
+    """)
+
+
+def downgrade():
+    op.drop_column('game_completion_states', 'version')
+    op.drop_column('game_completion_states', 'completed_mask')
@@ -0,0 +1,37 @@
+"""Add device_session_bindings
+
+Revision ID: 021_device_session_bindings
+Revises: 020_game_completion_bitmask
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '021_device_session_bindings'
+down_revision = '020_game_completion_bitmask'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Device hardware → sessione (più case/partite sullo stesso backend)
+    op.create_table(
+        'device_session_bindings',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('device_id', sa.String(length=100), nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('topic_root', sa.String(length=50), nullable=False, server_default='escape'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['game_sessions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('device_id', name='uq_device_session_bindings_device_id')
+    )
+    op.create_index('ix_device_session_bindings_session', 'device_session_bindings', ['session_id'])
+
+
+def downgrade():
+    op.drop_index('ix_device_session_bindings_session', table_name='device_session_bindings')
+    op.drop_table('device_session_bindings')
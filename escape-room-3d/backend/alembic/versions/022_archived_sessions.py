@@ -0,0 +1,44 @@
+"""Add archived_sessions
+
+Revision ID: 022_archived_sessions
+Revises: 021_device_session_bindings
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '022_archived_sessions'
+down_revision = '021_device_session_bindings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sessioni terminate archiviate: una riga compatta con il documento completo
+    op.create_table(
+        'archived_sessions',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('pin', sa.String(length=4), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('start_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('end_time', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('expected_players', sa.Integer(), nullable=True),
+        sa.Column('players_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('game_won', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('document', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('events_archive', sa.String(), nullable=True),
+        sa.Column('events_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_sessions_end_time', 'archived_sessions', ['end_time'])
+
+
+def downgrade():
+    op.drop_index('ix_archived_sessions_end_time', table_name='archived_sessions')
+    op.drop_table('archived_sessions')
@@ -0,0 +1,43 @@
+"""Add analytics_aggregates
+
+Revision ID: 023_analytics_aggregates
+Revises: 022_archived_sessions
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '023_analytics_aggregates'
+down_revision = '022_archived_sessions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Aggregati per (metrica, soggetto, giorno/settimana) aggiornati a ogni transizione
+    op.create_table(
+        'analytics_aggregates',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('metric', sa.String(length=30), nullable=False),
+        sa.Column('subject', sa.String(length=60), nullable=False),
+        sa.Column('period', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_seconds', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('min_seconds', sa.Float(), nullable=True),
+        sa.Column('max_seconds', sa.Float(), nullable=True),
+        sa.Column('sketch', postgresql.JSONB(astext_type=sa.Text()), nullable=False, server_default='{}'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('metric', 'subject', 'period', 'period_start', name='uq_analytics_aggregates_key')
+    )
+    op.create_index('ix_analytics_aggregates_period', 'analytics_aggregates', ['period', 'period_start'])
+
+
+def downgrade():
+    op.drop_index('ix_analytics_aggregates_period', table_name='analytics_aggregates')
+    op.drop_table('analytics_aggregates')
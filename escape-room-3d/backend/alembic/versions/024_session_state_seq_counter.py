@@ -0,0 +1,30 @@
+"""Add game_sessions.state_seq (seq degli eventi di stato assegnato dal database)
+
+Revision ID: 024_session_state_seq_counter
+Revises: 023_analytics_aggregates
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '024_session_state_seq_counter'
+down_revision = '023_analytics_aggregates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contatore per sessione: UPDATE ... RETURNING al posto del contatore in memoria di ogni processo
+    op.add_column('game_sessions', sa.Column('state_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE game_sessions SET state_seq = coalesce(
+            (SELECT max(seq) FROM session_state_events e WHERE e.session_id = game_sessions.id), 0
+        )
+    """)
+
+
+def downgrade():
+    op.drop_column('game_sessions', 'state_seq')
@@ -11,5 +11,7 @@ from app.api.livingroom_puzzles import router as livingroom_puzzles_router
 from app.api.gate_puzzles import router as gate_puzzles_router
 from app.api.game_completion import router as game_completion_router
 from app.api.spawn import router as spawn_router
+from app.api.session_state import router as session_state_router
+from app.api.session_devices import router as session_devices_router
 
-__all__ = ["rooms_router", "sessions_router", "elements_router", "events_router", "players_router", "puzzles_router", "kitchen_puzzles_router", "bedroom_puzzles_router", "bathroom_puzzles_router", "livingroom_puzzles_router", "gate_puzzles_router", "game_completion_router", "spawn_router"]
+__all__ = ["rooms_router", "sessions_router", "elements_router", "events_router", "players_router", "puzzles_router", "kitchen_puzzles_router", "bedroom_puzzles_router", "bathroom_puzzles_router", "livingroom_puzzles_router", "gate_puzzles_router", "game_completion_router", "spawn_router", "session_state_router", "session_devices_router"]
@@ -2,15 +2,19 @@
 Protected admin endpoints for critical operations
 These endpoints require JWT authentication
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
 
 from app.database import get_db
 from app.models.admin_user import AdminUser
 from app.core.security import get_current_admin
 from app.services.session_service import SessionService
 from app.services.puzzle_service import PuzzleService
+from app.services.session_archive_service import SessionArchiveService
+from app.services.game_analytics_service import GameAnalyticsService
+from app.config import get_settings
 from app.schemas.game_session import GameSessionResponse
 
 router = APIRouter(prefix="/api/admin", tags=["Admin Protected"])
@@ -105,16 +109,113 @@ async def get_system_stats(
     from app.models.game_session import GameSession
     from app.models.element import Element
     from app.models.event import Event
+    from app.models.archived_session import ArchivedSession
     
     total_sessions = db.query(GameSession).count()
     active_sessions = db.query(GameSession).filter(GameSession.end_time.is_(None)).count()
     total_elements = db.query(Element).count()
     total_events = db.query(Event).count()
+    archived_sessions = db.query(ArchivedSession).count()
     
     return {
         "total_sessions": total_sessions,
         "active_sessions": active_sessions,
+        "archived_sessions": archived_sessions,
         "total_elements": total_elements,
         "total_events": total_events,
         "admin": admin.username
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/archive/sessions")
+async def list_archived_sessions(
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Sessioni archiviate (admin only), le più recenti prima
+    """
+    archived = SessionArchiveService.list_archived(db, limit=limit, offset=offset)
+    return [session.summary() for session in archived]
+
+
+@router.get("/archive/sessions/{session_id}")
+async def get_archived_session(
+    session_id: int,
+    include_events: bool = Query(False, description="Rilegge anche gli eventi MQTT dal .jsonl.gz"),
+    db: Session = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Sessione archiviata completa: giocatori, enigmi, stanze, esterno, completamento (admin only)
+    """
+    archived = SessionArchiveService.get_archived(db, session_id)
+    if not archived:
+        raise HTTPException(status_code=404, detail="Sessione archiviata non trovata")
+    
+    result = archived.summary()
+    result["document"] = archived.document
+    if include_events:
+        result["events"] = list(SessionArchiveService.iter_archived_events(archived))
+    return result
+
+
+@router.post("/archive/run")
+async def run_session_archival(
+    older_than_days: int = Query(None, ge=0, description="Default: SESSION_ARCHIVE_AFTER_DAYS"),
+    db: Session = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Archivia subito le sessioni terminate più vecchie della soglia (admin only)
+    """
+    settings = get_settings()
+    archived = SessionArchiveService.archive_ended_sessions(
+        db,
+        older_than_days=settings.session_archive_after_days if older_than_days is None else older_than_days,
+        archive_dir=settings.session_archive_dir,
+        limit=settings.session_archive_batch
+    )
+    return {
+        "archived": archived,
+        "count": len(archived),
+        "archived_by": admin.username
+    }
+
+
+@router.get("/analytics")
+async def get_analytics_dashboard(
+    period: str = Query("week", pattern="^(day|week)$"),
+    day: Optional[date] = Query(None, description="Giorno del periodo (default: oggi, UTC)"),
+    db: Session = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Tempi di enigmi, stanze e vittorie del giorno/settimana (admin only)
+    
+    Letti dagli aggregati incrementali: count, media, min/max e p50/p90/p95
+    per enigma e per stanza, senza scansionare le sessioni storiche.
+    """
+    return GameAnalyticsService.dashboard(db, period, day)
+
+
+@router.get("/analytics/trend")
+async def get_analytics_trend(
+    metric: str = Query(..., pattern="^(puzzle_solve|room_completion|victory)$"),
+    subject: str = Query(..., description="es. cucina/fornelli, cucina, game"),
+    period: str = Query("day", pattern="^(day|week)$"),
+    limit: int = Query(30, ge=1, le=365),
+    db: Session = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Serie storica di un enigma/stanza/vittoria, un punto per giorno o settimana (admin only)
+    """
+    return {
+        "metric": metric,
+        "subject": subject,
+        "period": period,
+        "points": GameAnalyticsService.trend(db, metric, subject, period, limit)
+    }
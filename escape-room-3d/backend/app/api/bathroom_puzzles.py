@@ -8,7 +8,9 @@ from app.schemas.bathroom_puzzle import (
     CompletePuzzleRequest,
     ResetPuzzlesRequest
 )
-from app.websocket.handler import broadcast_bathroom_update
+from app.services.game_completion_service import GameCompletionService
+from app.core.fast_json import response_cache, row_version
+from app.websocket.state_diff import state_diff_broadcaster
 
 router = APIRouter(prefix="/api", tags=["bathroom-puzzles"])
 
@@ -22,9 +24,15 @@ def get_bathroom_puzzle_state(session_id: int, db: Session = Depends(get_db)):
     - puzzle states (locked/active/done)
     - LED colors (off/red/green)
     - timestamps
+    
+    ⚡ Body JSON in cache finché lo stato del bagno non cambia.
     """
     try:
-        return BathroomPuzzleService.get_state_response(db, session_id)
+        state = BathroomPuzzleService.get_or_create_state(db, session_id)
+        return response_cache.response(
+            "bathroom/state", session_id, row_version(state),
+            lambda: BathroomPuzzleService.state_document(state)
+        )
     except ValueError as e:
         # Session doesn't exist - return 404
         raise HTTPException(
@@ -75,27 +83,9 @@ async def complete_bathroom_puzzle(
     # 🔥 FIX: Commit changes to database before broadcasting
     db.commit()
     
-    # Broadcast update via WebSocket
-    await broadcast_bathroom_update(session_id, result.dict())
-    
-    # 🆕 FIX LED PORTA: Se ventola completato → broadcast anche game_completion_update
-    if puzzle_name == "ventola" and result:
-        from app.services.game_completion_service import GameCompletionService
-        from app.websocket.handler import broadcast_game_completion_update
-        
-        # Calcola nuovi stati LED porta
-        led_states = GameCompletionService.get_door_led_states(db, session_id)
-        completion_state = GameCompletionService.get_or_create_state(db, session_id)
-        
-        # Broadcast game_completion_update per aggiornare LED porta
-        await broadcast_game_completion_update(session_id, {
-            "session_id": session_id,
-            "door_led_states": led_states,
-            "rooms_status": completion_state.rooms_status,
-            "game_won": completion_state.game_won,
-            "completed_rooms": sum(1 for r in completion_state.rooms_status.values() if r.get("completed")),
-            "updated_at": completion_state.updated_at.isoformat() if completion_state.updated_at else None
-        })
+    # Broadcast via WebSocket: un solo state_diff, con game_completion (LED porta) se ventola ha completato il bagno
+    completion_state = GameCompletionService.get_or_create_state(db, session_id) if puzzle_name == "ventola" else None
+    await state_diff_broadcaster.publish(session_id, "bagno", result, completion=completion_state)
     
     return result
 
@@ -112,7 +102,7 @@ async def reset_bathroom_puzzles(
     - level="full": Reset all puzzles to initial state
     - level="partial": Reset specific puzzles only
     
-    🆕 ALSO broadcasts game_completion_update to update door LED!
+    🆕 Broadcasts puzzle state + game completion (door LED) as ONE state_diff message.
     """
     print(f"\n🔄 [API /reset] START - session_id={session_id}, level={request.level}, puzzles={request.puzzles_to_reset}")
     
@@ -139,57 +129,18 @@ async def reset_bathroom_puzzles(
         )
         print(f"✅ [API /reset] Puzzles reset successfully")
         
-        # STEP 3: Broadcast puzzle state update
-        print(f"🔍 [API /reset] Step 3: Broadcasting puzzle state update...")
-        await broadcast_bathroom_update(session_id, result.dict())
-        print(f"✅ [API /reset] Puzzle state update broadcasted")
-        
-        # STEP 4: Get game completion state
-        print(f"🔍 [API /reset] Step 4: Getting game completion state...")
-        from app.services.game_completion_service import GameCompletionService
-        from app.websocket.handler import broadcast_game_completion_update
-        
-        # 🔧 FIX: Wrap get_door_led_states in try-except (can fail if puzzle states don't exist)
-        try:
-            led_states = GameCompletionService.get_door_led_states(db, session_id)
-            print(f"✅ [API /reset] LED states: {led_states}")
-        except Exception as led_error:
-            print(f"⚠️ [API /reset] Error getting LED states: {led_error}")
-            # CRITICAL: Rollback transaction on error to prevent InFailedSqlTransaction
-            db.rollback()
-            # Fallback: all doors red (initial state)
-            led_states = {"cucina": "red", "camera": "red", "bagno": "red", "soggiorno": "red"}
-        
+        # STEP 3: Broadcast stato bagno + game_completion in un solo state_diff
+        print(f"🔍 [API /reset] Step 3: Broadcasting state_diff...")
         try:
             state = GameCompletionService.get_or_create_state(db, session_id)
-            print(f"✅ [API /reset] Completion state: game_won={state.game_won}, rooms={state.rooms_status}")
         except Exception as state_error:
             print(f"⚠️ [API /reset] Error getting completion state: {state_error}")
+            # CRITICAL: Rollback transaction on error to prevent InFailedSqlTransaction
             db.rollback()
-            # Create minimal fallback state
-            from datetime import datetime
-            state = type('obj', (object,), {
-                'rooms_status': {"cucina": {"completed": False}, "camera": {"completed": False}, "bagno": {"completed": False}, "soggiorno": {"completed": False}},
-                'game_won': False,
-                'victory_time': None,
-                'updated_at': datetime.utcnow(),
-                'get_completed_rooms_count': lambda: 0
-            })()
+            state = None
         
-        # STEP 5: Broadcast game completion update
-        print(f"🔍 [API /reset] Step 5: Broadcasting game completion update...")
-        completion_data = {
-            "session_id": session_id,
-            "rooms_status": state.rooms_status,
-            "door_led_states": led_states,
-            "game_won": state.game_won,
-            "victory_time": state.victory_time.isoformat() if state.victory_time else None,
-            "completed_rooms_count": state.get_completed_rooms_count(),
-            "updated_at": state.updated_at.isoformat()
-        }
-        
-        await broadcast_game_completion_update(session_id, completion_data)
-        print(f"✅ [API /reset] Game completion update broadcasted")
+        await state_diff_broadcaster.publish(session_id, "bagno", result, completion=state)
+        print(f"✅ [API /reset] state_diff broadcasted")
         print(f"🎉 [API /reset] COMPLETED SUCCESSFULLY\n")
         
         return result
@@ -229,13 +180,16 @@ async def get_door_servo_status(
         puzzle = BathroomPuzzleService.get_or_create(db, session_id)
         
         # Check game_won status from game_completion_service
-        from app.services.game_completion_service import GameCompletionService
         completion = GameCompletionService.get_or_create_state(db, session_id)
         
-        return {
-            "should_open_servo": puzzle.door_servo_should_open or completion.game_won,
-            "game_won": completion.game_won
-        }
+        return response_cache.response(
+            "bathroom/door-servo-status", session_id,
+            (row_version(puzzle), completion.version),
+            lambda: {
+                "should_open_servo": puzzle.door_servo_should_open or completion.game_won,
+                "game_won": completion.game_won
+            }
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -261,12 +215,11 @@ async def get_window_servo_status(
     """
     try:
         puzzle = BathroomPuzzleService.get_or_create(db, session_id)
-        ventola_status = puzzle.puzzle_states.get("ventola", {}).get("status", "locked")
         
-        return {
+        return response_cache.response("bathroom/window-servo-status", session_id, row_version(puzzle), lambda: {
             "should_close_window": puzzle.window_servo_should_close,
-            "ventola_status": ventola_status
-        }
+            "ventola_status": puzzle.puzzle_states.get("ventola", {}).get("status", "locked")
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -292,12 +245,11 @@ async def get_fan_status(
     """
     try:
         puzzle = BathroomPuzzleService.get_or_create(db, session_id)
-        ventola_status = puzzle.puzzle_states.get("ventola", {}).get("status", "locked")
         
-        return {
+        return response_cache.response("bathroom/fan-status", session_id, row_version(puzzle), lambda: {
             "should_run_fan": puzzle.fan_should_run,
-            "ventola_status": ventola_status
-        }
+            "ventola_status": puzzle.puzzle_states.get("ventola", {}).get("status", "locked")
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
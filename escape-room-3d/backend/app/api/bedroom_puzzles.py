@@ -8,7 +8,9 @@ from app.schemas.bedroom_puzzle import (
     PuzzleCompletionRequest,
     ResetPuzzlesRequest
 )
-from app.websocket.handler import broadcast_bedroom_puzzle_update
+from app.services.game_completion_service import GameCompletionService
+from app.core.fast_json import response_cache, row_version
+from app.websocket.state_diff import state_diff_broadcaster
 
 router = APIRouter(prefix="/api/sessions/{session_id}/bedroom-puzzles", tags=["bedroom-puzzles"])
 
@@ -22,10 +24,14 @@ async def get_puzzle_state(
     Get current bedroom puzzle state for a session.
     
     Returns puzzle states and LED colors.
+    ⚡ Body JSON in cache finché lo stato della camera non cambia.
     """
     try:
-        state = BedroomPuzzleService.get_state_response(db, session_id)
-        return state
+        state = BedroomPuzzleService.get_or_create_state(db, session_id)
+        return response_cache.response(
+            "bedroom/state", session_id, row_version(state),
+            lambda: BedroomPuzzleService.state_document(state)
+        )
     except ValueError as e:
         # Session doesn't exist - return 404
         raise HTTPException(
@@ -58,7 +64,7 @@ async def complete_comodino(
         )
     
     # Broadcast update to all connected clients
-    await broadcast_bedroom_puzzle_update(session_id, result)
+    await state_diff_broadcaster.publish(session_id, "camera", result)
     
     return result
 
@@ -83,7 +89,7 @@ async def complete_materasso(
         )
     
     # Broadcast update to all connected clients
-    await broadcast_bedroom_puzzle_update(session_id, result)
+    await state_diff_broadcaster.publish(session_id, "camera", result)
     
     return result
 
@@ -108,7 +114,7 @@ async def complete_poltrona(
         )
     
     # Broadcast update to all connected clients
-    await broadcast_bedroom_puzzle_update(session_id, result)
+    await state_diff_broadcaster.publish(session_id, "camera", result)
     
     return result
 
@@ -132,30 +138,9 @@ async def complete_ventola(
             detail="Ventola puzzle is not active or already completed"
         )
     
-    # Broadcast update to all connected clients
-    await broadcast_bedroom_puzzle_update(session_id, result)
-    
-    # 🆕 CRITICAL FIX: Broadcast game completion update when room is completed
-    from app.services.game_completion_service import GameCompletionService
-    from app.websocket.handler import broadcast_game_completion_update
-    
-    # Get updated game completion state
+    # 🆕 Room completata: stato camera + game_completion (LED porta) in un solo state_diff
     completion_state = GameCompletionService.get_or_create_state(db, session_id)
-    door_led_states = GameCompletionService.get_door_led_states(db, session_id)
-    
-    # Build response matching frontend expectations
-    completion_data = {
-        'session_id': completion_state.session_id,
-        'rooms_status': completion_state.rooms_status,
-        'door_led_states': door_led_states,
-        'game_won': completion_state.game_won,
-        'victory_time': completion_state.victory_time.isoformat() if completion_state.victory_time else None,
-        'completed_rooms': completion_state.get_completed_rooms_count(),
-        'updated_at': completion_state.updated_at.isoformat()
-    }
-    
-    # Broadcast to all clients in the session
-    await broadcast_game_completion_update(session_id, completion_data)
+    await state_diff_broadcaster.publish(session_id, "camera", result, completion=completion_state)
     
     return result
 
@@ -181,8 +166,9 @@ async def reset_puzzles(
             request.puzzles_to_reset
         )
         
-        # Broadcast update to all connected clients
-        await broadcast_bedroom_puzzle_update(session_id, result)
+        # Broadcast update to all connected clients (il full reset azzera anche il completamento camera)
+        completion_state = GameCompletionService.get_or_create_state(db, session_id) if request.level == "full" else None
+        await state_diff_broadcaster.publish(session_id, "camera", result, completion=completion_state)
         
         return result
     except Exception as e:
@@ -209,13 +195,11 @@ async def get_fan_status(
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
         # Fan should run when ventola puzzle is done
-        should_run = state.puzzle_states["ventola"]["status"] == "done"
-        
-        return {
+        return response_cache.response("bedroom/fan-status", session_id, row_version(state), lambda: {
             "session_id": session_id,
-            "should_run_fan": should_run,
+            "should_run_fan": state.puzzle_states["ventola"]["status"] == "done",
             "ventola_status": state.puzzle_states["ventola"]["status"]
-        }
+        })
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -238,13 +222,11 @@ async def get_door_servo_status(
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
         # Door servo should open when porta is unlocked
-        should_open = state.puzzle_states["porta"]["status"] == "unlocked"
-        
-        return {
+        return response_cache.response("bedroom/door-servo-status", session_id, row_version(state), lambda: {
             "session_id": session_id,
-            "should_open_servo": should_open,
+            "should_open_servo": state.puzzle_states["porta"]["status"] == "unlocked",
             "porta_status": state.puzzle_states["porta"]["status"]
-        }
+        })
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -267,13 +249,11 @@ async def get_bed_servo_status(
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
         # Bed should lower when materasso puzzle is done
-        should_lower = state.puzzle_states["materasso"]["status"] == "done"
-        
-        return {
+        return response_cache.response("bedroom/bed-servo-status", session_id, row_version(state), lambda: {
             "session_id": session_id,
-            "should_lower_bed": should_lower,
+            "should_lower_bed": state.puzzle_states["materasso"]["status"] == "done",
             "materasso_status": state.puzzle_states["materasso"]["status"]
-        }
+        })
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
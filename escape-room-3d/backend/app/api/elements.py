@@ -4,6 +4,8 @@ from typing import List
 from app.database import get_db
 from app.services.element_service import ElementService
 from app.services.room_service import RoomService
+from app.services.element_topic_index import element_topic_index
+from app.services.routing_sync import ELEMENTS, routing_sync
 from app.schemas.element import ElementCreate, ElementUpdate, ElementResponse, ElementStateUpdate
 
 router = APIRouter(prefix="/elements", tags=["elements"])
@@ -43,7 +45,10 @@ def create_element(element_data: ElementCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Room not found")
     
     service = ElementService(db)
-    return service.create(element_data)
+    element = service.create(element_data)
+    element_topic_index.upsert(element)
+    routing_sync.notify(db, ELEMENTS)
+    return element
 
 
 @router.put("/{element_id}", response_model=ElementResponse)
@@ -52,6 +57,8 @@ def update_element(element_id: int, element_data: ElementUpdate, db: Session = D
     element = service.update(element_id, element_data)
     if not element:
         raise HTTPException(status_code=404, detail="Element not found")
+    element_topic_index.upsert(element)
+    routing_sync.notify(db, ELEMENTS)
     return element
 
 
@@ -69,3 +76,5 @@ def delete_element(element_id: int, db: Session = Depends(get_db)):
     service = ElementService(db)
     if not service.delete(element_id):
         raise HTTPException(status_code=404, detail="Element not found")
+    element_topic_index.remove(element_id)
+    routing_sync.notify(db, ELEMENTS)
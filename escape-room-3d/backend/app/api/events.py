@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 from app.database import get_db
 from app.services.event_service import EventService
 from app.services.element_service import ElementService
@@ -14,17 +15,27 @@ router = APIRouter(prefix="/events", tags=["events"])
 def get_events(
     session_id: Optional[int] = Query(None, alias="sessionId"),
     element_id: Optional[int] = Query(None, alias="elementId"),
-    limit: int = Query(100, le=1000),
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[datetime] = Query(None, description="Cursore: solo eventi precedenti a questo timestamp"),
+    before_id: Optional[int] = Query(None, alias="beforeId", description="Cursore: id dell'ultimo evento ricevuto (con before)"),
+    since: Optional[datetime] = Query(None, description="Solo eventi da questo timestamp in poi"),
     db: Session = Depends(get_db)
 ):
+    """
+    Eventi in ordine cronologico inverso, paginati.
+
+    Per la pagina successiva passare `before` = timestamp e `beforeId` = id
+    dell'ultimo evento ricevuto (cursore su (timestamp, id): nessun evento
+    saltato anche se più eventi hanno lo stesso timestamp).
+    """
     service = EventService(db)
     
     if session_id:
-        return service.get_by_session(session_id)
+        return service.get_by_session(session_id, limit, before, since, before_id)
     elif element_id:
-        return service.get_by_element(element_id)
+        return service.get_by_element(element_id, limit, before, since, before_id)
     else:
-        return service.get_recent(limit)
+        return service.get_recent(limit, before, since, before_id)
 
 
 @router.get("/{event_id}", response_model=EventResponse)
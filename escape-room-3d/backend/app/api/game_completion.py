@@ -1,6 +1,8 @@
 """Game Completion API Endpoints"""
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
+from app.core.fast_json import response_cache
 from app.database import get_db
 from app.services.game_completion_service import GameCompletionService
 from app.schemas.game_completion import (
@@ -25,34 +27,16 @@ def get_game_completion_state(
     - door_led_states: LED states (red/blinking/green) for door LEDs
     - game_won: True if all 4 rooms completed
     - victory_time: Timestamp of victory (if game won)
+    
+    ⚡ Body JSON in cache per `version`: i LED porta sono derivati dalla bitmask,
+    nessuna query oltre alla riga di completamento.
     """
     try:
         state = GameCompletionService.get_or_create_state(db, session_id)
-        
-        # 🔧 FIX: Wrap get_door_led_states in try-except (can fail if puzzle states don't exist)
-        try:
-            door_led_states = GameCompletionService.get_door_led_states(db, session_id)
-        except Exception as led_error:
-            print(f"⚠️ [game-completion/state] Error getting LED states: {led_error}")
-            # CRITICAL: Rollback transaction on error to prevent InFailedSqlTransaction
-            db.rollback()
-            # Fallback: all doors red (initial state)
-            door_led_states = {"cucina": "red", "camera": "red", "bagno": "red", "soggiorno": "red"}
-        
-        # Convert rooms_status dict to typed schema
-        rooms_status_typed = {
-            room: RoomStatusDetail(**status)
-            for room, status in state.rooms_status.items()
-        }
-        
-        return GameCompletionResponse(
-            session_id=state.session_id,
-            rooms_status=rooms_status_typed,
-            door_led_states=DoorLEDStates(**door_led_states),
-            game_won=state.game_won,
-            victory_time=state.victory_time,
-            completed_rooms_count=state.get_completed_rooms_count(),
-            updated_at=state.updated_at
+        return response_cache.response(
+            "game-completion/state", session_id,
+            (state.id, state.version, state.updated_at),
+            lambda: GameCompletionService.state_document(state)
         )
     except ValueError as e:
         # Session doesn't exist
@@ -79,7 +63,7 @@ def sync_game_completion(
     """
     try:
         state = GameCompletionService.check_and_update_all_rooms(db, session_id)
-        door_led_states = GameCompletionService.get_door_led_states(db, session_id)
+        door_led_states = GameCompletionService.get_door_led_states(db, session_id, state)
         
         rooms_status_typed = {
             room: RoomStatusDetail(**status)
@@ -93,6 +77,7 @@ def sync_game_completion(
             game_won=state.game_won,
             victory_time=state.victory_time,
             completed_rooms_count=state.get_completed_rooms_count(),
+            version=state.version,
             updated_at=state.updated_at
         )
     except Exception as e:
@@ -114,7 +99,7 @@ def reset_game_completion(
     """
     try:
         state = GameCompletionService.reset_game_completion(db, session_id)
-        door_led_states = GameCompletionService.get_door_led_states(db, session_id)
+        door_led_states = GameCompletionService.get_door_led_states(db, session_id, state)
         
         rooms_status_typed = {
             room: RoomStatusDetail(**status)
@@ -128,6 +113,7 @@ def reset_game_completion(
             game_won=state.game_won,
             victory_time=state.victory_time,
             completed_rooms_count=state.get_completed_rooms_count(),
+            version=state.version,
             updated_at=state.updated_at
         )
     except Exception as e:
@@ -154,25 +140,30 @@ def get_game_completion_status_esp32(
     try:
         state = GameCompletionService.get_or_create_state(db, session_id)
         
-        return {
-            "kitchen_complete": state.rooms_status.get("cucina", {}).get("completed", False),
-            "bedroom_complete": state.rooms_status.get("camera", {}).get("completed", False),
-            "livingroom_complete": state.rooms_status.get("soggiorno", {}).get("completed", False),
-            "bathroom_complete": state.rooms_status.get("bagno", {}).get("completed", False),
+        return response_cache.response("game-completion/status", session_id, (state.id, state.version), lambda: {
+            "kitchen_complete": state.is_room_completed("cucina"),
+            "bedroom_complete": state.is_room_completed("camera"),
+            "livingroom_complete": state.is_room_completed("soggiorno"),
+            "bathroom_complete": state.is_room_completed("bagno"),
             "all_rooms_complete": state.game_won
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/game-completion/door-leds")
-def get_door_leds_global(db: Session = Depends(get_db)):
+def get_door_leds_global(
+    device_id: Optional[str] = Query(None, description="Device ESP32 (alternativa all'header X-Device-Id)"),
+    x_device_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """
     ✨ ENDPOINT GLOBALE per ESP32 - Auto-resolve sessione attiva
     
     Questo endpoint:
     - NON richiede session_id hardcoded
-    - Auto-risolve la sessione attiva corrente
+    - Auto-risolve la sessione del device (X-Device-Id o ?device_id=):
+      associazione esplicita, altrimenti la sessione attiva corrente
     - Restituisce SOLO gli stati dei LED porta
     
     Ideale per ESP32 che non devono essere riconfigurati
@@ -190,13 +181,12 @@ def get_door_leds_global(db: Session = Depends(get_db)):
     - Restituisce tutti LED rossi (stato iniziale)
     """
     try:
-        from app.services.session_service import SessionService
+        from app.services.device_session_router import device_session_router
         
-        # Auto-resolve sessione attiva
-        session_service = SessionService(db)
-        active_session = session_service.get_active()
+        # Auto-resolve sessione del device (più case sullo stesso backend)
+        session_id = device_session_router.resolve(db, device_id or x_device_id)
         
-        if not active_session:
+        if session_id is None:
             # Nessuna sessione attiva - Restituisci stato iniziale (tutti rossi)
             return {
                 "cucina": "red",
@@ -205,15 +195,13 @@ def get_door_leds_global(db: Session = Depends(get_db)):
                 "soggiorno": "red"
             }
         
-        # Ottieni door_led_states della sessione attiva
-        door_led_states = GameCompletionService.get_door_led_states(db, active_session.id)
+        # Ottieni door_led_states della sessione del device (body in cache per version)
+        state = GameCompletionService.get_or_create_state(db, session_id)
         
-        return {
-            "cucina": door_led_states.get("cucina", "red"),
-            "camera": door_led_states.get("camera", "red"),
-            "bagno": door_led_states.get("bagno", "red"),
-            "soggiorno": door_led_states.get("soggiorno", "red")
-        }
+        return response_cache.response(
+            "game-completion/door-leds", session_id, (state.id, state.version),
+            state.door_led_states
+        )
         
     except Exception as e:
         # In caso di errore, restituisci stato sicuro (tutti rossi)
@@ -1,7 +1,9 @@
 """Gate Puzzle API Endpoints - Esterno"""
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from app.core.fast_json import response_cache, row_version
 from app.database import get_db
+from app.services.game_completion_service import GameCompletionService
 from app.services.gate_puzzle_service import GatePuzzleService
 from app.schemas.gate_puzzle import (
     GatePuzzleResponse,
@@ -36,17 +38,17 @@ def get_gate_state(
     try:
         puzzle = GatePuzzleService.get_state(db, session_id)
         
-        return GatePuzzleStateResponse(
-            session_id=puzzle.session_id,
-            photocell_clear=puzzle.photocell_clear,
-            gates_open=puzzle.gates_open,
-            door_open=puzzle.door_open,
-            roof_open=puzzle.roof_open,
-            led_status=puzzle.led_status,
-            rgb_strip_on=puzzle.rgb_strip_on,
-            completed=(puzzle.completed_at is not None),
-            updated_at=puzzle.updated_at
-        )
+        return response_cache.response("gate/state", session_id, row_version(puzzle), lambda: {
+            "session_id": puzzle.session_id,
+            "photocell_clear": puzzle.photocell_clear,
+            "gates_open": puzzle.gates_open,
+            "door_open": puzzle.door_open,
+            "roof_open": puzzle.roof_open,
+            "led_status": puzzle.led_status,
+            "rgb_strip_on": puzzle.rgb_strip_on,
+            "completed": puzzle.completed_at is not None,
+            "updated_at": puzzle.updated_at
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -112,8 +114,13 @@ def get_esp32_state(
         }
     """
     try:
-        state = GatePuzzleService.get_esp32_state(db, session_id)
-        return GatePuzzleESP32Response(**state)
+        puzzle = GatePuzzleService.get_or_create(db, session_id)
+        game_state = GameCompletionService.get_or_create_state(db, session_id)
+        return response_cache.response(
+            "gate/esp32-state", session_id,
+            (row_version(puzzle), game_state.version),
+            lambda: GatePuzzleService.esp32_document(puzzle, game_state)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -9,7 +9,9 @@ from app.schemas.kitchen_puzzle import (
     PuzzleCompletionRequest,
     ResetPuzzlesRequest
 )
-from app.websocket.handler import broadcast_puzzle_update, broadcast_game_completion_update
+from app.core.fast_json import response_cache, row_version
+from app.websocket.handler import broadcast_puzzle_update
+from app.websocket.state_diff import state_diff_broadcaster
 
 router = APIRouter(prefix="/api/sessions/{session_id}/kitchen-puzzles", tags=["kitchen-puzzles"])
 
@@ -23,10 +25,16 @@ async def get_puzzle_state(
     Get current kitchen puzzle state for a session.
     
     Returns puzzle states and LED colors.
+    ⚡ Body JSON in cache finché stato cucina e game_completion (LED porta) non cambiano.
     """
     try:
-        state = KitchenPuzzleService.get_state_response(db, session_id)
-        return state
+        state = KitchenPuzzleService.get_or_create_state(db, session_id)
+        completion = GameCompletionService.get_or_create_state(db, session_id)
+        return response_cache.response(
+            "kitchen/state", session_id,
+            (row_version(state), completion.version),
+            lambda: KitchenPuzzleService.state_document(state, completion)
+        )
     except ValueError as e:
         # Session doesn't exist
         raise HTTPException(
@@ -65,7 +73,7 @@ async def complete_fornelli(
         )
     
     # Broadcast update to all connected clients
-    await broadcast_puzzle_update(session_id, result)
+    await state_diff_broadcaster.publish(session_id, "cucina", result)
     
     return result
 
@@ -83,14 +91,15 @@ async def get_frigo_servo_state(
         # Get puzzle state
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        # Servo should close when frigo puzzle is "done" (completed)
-        frigo_status = state.puzzle_states.get("frigo", {}).get("status", "locked")
-        should_close = frigo_status == "done"
+        def build():
+            # Servo should close when frigo puzzle is "done" (completed)
+            frigo_status = state.puzzle_states.get("frigo", {}).get("status", "locked")
+            return {
+                "should_close_servo": frigo_status == "done",
+                "frigo_status": frigo_status
+            }
         
-        return {
-            "should_close_servo": should_close,
-            "frigo_status": frigo_status
-        }
+        return response_cache.response("kitchen/frigo-servo", session_id, row_version(state), build)
     
     except Exception as e:
         raise HTTPException(
@@ -112,14 +121,14 @@ async def get_strip_led_state(
         # Get puzzle state
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        # Strip LED follows serra status (synchronized virtual + physical)
-        is_on = state.puzzle_states.get("strip_led", {}).get("is_on", False)
-        serra_status = state.puzzle_states.get("serra", {}).get("status", "locked")
+        def build():
+            # Strip LED follows serra status (synchronized virtual + physical)
+            return {
+                "is_on": state.puzzle_states.get("strip_led", {}).get("is_on", False),
+                "serra_status": state.puzzle_states.get("serra", {}).get("status", "locked")
+            }
         
-        return {
-            "is_on": is_on,
-            "serra_status": serra_status
-        }
+        return response_cache.response("kitchen/strip-led", session_id, row_version(state), build)
     
     except Exception as e:
         raise HTTPException(
@@ -148,7 +157,7 @@ async def complete_frigo(
         )
     
     # Broadcast update to all connected clients
-    await broadcast_puzzle_update(session_id, result)
+    await state_diff_broadcaster.publish(session_id, "cucina", result)
     
     return result
 
@@ -304,7 +313,7 @@ async def complete_serra(
     Validates that serra is active before completing.
     On success, unlocks porta (door).
     
-    🆕 ALSO broadcasts game_completion_update to update door LED!
+    🆕 Broadcasts puzzle state + game completion (door LED) as ONE state_diff message.
     """
     print(f"\n🌿 [API /serra/complete] START for session {session_id}")
     
@@ -319,34 +328,13 @@ async def complete_serra(
                 detail="Serra puzzle is not active or already completed"
             )
         
-        # Broadcast puzzle state update to all connected clients
-        print(f"📡 [API /serra/complete] Broadcasting puzzle_state_update...")
-        await broadcast_puzzle_update(session_id, result)
-        print(f"✅ [API /serra/complete] puzzle_state_update broadcasted")
-        
-        # 🆕 FIX: Broadcast game completion update FROM HERE (async context)
-        # Get door LED states after room completion
-        print(f"🔍 [API /serra/complete] Getting door LED states...")
-        led_states = GameCompletionService.get_door_led_states(db, session_id)
-        print(f"🔍 [API /serra/complete] LED states: {led_states}")
-        
+        # 🆕 Un solo state_diff: stato cucina + game_completion (LED porta derivati dalla bitmask)
         state = GameCompletionService.get_or_create_state(db, session_id)
-        print(f"🔍 [API /serra/complete] Completion state: rooms_status={state.rooms_status}, game_won={state.game_won}")
+        print(f"🔍 [API /serra/complete] Completion state: mask={state.completed_mask}, game_won={state.game_won}")
         
-        completion_data = {
-            "session_id": session_id,
-            "rooms_status": state.rooms_status,
-            "door_led_states": led_states,
-            "game_won": state.game_won,
-            "victory_time": state.victory_time.isoformat() if state.victory_time else None,
-            "completed_rooms_count": state.get_completed_rooms_count(),
-            "updated_at": state.updated_at.isoformat()
-        }
-        
-        print(f"📡 [API /serra/complete] Broadcasting game_completion_update...")
-        print(f"📡 [API /serra/complete] Completion data: {completion_data}")
-        await broadcast_game_completion_update(session_id, completion_data)
-        print(f"🚀 [API /serra/complete] game_completion_update broadcasted successfully!\n")
+        print(f"📡 [API /serra/complete] Broadcasting state_diff...")
+        await state_diff_broadcaster.publish(session_id, "cucina", result, completion=state)
+        print(f"🚀 [API /serra/complete] state_diff broadcasted successfully!\n")
         
         return result
         
@@ -375,7 +363,7 @@ async def reset_puzzles(
     - Full reset: All puzzles back to initial state
     - Partial reset: Reset specific puzzles
     
-    🆕 ALSO broadcasts game_completion_update to update door LED!
+    🆕 Broadcasts puzzle state + game completion (door LED) as ONE state_diff message.
     """
     print(f"\n🔄 [API /reset] START - session_id={session_id}, level={request.level}, puzzles={request.puzzles_to_reset}")
     
@@ -402,33 +390,11 @@ async def reset_puzzles(
         )
         print(f"✅ [API /reset] Puzzles reset successfully")
         
-        # STEP 3: Broadcast puzzle state update
-        print(f"🔍 [API /reset] Step 3: Broadcasting puzzle state update...")
-        await broadcast_puzzle_update(session_id, result)
-        print(f"✅ [API /reset] Puzzle state update broadcasted")
-        
-        # STEP 4: Get game completion state
-        print(f"🔍 [API /reset] Step 4: Getting game completion state...")
-        led_states = GameCompletionService.get_door_led_states(db, session_id)
-        print(f"✅ [API /reset] LED states: {led_states}")
-        
+        # STEP 3: Broadcast stato cucina + game_completion in un solo state_diff
+        print(f"🔍 [API /reset] Step 3: Broadcasting state_diff...")
         state = GameCompletionService.get_or_create_state(db, session_id)
-        print(f"✅ [API /reset] Completion state: game_won={state.game_won}, rooms={state.rooms_status}")
-        
-        # STEP 5: Broadcast game completion update
-        print(f"🔍 [API /reset] Step 5: Broadcasting game completion update...")
-        completion_data = {
-            "session_id": session_id,
-            "rooms_status": state.rooms_status,
-            "door_led_states": led_states,
-            "game_won": state.game_won,
-            "victory_time": state.victory_time.isoformat() if state.victory_time else None,
-            "completed_rooms_count": state.get_completed_rooms_count(),
-            "updated_at": state.updated_at.isoformat()
-        }
-        
-        await broadcast_game_completion_update(session_id, completion_data)
-        print(f"✅ [API /reset] Game completion update broadcasted")
+        await state_diff_broadcaster.publish(session_id, "cucina", result, completion=state)
+        print(f"✅ [API /reset] state_diff broadcasted (game_won={state.game_won})")
         print(f"🎉 [API /reset] COMPLETED SUCCESSFULLY\n")
         
         return result
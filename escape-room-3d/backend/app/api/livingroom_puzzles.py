@@ -13,6 +13,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import logging
 
+from app.core.fast_json import response_cache, row_version
 from app.database import get_db
 from app.services.livingroom_puzzle_service import LivingRoomPuzzleService
 from app.schemas.livingroom_puzzle import LivingRoomPuzzleStateResponse, ResetRequest
@@ -38,10 +39,14 @@ async def get_puzzle_state(
         - LED stati (pianta, condizionatore)
     
     Note: Porta LED is managed by game_completion system
+    ⚡ Body JSON in cache finché lo stato del soggiorno non cambia.
     """
     try:
         puzzle = LivingRoomPuzzleService.get_or_create(db, session_id)
-        response = LivingRoomPuzzleService._build_response(puzzle)
+        response = response_cache.response(
+            "livingroom/state", session_id, row_version(puzzle),
+            lambda: LivingRoomPuzzleService._build_response(puzzle)
+        )
         
         logger.info(f"[API] Living room puzzle state retrieved for session {session_id}")
         return response
@@ -138,38 +143,7 @@ async def complete_condizionatore_puzzle(
         logger.info(f"[API] ✅ Condizionatore puzzle completed for session {session_id}")
         logger.info(f"[API] 🏆 Soggiorno room completion triggered!")
         
-        # 📡 Broadcast game_completion update via WebSocket
-        try:
-            from app.websocket.handler import broadcast_to_session
-            from app.services.game_completion_service import GameCompletionService
-            
-            # Get updated game completion state
-            completion_state = GameCompletionService.get_or_create_state(db, session_id)
-            led_states = GameCompletionService.get_door_led_states(db, session_id)
-            
-            # Prepare broadcast data
-            broadcast_data = {
-                "session_id": session_id,
-                "rooms_status": completion_state.rooms_status,
-                "door_led_states": led_states,
-                "game_won": completion_state.game_won,
-                "victory_time": completion_state.victory_time.isoformat() if completion_state.victory_time else None,
-                "completed_rooms_count": sum(1 for room in completion_state.rooms_status.values() if room.get("completed", False)),
-                "updated_at": completion_state.updated_at.isoformat()
-            }
-            
-            # Broadcast to all clients in session
-            await broadcast_to_session(
-                session_id=session_id,
-                event="game_completion_update",
-                data=broadcast_data
-            )
-            logger.info(f"[API] 📡 Game completion broadcast sent for session {session_id}")
-            
-        except Exception as broadcast_error:
-            logger.error(f"[API] ❌ Error broadcasting game_completion: {broadcast_error}")
-            # Non bloccare la risposta se il broadcast fallisce
-        
+        # 📡 Il broadcast (stato stanza + game_completion in un solo state_diff) è fatto dal service
         return response
         
     except Exception as e:
@@ -197,10 +171,10 @@ async def get_door_servo_status(
     try:
         puzzle = LivingRoomPuzzleService.get_or_create(db, session_id)
         
-        return {
+        return response_cache.response("livingroom/door-servo-status", session_id, row_version(puzzle), lambda: {
             "should_close_servo": puzzle.door_servo_should_close,
             "condizionatore_status": puzzle.condizionatore_status
-        }
+        })
         
     except Exception as e:
         logger.error(f"[API] Error getting door servo status for session {session_id}: {e}")
@@ -227,10 +201,10 @@ async def get_fan_status(
     try:
         puzzle = LivingRoomPuzzleService.get_or_create(db, session_id)
         
-        return {
+        return response_cache.response("livingroom/fan-status", session_id, row_version(puzzle), lambda: {
             "should_run_fan": puzzle.fan_should_run,
             "condizionatore_status": puzzle.condizionatore_status
-        }
+        })
         
     except Exception as e:
         logger.error(f"[API] Error getting fan status for session {session_id}: {e}")
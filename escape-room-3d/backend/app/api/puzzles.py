@@ -18,6 +18,8 @@ from app.services.kitchen_puzzle_service import KitchenPuzzleService
 from app.services.livingroom_puzzle_service import LivingRoomPuzzleService
 from app.services.bathroom_puzzle_service import BathroomPuzzleService
 from app.services.bedroom_puzzle_service import BedroomPuzzleService
+from app.services.game_reset_service import GameResetService
+from app.services.puzzle_fsm import ROOM_FSMS
 
 router = APIRouter(prefix="/api/puzzles/session/{session_id}", tags=["global-puzzles"])
 logger = logging.getLogger(__name__)
@@ -112,82 +114,44 @@ async def reset_all_puzzles(
     """
     Reset ALL puzzles to initial state for a session.
     
-    This resets puzzle states for all 4 rooms:
+    This resets, in ONE transaction (tutto o niente):
     - Kitchen (cucina) - 3 puzzles
     - Living Room (soggiorno) - 3 puzzles
     - Bathroom (bagno) - 3 puzzles
     - Bedroom (camera) - 4 puzzles
+    - Esterno (gate) - 1 puzzle
+    - Game completion (LED porta, vittoria)
     
-    Total: 13 puzzles (including 1 Esterno puzzle not managed here)
+    I broadcast (state_diff + MQTT) partono in parallelo dopo il commit.
     
     Called by admin from Lobby when clicking "RESET ENIGMI".
     """
     try:
-        # 🔒 VALIDATE: Check if session exists
-        session = db.query(GameSession).filter(GameSession.id == session_id).first()
-        if not session:
-            logger.error(f"[GlobalPuzzles] ❌ Session {session_id} not found")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Session {session_id} not found"
-            )
-        
         logger.info(f"[GlobalPuzzles] 🔄 Resetting all puzzles for session {session_id}")
         
-        reset_count = 0
-        
-        # Reset Kitchen puzzles (3 puzzles: frigo, anta pentola, pentola)
-        try:
-            await KitchenPuzzleService.reset_all_puzzles(db, session_id)
-            reset_count += 3
-            logger.info(f"[GlobalPuzzles] ✅ Kitchen puzzles reset (3 puzzles)")
-        except Exception as e:
-            logger.error(f"[GlobalPuzzles] ❌ Kitchen reset error: {e}")
-        
-        # Reset Living Room puzzles (3 puzzles: TV, pianta, condizionatore)
-        try:
-            await LivingRoomPuzzleService.reset_puzzles(db, session_id, level="full")
-            reset_count += 3
-            logger.info(f"[GlobalPuzzles] ✅ Living Room puzzles reset (3 puzzles)")
-        except Exception as e:
-            logger.error(f"[GlobalPuzzles] ❌ Living Room reset error: {e}")
+        reset = GameResetService.reset_session(db, session_id)
+        await GameResetService.broadcast(reset)
         
-        # Reset Bathroom puzzles (3 puzzles: specchio, doccia, ventola)
-        try:
-            BathroomPuzzleService.reset_puzzles(db, session_id, level="full")
-            reset_count += 3
-            logger.info(f"[GlobalPuzzles] ✅ Bathroom puzzles reset (3 puzzles)")
-        except Exception as e:
-            logger.error(f"[GlobalPuzzles] ❌ Bathroom reset error: {e}")
-        
-        # Reset Bedroom puzzles (4 puzzles: comodino, materasso, poltrona, ventola)
-        try:
-            BedroomPuzzleService.reset_puzzles(db, session_id, level="full")
-            reset_count += 4
-            logger.info(f"[GlobalPuzzles] ✅ Bedroom puzzles reset (4 puzzles)")
-        except Exception as e:
-            logger.error(f"[GlobalPuzzles] ❌ Bedroom reset error: {e}")
-        
-        logger.info(f"[GlobalPuzzles] 🎉 Reset complete: {reset_count}/13 puzzles")
+        logger.info(f"[GlobalPuzzles] 🎉 Reset complete: {reset.puzzle_count} puzzles")
         
         return {
             "message": "All puzzles reset successfully",
             "session_id": session_id,
-            "reset_count": reset_count,
+            "reset_count": reset.puzzle_count,
             "rooms": {
-                "cucina": 3,
-                "soggiorno": 3,
-                "bagno": 3,
-                "camera": 4
-            },
-            "note": "Esterno puzzle (1) is managed separately"
+                room: len(fsm.spec.triggers) for room, fsm in ROOM_FSMS.items()
+            } | {"esterno": 1}
         }
     
-    except HTTPException:
-        raise
+    except ValueError as e:
+        logger.error(f"[GlobalPuzzles] ❌ {e}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"[GlobalPuzzles] ❌ Reset failed: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to reset puzzles: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -4,6 +4,9 @@ from typing import List, Optional
 from app.database import get_db
 from app.services.room_service import RoomService
 from app.schemas.room import RoomCreate, RoomUpdate, RoomResponse, SpawnDataUpdate, SpawnDataResponse
+from app.services import persistence
+from app.services.element_topic_index import element_topic_index
+from app.services.routing_sync import ELEMENTS, routing_sync
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
@@ -46,6 +49,9 @@ def delete_room(room_id: int, db: Session = Depends(get_db)):
     service = RoomService(db)
     if not service.delete(room_id):
         raise HTTPException(status_code=404, detail="Room not found")
+    # Elementi eliminati in cascata: via i loro topic dall'indice (e dalle route MQTT)
+    if element_topic_index.remove_room(room_id):
+        routing_sync.notify(db, ELEMENTS)
 
 
 # Mapping nomi italiani → inglesi (per compatibilità con frontend)
@@ -104,8 +110,7 @@ def update_room_spawn(room_name: str, spawn_data: SpawnDataUpdate, db: Session =
     
     # Update room with new spawn_data
     room.spawn_data = spawn_dict
-    db.commit()
-    db.refresh(room)
+    persistence.commit(db)
     
     return SpawnDataResponse(
         position=spawn_data.position,
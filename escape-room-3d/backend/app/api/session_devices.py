@@ -0,0 +1,54 @@
+"""Session Devices API - associazione device hardware → sessione (più case sullo stesso backend)"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models.game_session import GameSession
+from app.services.device_session_router import TOPIC_ROOTS, device_session_router
+
+router = APIRouter(prefix="/api/sessions/{session_id}/devices", tags=["session-devices"])
+
+
+class DeviceBindRequest(BaseModel):
+    topic_root: Optional[str] = None
+
+
+def _require_active_session(db: Session, session_id: int):
+    row = db.query(GameSession.end_time).filter(GameSession.id == session_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    if row[0] is not None:
+        raise HTTPException(status_code=410, detail=f"Session {session_id} is terminated")
+
+
+@router.get("")
+def list_session_devices(session_id: int):
+    """Device associati alla sessione (device_id → radice topic MQTT)"""
+    devices = device_session_router.devices(session_id)
+    return {
+        "session_id": session_id,
+        "devices": devices,
+        "topic_roots": device_session_router.topic_roots(session_id)
+    }
+
+
+@router.put("/{device_id}")
+def bind_device(session_id: int, device_id: str, body: DeviceBindRequest = DeviceBindRequest(), db: Session = Depends(get_db)):
+    """
+    Associa un device (X-Device-Id / `device_id` MQTT) alla sessione.
+
+    Un device già associato a un'altra sessione viene spostato su questa.
+    """
+    if body.topic_root is not None and body.topic_root not in TOPIC_ROOTS:
+        # Il backend è abbonato solo alle radici MQTT_TOPIC_ROOTS: il device resterebbe muto
+        raise HTTPException(status_code=400, detail=f"Unknown topic_root {body.topic_root!r} (allowed: {', '.join(TOPIC_ROOTS)})")
+    _require_active_session(db, session_id)
+    binding = device_session_router.bind(db, device_id, session_id, body.topic_root)
+    return {"device_id": binding.device_id, "session_id": binding.session_id, "topic_root": binding.topic_root}
+
+
+@router.delete("/{device_id}", status_code=204)
+def unbind_device(session_id: int, device_id: str, db: Session = Depends(get_db)):
+    if not device_session_router.unbind(db, device_id, session_id):
+        raise HTTPException(status_code=404, detail=f"Device {device_id} not bound to session {session_id}")
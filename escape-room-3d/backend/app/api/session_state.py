@@ -0,0 +1,46 @@
+"""Session State API - proiezione in memoria e replay dell'event log"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models.game_session import GameSession
+from app.services.session_state_store import session_state_store
+
+router = APIRouter(prefix="/api/sessions/{session_id}/state", tags=["session-state"])
+
+
+def _require_session(db: Session, session_id: int):
+    if session_state_store.seq(session_id) is not None:
+        return
+    if not db.query(GameSession.id).filter(GameSession.id == session_id).first():
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+
+
+@router.get("")
+def get_session_state(session_id: int, db: Session = Depends(get_db)):
+    """
+    Stato corrente della sessione (stanze, LED, attuatori, cancello, vittoria).
+
+    Letto dalla proiezione in memoria del processo, riallineata dal log se
+    game_sessions.state_seq indica eventi scritti da altri processi/repliche.
+    `seq` è il numero dell'ultimo evento applicato. Gli endpoint delle stanze
+    (/kitchen-puzzles, /bedroom-puzzles, ...) leggono ancora le loro tabelle.
+    """
+    _require_session(db, session_id)
+    return session_state_store.get(db, session_id)
+
+
+@router.get("/replay")
+def replay_session_state(
+    session_id: int,
+    until_seq: Optional[int] = Query(None, ge=1, description="Ferma il replay a questo evento"),
+    db: Session = Depends(get_db)
+):
+    """
+    Rigioca la sessione evento per evento (debug "il LED non è diventato verde").
+
+    Ogni step contiene l'evento e lo stato risultante dopo averlo applicato.
+    """
+    _require_session(db, session_id)
+    steps = session_state_store.replay(db, session_id, until_seq)
+    return {"session_id": session_id, "events": len(steps), "steps": steps}
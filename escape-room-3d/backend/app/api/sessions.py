@@ -70,12 +70,9 @@ def start_session(session_data: GameSessionCreate, db: Session = Depends(get_db)
     if existing:
         raise HTTPException(status_code=400, detail="An active session already exists for this room")
     
-    # Crea sessione e genera PIN
-    session = session_service.create(session_data)
+    # Crea sessione con PIN già assegnato (un solo INSERT)
     pin = session_service.generate_unique_pin()
-    session.pin = pin
-    db.commit()
-    db.refresh(session)
+    session = session_service.create(session_data, pin=pin)
     
     return session
 
@@ -86,10 +83,12 @@ def create_simple_session(body: SimpleSessionCreate = SimpleSessionCreate(), db:
     """Crea nuova sessione senza room check - per sistema PIN"""
     session_service = SessionService(db)
     
-    # 🆕 AUTO-TERMINA TUTTE le sessioni non terminate (waiting, countdown, playing)
+    # 🆕 AUTO-TERMINA le sessioni non terminate (waiting, countdown, playing) della stessa casa
     # Questo garantisce che solo l'ultimo PIN creato sia valido
-    # e che i giocatori con sessioni vecchie vengano espulsi
+    # e che i giocatori con sessioni vecchie vengano espulsi.
+    # Le partite delle altre case (room_id diverso) continuano.
     old_sessions = db.query(GameSession).filter(
+        GameSession.room_id == body.room_id,
         GameSession.end_time == None
     ).all()
     
@@ -98,13 +97,10 @@ def create_simple_session(body: SimpleSessionCreate = SimpleSessionCreate(), db:
     
     # Usa room_id dal body o 1 di default
     session_data = GameSessionCreate(room_id=body.room_id, expected_players=body.expected_players)
-    session = session_service.create(session_data)
     
-    # Genera PIN univoco
+    # Genera PIN univoco e crea la sessione con un solo INSERT
     pin = session_service.generate_unique_pin()
-    session.pin = pin
-    db.commit()
-    db.refresh(session)
+    session = session_service.create(session_data, pin=pin)
     
     return session
 
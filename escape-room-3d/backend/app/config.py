@@ -6,11 +6,91 @@ class Settings(BaseSettings):
     database_url: str = "postgresql://user:pass@db:5432/escape"
     mqtt_host: str = "mqtt"
     mqtt_port: int = 1883
+    # Radici dei topic MQTT sottoscritte (una per casa, separate da virgola): la prima è quella di default
+    mqtt_topic_roots: str = "escape"
+    # Traffico di device non associati a una sessione: va alla sessione attiva più recente
+    # senza device associati (False = scartato, nessun cross-talk tra case)
+    mqtt_unbound_fallback: bool = True
+
+    # Più repliche del backend: client id unico (vuoto = escape-backend-<host>-<pid>), protocollo 3.1.1 | 5.
+    # MQTT_REPLICA_COUNT/INDEX: ogni replica riceve tutto; elementi e cancello (DB) solo sui topic che
+    # possiede (consistent hashing, ordine per topic garantito), ultimi valori e bridge Socket.IO su tutti.
+    # Binding device ed elementi sono allineati tra repliche con LISTEN/NOTIFY (app/services/routing_sync.py).
+    # MQTT_SHARED_GROUP ($share) non è supportato: ogni replica vedrebbe solo una parte dei messaggi
+    mqtt_client_id: str = ""
+    mqtt_protocol: str = "3.1.1"
+    mqtt_shared_group: str = ""
+    mqtt_replica_count: int = 1
+    mqtt_replica_index: int = 0
+
+    # Ingest MQTT: worker paralleli (ordine garantito per topic), coda limitata e politica di overflow
+    mqtt_ingest_workers: int = 4
+    mqtt_ingest_queue_max: int = 2000
+    mqtt_ingest_overflow: str = "drop_oldest"   # block | drop_oldest | coalesce
+
+    # Codifica payload per prefisso di topic sotto la radice ("esterno/cancello=servo,esterno/ir-sensor=ir"),
+    # vuoto = tutto JSON. Codec: json, servo, ir, msgpack (pacchetto msgpack), cbor (pacchetto cbor2)
+    mqtt_codecs: str = ""
+
+    # Pubblicazioni MQTT: coda per topic (l'ultimo valore vince) inviata ogni N ms; un payload
+    # identico all'ultimo inviato viene ripubblicato solo dopo N secondi
+    mqtt_publish_flush_ms: int = 50
+    mqtt_publish_resend_seconds: int = 60
+
+    # Connessione al broker: backoff esponenziale con jitter tra i tentativi; messaggi non consegnati
+    # in un'outbox (memoria + file) rispedita in ordine alla riconnessione; topic di comando in QoS 1
+    mqtt_reconnect_min_seconds: float = 1.0
+    mqtt_reconnect_max_seconds: float = 60.0
+    mqtt_outbox_path: str = "archive/mqtt_outbox.jsonl"
+    mqtt_outbox_max: int = 1000
+    mqtt_command_prefixes: str = "game-completion/,esterno/"
+
+    # Ultimo valore di ogni topic MQTT: salvato su file ogni N secondi e ricaricato all'avvio
+    mqtt_snapshot_path: str = "archive/mqtt_last_values.json.gz"
+    mqtt_snapshot_interval_seconds: int = 10
+    # Pattern (sotto la radice) tenuti nella cache dell'ultimo valore: "#" = tutti i topic,
+    # es. "+/+/stato,+/+/posizione" per scartare heartbeat e debug prima della coda di ingest
+    mqtt_last_value_patterns: str = "#"
+
+    # Bridge MQTT → Socket.IO: messaggi dei pattern abbonati inviati a ogni socket ogni N ms (mqtt_batch)
+    mqtt_bridge_tick_ms: int = 50
+    mqtt_bridge_max_patterns: int = 32
     ws_port: int = 3000
     api_host: str = "0.0.0.0"
     jwt_secret: str = "your-secret-key-change-in-production"
     cors_origins: str = "http://localhost:5173,http://localhost:3000"
 
+    # I percorsi archive/... sono relativi a /app nel container: /app/archive è il volume
+    # backend_archive dei docker-compose (le righe archiviate sono già cancellate dal DB,
+    # outbox e snapshot MQTT devono sopravvivere al rebuild del container)
+    # Events table: partizioni mensili + retention
+    event_retention_months: int = 3
+    event_archive_dir: str = "archive/events"
+    event_maintenance_interval_seconds: int = 6 * 60 * 60
+
+    # Sessioni terminate: archiviate (tabella compatta + eventi .jsonl.gz) dopo N giorni
+    session_archive_after_days: int = 7
+    session_archive_dir: str = "archive/sessions"
+    session_archive_batch: int = 50
+
+    # Events: scrittura in batch dal path MQTT
+    event_batch_size: int = 200
+    event_flush_interval_ms: int = 250
+    event_queue_max: int = 5000
+
+    # Stato sessione event-sourced: snapshot della proiezione ogni N eventi
+    session_snapshot_every: int = 50
+
+    # Route di polling: body JSON codificati in cache per versione di stato
+    response_cache_max_entries: int = 512
+
+    # POST da ESP32: finestre di debounce (ms, 0 = disattivato) e TTL Idempotency-Key
+    debounce_trigger_ms: int = 2000
+    debounce_toggle_ms: int = 800
+    debounce_photocell_ms: int = 500
+    debounce_complete_ms: int = 3000
+    idempotency_key_ttl_seconds: int = 600
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
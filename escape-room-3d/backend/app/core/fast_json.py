@@ -0,0 +1,104 @@
+"""
+Fast JSON - percorso di serializzazione veloce per le route calde (polling ESP32, */state)
+
+Le route di polling vengono chiamate ogni 2 secondi da ogni ESP32 e lo stato
+cambia solo alla transizione di un puzzle. Invece di:
+
+    dict → modelli Pydantic → validazione response_model → jsonable_encoder → json.dumps
+
+le route costruiscono un dict già valido (gli stati sono validati dalla FSM
+in scrittura) e lo codificano direttamente in bytes con orjson. I bytes sono
+messi in cache per (route, sessione) insieme alla versione dello stato
+(updated_at della riga, version di game_completion): finché la versione non
+cambia la risposta non viene né ricostruita né ricodificata.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from fastapi import Response
+
+from app.config import get_settings
+
+try:
+    import orjson
+except ImportError:  # orjson non installato: stesso output con il json standard (più lento)
+    orjson = None
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializza direttamente in bytes (datetime → ISO 8601)"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def row_version(instance) -> Tuple[Any, Any]:
+    """Versione di una riga di stato: cambia a ogni UPDATE (le scritture FSM impostano updated_at)"""
+    return instance.id, instance.updated_at
+
+
+class EncodedResponseCache:
+    """
+    Cache LRU dei body JSON già codificati.
+
+    Chiave: (route, session_id) - Valore: (versione stato, bytes).
+    Le route sync girano nel threadpool di FastAPI: accesso protetto da lock.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], Tuple[Hashable, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, route: str, session_id: Optional[int], version: Hashable, build: Callable[[], Any]) -> bytes:
+        """Bytes della risposta: dalla cache se la versione coincide, altrimenti build() + dumps()"""
+        key = (route, session_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        body = dumps(build())
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def response(self, route: str, session_id: Optional[int], version: Hashable, build: Callable[[], Any]) -> Response:
+        """Response HTTP pronta: FastAPI la restituisce così com'è (nessuna validazione/encoding)"""
+        return Response(content=self.encode(route, session_id, version, build), media_type=JSON_MEDIA_TYPE)
+
+    def forget(self, session_id: int):
+        """Rimuove le risposte di una sessione terminata"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == session_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = EncodedResponseCache(max_entries=settings.response_cache_max_entries)
@@ -0,0 +1,181 @@
+"""
+Request Dedup - idempotency key + debounce per device sugli endpoint chiamati dagli ESP32
+
+Un reed switch che rimbalza o un retry dopo un timeout producono raffiche di
+POST identiche: ognuna costava query al DB e un broadcast Socket.IO completo.
+
+Il middleware (ASGI puro, prima del routing) riconosce i duplicati:
+- header `Idempotency-Key` → chiave (path, key) valida `idempotency_key_ttl_seconds`
+- altrimenti fingerprint (query, body) dell'ultima richiesta del device su
+  quel path, valido per la finestra di debounce della route (tabella
+  DEBOUNCE_ROUTES, finestre in config.py); il device è l'header `X-Device-Id`
+  o l'IP del client. Si confronta solo con la richiesta immediatamente
+  precedente: un payload diverso sostituisce il fingerprint, così
+  true → false → true sulla fotocellula esegue tutte e tre le chiamate
+
+Un duplicato riceve la risposta (2xx) della prima richiesta dalla cache, con
+header `Idempotency-Replayed: true`, senza toccare DB né WebSocket. Se la prima
+richiesta è ancora in corso il duplicato ne attende l'esito. Le risposte
+non-2xx non vengono memorizzate: il retry viene eseguito normalmente.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# path (regex) → finestra di debounce in ms
+DEBOUNCE_ROUTES: Tuple[Tuple[str, int], ...] = (
+    (r"/kitchen-puzzles/(fornelli|serra)/animation-trigger$", settings.debounce_trigger_ms),
+    (r"/kitchen-puzzles/anta/toggle$", settings.debounce_toggle_ms),
+    (r"/gate-puzzles/photocell/update$", settings.debounce_photocell_ms),
+    (r"-puzzles/(\w+/)?complete$", settings.debounce_complete_ms),
+)
+
+CapturedResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class _Entry:
+    __slots__ = ("expires_at", "fingerprint", "result")
+
+    def __init__(self, expires_at: float, fingerprint: Optional[Tuple] = None):
+        self.expires_at = expires_at
+        self.fingerprint = fingerprint
+        self.result: "asyncio.Future[Optional[CapturedResponse]]" = asyncio.get_running_loop().create_future()
+
+
+class RequestDeduplicationMiddleware:
+    """Risponde ai POST duplicati con la risposta già calcolata"""
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, app, routes: Tuple[Tuple[str, int], ...] = DEBOUNCE_ROUTES, idempotency_ttl_seconds: Optional[int] = None):
+        self.app = app
+        self.routes = [(re.compile(pattern), window_ms / 1000) for pattern, window_ms in routes if window_ms > 0]
+        self.idempotency_ttl = idempotency_ttl_seconds if idempotency_ttl_seconds is not None else settings.idempotency_key_ttl_seconds
+        self._entries: Dict[Tuple, _Entry] = {}
+        self._inserts = 0
+        self.replayed = 0
+
+    def _window(self, path: str) -> Optional[float]:
+        for pattern, window in self.routes:
+            if pattern.search(path):
+                return window
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+        window = self._window(scope["path"])
+        if idempotency_key is None and window is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = None
+        if idempotency_key is not None:
+            key = ("key", scope["path"], idempotency_key)
+            ttl = self.idempotency_ttl
+        else:
+            device = headers.get(b"x-device-id") or (scope.get("client") or ("?",))[0]
+            # Una sola entry per (device, path): l'ultima richiesta, col suo fingerprint
+            key = ("fp", device, scope["path"])
+            fingerprint = (scope.get("query_string", b""), hashlib.blake2b(body, digest_size=16).digest())
+            ttl = window
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now and entry.fingerprint == fingerprint:
+            captured = await asyncio.shield(entry.result)
+            if captured is not None:
+                self.replayed += 1
+                logger.info(f"🔁 [Dedup] Duplicate {scope['path']} answered from cache")
+                await self._replay(send, captured)
+                return
+            # La prima richiesta è fallita: questa viene eseguita normalmente
+            await self.app(scope, self._replay_body(body, receive), send)
+            return
+
+        # Payload diverso (o finestra scaduta): sostituisce la richiesta precedente del device
+        entry = _Entry(now + ttl, fingerprint)
+        self._entries[key] = entry
+        self._prune(now)
+        captured = None
+        try:
+            captured = await self._call_and_capture(scope, self._replay_body(body, receive), send)
+        finally:
+            entry.result.set_result(captured)
+            if captured is None and self._entries.get(key) is entry:
+                del self._entries[key]
+
+    async def _call_and_capture(self, scope, receive, send) -> Optional[CapturedResponse]:
+        status = 0
+        response_headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        if 200 <= status < 300:
+            return status, response_headers, b"".join(chunks)
+        return None
+
+    @staticmethod
+    async def _replay(send, captured: CapturedResponse):
+        status, headers, body = captured
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [(b"idempotency-replayed", b"true")]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay_body(body: bytes, receive):
+        """receive() che restituisce il body già letto, poi delega al server (http.disconnect)"""
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay
+
+    def _prune(self, now: float):
+        self._inserts += 1
+        if self._inserts % self.PRUNE_EVERY:
+            return
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now and entry.result.done()]:
+            del self._entries[key]
@@ -1,10 +1,12 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
+from typing import Any, Optional
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
+from app.core.request_dedup import RequestDeduplicationMiddleware
 from app.database import engine, Base, SessionLocal
 from app.api import rooms_router, sessions_router, elements_router, events_router, players_router, puzzles_router, spawn_router
 from app.api.puzzles import router as global_puzzles_router
@@ -14,14 +16,26 @@ from app.api.bathroom_puzzles import router as bathroom_puzzles_router
 from app.api.livingroom_puzzles import router as livingroom_puzzles_router
 from app.api.gate_puzzles import router as gate_puzzles_router
 from app.api.game_completion import router as game_completion_router
+from app.api.session_state import router as session_state_router
+from app.api.session_devices import router as session_devices_router
 from app.api.admin_auth import router as admin_auth_router
 from app.api.admin_protected import router as admin_protected_router
 from app.mqtt.handler import mqtt_handler
+from app.mqtt.router import mqtt_router, validate_pattern
+from app.mqtt.last_value import mqtt_last_values
+from app.mqtt.publisher import mqtt_publisher
 from app.websocket.handler import ws_handler, socket_app
+from app.websocket.mqtt_bridge import mqtt_bridge
 from app.services.element_service import ElementService
-from app.services.event_service import EventService
-from app.services.session_service import SessionService
+from app.services.gate_puzzle_service import GatePuzzleService
+from app.services.event_sink import event_sink
+from app.services.element_topic_index import element_topic_index
+from app.services.device_session_router import DEFAULT_TOPIC_ROOT, canonical_topic, device_session_router
+from app.services.session_state_store import session_state_store
+from app.services.routing_sync import routing_sync
 from app.services.seed_service import seed_database
+from app.services.event_partition_service import EventPartitionService
+from app.services.session_archive_service import SessionArchiveService
 from app.schemas.event import EventCreate
 
 logging.basicConfig(
@@ -33,50 +47,177 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+def apply_mqtt_update(element_id: int, data: dict):
+    """
+    Parte sincrona (DB) di un messaggio MQTT: merge dello stato dell'elemento
+    e risoluzione della sessione del device. Gira nel threadpool, così un
+    UPDATE lento non blocca il loop (e gli altri worker di ingest).
+    
+    La riga Element è il catalogo condiviso da tutte le case: current_state
+    segue solo la radice di default. I valori di escape2/... restano per
+    sessione (evento con session_id, cache ultimi valori per topic completo)
+    e non sovrascrivono quelli di un'altra casa.
+    
+    Returns:
+        (elemento ancora esistente, session_id o None)
+    """
+    db = SessionLocal()
+    try:
+        service = ElementService(db)
+        if data.get("topic_root", DEFAULT_TOPIC_ROOT) == DEFAULT_TOPIC_ROOT:
+            exists = service.merge_state(
+                element_id,
+                {"value": data.get("value"), "action": data.get("action")}
+            ) is not None
+        else:
+            exists = service.get_by_id(element_id) is not None
+        if not exists:
+            return False, None
+        # Sessione del device (binding esplicito, radice topic o fallback sessione attiva)
+        return True, device_session_router.resolve(db, data.get("device_id"), data.get("topic_root"))
+    finally:
+        db.close()
+
+
 async def handle_mqtt_message(data: dict):
     logger.info(f"Processing MQTT message: {data}")
     
-    db = SessionLocal()
+    topic = data.get("raw_topic", "")
+    indexed = element_topic_index.resolve(topic) or element_topic_index.resolve(canonical_topic(topic))
+    if not indexed:
+        # Topic senza elemento: scartato senza toccare il database
+        logger.debug(f"No element found for topic: {topic}")
+        return
+    
     try:
-        element_service = ElementService(db)
-        event_service = EventService(db)
-        session_service = SessionService(db)
+        exists, session_id = await asyncio.to_thread(apply_mqtt_update, indexed.id, data)
+        if not exists:
+            logger.warning(f"Element {indexed.id} for topic {topic} no longer exists")
+            return
         
-        topic = data.get("raw_topic", "")
-        element = element_service.get_by_mqtt_topic(topic)
+        event_data = EventCreate(
+            element_id=indexed.id,
+            session_id=session_id,
+            action=data.get("action", "update"),
+            value={"mqtt_value": data.get("value")}
+        )
+        await event_sink.enqueue(event_data)
         
-        if element:
-            new_state = {"value": data.get("value"), "action": data.get("action")}
-            element_service.update_state_by_topic(topic, new_state)
-            
-            active_session = session_service.get_active()
-            session_id = active_session.id if active_session else None
-            
-            event_data = EventCreate(
-                element_id=element.id,
-                session_id=session_id,
-                action=data.get("action", "update"),
-                value={"mqtt_value": data.get("value")}
-            )
-            event_service.create(event_data)
-            
+        if session_id is not None:
             await ws_handler.broadcast_element_update(
-                room=data.get("room", "unknown"),
+                room_name=data.get("room", "unknown"),
                 element=data.get("element", "unknown"),
                 action=data.get("action", "update"),
-                value=data.get("value")
+                value=data.get("value"),
+                session_id=session_id
             )
-            
-            logger.info(f"Updated element {element.name} from MQTT")
-        else:
-            logger.debug(f"No element found for topic: {topic}")
+        
+        logger.info(f"Updated element {indexed.name} from MQTT (session {session_id})")
             
     except Exception as e:
         logger.error(f"Error processing MQTT message: {e}")
+
+
+def sync_element_routes():
+    """Un pattern esatto per ogni topic del catalogo elementi: gli altri topic non arrivano a handle_mqtt_message"""
+    patterns = []
+    for topic in element_topic_index.topics():
+        try:
+            validate_pattern(topic)
+        except ValueError as e:
+            logger.warning(f"Element topic skipped by the MQTT router: {e}")
+            continue
+        patterns.append(canonical_topic(topic))
+    mqtt_router.replace("elements", patterns, handle_mqtt_message)
+
+
+# Ingresso della fotocellula: topic pubblicato SOLO dalla scheda. Su esterno/ir-sensor/stato
+# pubblica anche il backend (stato per la scena 3D): leggerlo qui riapplicherebbe le nostre
+# pubblicazioni, anche in ritardo o ripetute dall'outbox dopo una riconnessione
+GATE_PHOTOCELL_TOPIC = f"{DEFAULT_TOPIC_ROOT}/esterno/ir-sensor/lettura"
+
+
+def photocell_clear(value: Any) -> Optional[bool]:
+    """Payload della fotocellula → libera? ({"libero": ...}, "LIBERO"/"OCCUPATO", true/false, 1/0)"""
+    if isinstance(value, dict):
+        value = value.get("libero")
+    if isinstance(value, (bool, int)):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().upper()
+        if text in ("LIBERO", "TRUE", "1"):
+            return True
+        if text in ("OCCUPATO", "FALSE", "0"):
+            return False
+    return None
+
+
+def apply_gate_photocell(data: dict, is_clear: bool):
+    """Parte sincrona (DB) della fotocellula via MQTT: sessione del device + aggiornamento del cancello"""
+    db = SessionLocal()
+    try:
+        session_id = device_session_router.resolve(db, data.get("device_id"), data.get("topic_root"))
+        if session_id is None:
+            return None
+        return GatePuzzleService.apply_mqtt_photocell(db, session_id, is_clear)
     finally:
         db.close()
 
 
+async def handle_gate_photocell(data: dict):
+    is_clear = photocell_clear(data.get("value"))
+    if is_clear is None:
+        logger.warning(f"Unrecognised photocell payload on {data.get('raw_topic')}: {data.get('value')!r}")
+        return
+    puzzle = await asyncio.to_thread(apply_gate_photocell, data, is_clear)
+    if puzzle is not None:
+        logger.info(f"🚪 Photocell {'clear' if is_clear else 'blocked'} from MQTT (session {puzzle.session_id})")
+        await GatePuzzleService.publish_state(puzzle)
+
+
+def run_event_maintenance():
+    db = SessionLocal()
+    try:
+        return EventPartitionService.run_maintenance(
+            db,
+            retention_months=settings.event_retention_months,
+            archive_dir=settings.event_archive_dir
+        )
+    finally:
+        db.close()
+
+
+def run_session_archival():
+    db = SessionLocal()
+    try:
+        return SessionArchiveService.archive_ended_sessions(
+            db,
+            older_than_days=settings.session_archive_after_days,
+            archive_dir=settings.session_archive_dir,
+            limit=settings.session_archive_batch
+        )
+    finally:
+        db.close()
+
+
+async def event_maintenance_loop():
+    """Crea le partizioni future, archivia quelle scadute e le sessioni terminate, a intervalli regolari"""
+    while True:
+        try:
+            archived = await asyncio.to_thread(run_event_maintenance)
+            if archived:
+                logger.info(f"Event retention: archived {len(archived)} partitions")
+        except Exception as e:
+            logger.error(f"Event maintenance error: {e}")
+        try:
+            sessions = await asyncio.to_thread(run_session_archival)
+            if sessions:
+                logger.info(f"Session archival: archived {len(sessions)} ended sessions")
+        except Exception as e:
+            logger.error(f"Session archival error: {e}")
+        await asyncio.sleep(settings.event_maintenance_interval_seconds)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Escape House Backend...")
@@ -87,23 +228,70 @@ async def lifespan(app: FastAPI):
     db = SessionLocal()
     try:
         seed_database(db)
+        element_topic_index.rebuild(db)
+        device_session_router.rebuild(db)
+        session_state_store.recover(db)
     finally:
         db.close()
     logger.info("Database seeding complete")
     
-    mqtt_handler.set_message_callback(handle_mqtt_message)
+    # Partizioni events del mese corrente/successivo prima di accettare messaggi MQTT
+    db = SessionLocal()
+    try:
+        EventPartitionService.ensure_partitions(db)
+    finally:
+        db.close()
+    maintenance_task = asyncio.create_task(event_maintenance_loop())
+    logger.info("Event partition maintenance started")
+    
+    await event_sink.start()
+    # Binding device/elementi modificati da altre repliche → ricarica degli indici (LISTEN/NOTIFY)
+    await routing_sync.start()
+    
+    # Route per pattern (radice di default, confronto sul topic canonico):
+    # - elements: un pattern esatto per topic del catalogo, riallineato a ogni modifica di /elements
+    # - gate_photocell: lettura della fotocellula dalla scheda (esterno/ir-sensor/lettura) → GatePuzzleService
+    # - last_value: MQTT_LAST_VALUE_PATTERNS (default tutto: è la cache di ogni topic)
+    # - socket_bridge: solo i pattern abbonati dai client Socket.IO, aggiunti/rimossi dal bridge
+    # Un topic che non corrisponde a nessuna route viene scartato prima della coda di ingest
+    loop = asyncio.get_running_loop()
+    element_topic_index.add_listener(lambda: loop.call_soon_threadsafe(sync_element_routes))
+    sync_element_routes()
+    mqtt_router.add(GATE_PHOTOCELL_TOPIC, handle_gate_photocell, name="gate_photocell")
+    # Ultimo valore di ogni topic: ripristinato dal file prima di ricevere messaggi
+    await asyncio.to_thread(mqtt_last_values.load, settings.mqtt_snapshot_path)
+    for pattern in filter(None, (p.strip() for p in settings.mqtt_last_value_patterns.split(","))):
+        mqtt_router.add(f"{DEFAULT_TOPIC_ROOT}/{pattern}", mqtt_last_values.handle_message, name="last_value")
+    snapshot_task = asyncio.create_task(
+        mqtt_last_values.persist_loop(settings.mqtt_snapshot_path, settings.mqtt_snapshot_interval_seconds)
+    )
+    # Bridge verso Socket.IO: solo i topic abbonati dai client, in batch per socket
+    await mqtt_bridge.start()
+    # Pubblicazioni in uscita: coda per topic (coalescenza + soppressione duplicati)
+    await mqtt_publisher.start(mqtt_handler.send)
+    # Alla (ri)connessione l'outbox dei messaggi non consegnati viene rispedita in ordine
+    mqtt_handler.add_connect_listener(mqtt_publisher.replay)
     mqtt_task = asyncio.create_task(mqtt_handler.connect())
     logger.info("MQTT handler started")
     
     yield
     
     logger.info("Shutting down...")
+    await mqtt_publisher.stop()
     await mqtt_handler.disconnect()
-    mqtt_task.cancel()
+    await mqtt_bridge.stop()
+    await routing_sync.stop()
+    for task in (mqtt_task, maintenance_task, snapshot_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
     try:
-        await mqtt_task
-    except asyncio.CancelledError:
-        pass
+        await mqtt_last_values.save(settings.mqtt_snapshot_path)
+    except Exception as e:
+        logger.error(f"MQTT snapshot save on shutdown failed: {e}")
+    await event_sink.stop()
     logger.info("Shutdown complete")
 
 
@@ -123,6 +311,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# POST duplicati degli ESP32 (rimbalzi, retry) risposti dalla cache senza DB/broadcast
+app.add_middleware(RequestDeduplicationMiddleware)
 
 app.include_router(admin_auth_router)  # Admin authentication (must be first)
 app.include_router(admin_protected_router)  # Admin protected endpoints
@@ -139,6 +329,8 @@ app.include_router(bathroom_puzzles_router)
 app.include_router(livingroom_puzzles_router)
 app.include_router(gate_puzzles_router)
 app.include_router(game_completion_router)
+app.include_router(session_state_router)
+app.include_router(session_devices_router)
 app.include_router(spawn_router)
 
 
@@ -162,13 +354,41 @@ def health_check():
     }
 
 
+@app.get("/mqtt/metrics")
+def mqtt_metrics():
+    """Coda di ingest MQTT: profondità per shard, scarti, coalescenze, attesa in coda; route registrate"""
+    return {
+        "connected": mqtt_handler.connected,
+        "connection": mqtt_handler.connection_metrics(),
+        "ingest": mqtt_handler.ingest.metrics(),
+        "routes": mqtt_router.describe(),
+        "router": mqtt_router.stats,
+        "last_values": mqtt_last_values.metrics(),
+        "codecs": mqtt_handler.codecs.describe(),
+        "publisher": mqtt_publisher.metrics(),
+        "bridge": mqtt_bridge.metrics()
+    }
+
+
+@app.get("/mqtt/snapshot")
+def mqtt_snapshot(session_id: int):
+    """
+    Ultimo valore di ogni topic MQTT di una sessione (quadro dei device in una risposta).
+    
+    session_id obbligatorio: solo le radici topic dei device della sessione,
+    mai i topic delle altre case.
+    """
+    return {"topics": mqtt_last_values.snapshot(device_session_router.topic_roots(session_id))}
+
+
 app.mount("/socket.io", socket_app)
 
 
 @app.post("/mqtt/publish")
 async def publish_mqtt(topic: str, payload: str):
-    success = await mqtt_handler.publish(topic, payload)
-    return {"success": success, "topic": topic}
+    # Tramite il publisher: con il broker giù il messaggio resta nell'outbox e parte alla riconnessione
+    queued = await mqtt_publisher.publish(topic, payload, force=True)
+    return {"success": queued, "topic": topic}
 
 
 if __name__ == "__main__":
@@ -10,5 +10,9 @@ from app.models.bathroom_puzzle import BathroomPuzzleState
 from app.models.livingroom_puzzle import LivingRoomPuzzleState
 from app.models.gate_puzzle import GatePuzzle
 from app.models.game_completion import GameCompletionState
+from app.models.session_state import SessionStateEvent, SessionStateSnapshot
+from app.models.device_session_binding import DeviceSessionBinding
+from app.models.archived_session import ArchivedSession
+from app.models.analytics import AnalyticsAggregate
 
-__all__ = ["Room", "GameSession", "Element", "ElementType", "Event", "Player", "Puzzle", "KitchenPuzzleState", "BedroomPuzzleState", "BathroomPuzzleState", "LivingRoomPuzzleState", "GatePuzzle", "GameCompletionState"]
+__all__ = ["Room", "GameSession", "Element", "ElementType", "Event", "Player", "Puzzle", "KitchenPuzzleState", "BedroomPuzzleState", "BathroomPuzzleState", "LivingRoomPuzzleState", "GatePuzzle", "GameCompletionState", "SessionStateEvent", "SessionStateSnapshot", "DeviceSessionBinding", "ArchivedSession", "AnalyticsAggregate"]
@@ -0,0 +1,35 @@
+"""Analytics Models - aggregati incrementali dei tempi di gioco (per giorno e per settimana)"""
+from sqlalchemy import Column, Date, DateTime, Float, Index, Integer, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AnalyticsAggregate(Base):
+    """
+    Un contatore per (metrica, soggetto, periodo).
+
+    metric: puzzle_solve | room_completion | victory
+    subject: "cucina/fornelli" per gli enigmi, "cucina" per le stanze, "game" per la vittoria
+    period: day | week (period_start = giorno / lunedì della settimana, UTC)
+
+    `sketch` è un istogramma a bucket logaritmici {indice: conteggio} da cui
+    si ricavano i percentili con errore relativo costante (vedi game_analytics_service).
+    """
+    __tablename__ = "analytics_aggregates"
+    __table_args__ = (
+        UniqueConstraint("metric", "subject", "period", "period_start", name="uq_analytics_aggregates_key"),
+        Index("ix_analytics_aggregates_period", "period", "period_start"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    metric = Column(String(30), nullable=False)
+    subject = Column(String(60), nullable=False)
+    period = Column(String(10), nullable=False)
+    period_start = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(Float, nullable=False, default=0)
+    min_seconds = Column(Float, nullable=True)
+    max_seconds = Column(Float, nullable=True)
+    sketch = Column(JSONB, nullable=False, default={})
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
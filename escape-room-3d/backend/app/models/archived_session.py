@@ -0,0 +1,48 @@
+"""Archived Session Model - sessioni terminate spostate fuori dalle tabelle calde"""
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class ArchivedSession(Base):
+    """
+    Una riga compatta per sessione archiviata (id originale della sessione).
+
+    `document` contiene tutto ciò che stava nelle tabelle calde (giocatori,
+    enigmi, stato delle stanze, esterno, completamento, event log di stato);
+    gli eventi MQTT della sessione sono in `events_archive` (.jsonl.gz).
+    """
+    __tablename__ = "archived_sessions"
+    __table_args__ = (
+        Index("ix_archived_sessions_end_time", "end_time"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    room_id = Column(Integer, nullable=False)
+    pin = Column(String(4), nullable=True)
+    status = Column(String, nullable=True)
+    start_time = Column(DateTime(timezone=True), nullable=True)
+    end_time = Column(DateTime(timezone=True), nullable=True)
+    expected_players = Column(Integer, nullable=True)
+    players_count = Column(Integer, nullable=False, default=0)
+    game_won = Column(Boolean, nullable=False, default=False)
+    document = Column(JSONB, nullable=False)
+    events_archive = Column(String, nullable=True)
+    events_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "room_id": self.room_id,
+            "pin": self.pin,
+            "status": self.status,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "expected_players": self.expected_players,
+            "players_count": self.players_count,
+            "game_won": self.game_won,
+            "events_count": self.events_count,
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None
+        }
@@ -32,6 +32,7 @@ class BathroomPuzzleState(Base):
     - fan_should_run: Ventola fisica si attiva quando ventola = done
     """
     __tablename__ = "bathroom_puzzle_states"
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
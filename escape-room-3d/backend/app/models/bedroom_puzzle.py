@@ -20,6 +20,7 @@ class BedroomPuzzleState(Base):
     }
     """
     __tablename__ = "bedroom_puzzle_states"
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
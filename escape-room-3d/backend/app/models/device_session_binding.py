@@ -0,0 +1,24 @@
+"""Device Session Binding - associazione esplicita device (ESP32) → sessione di gioco"""
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class DeviceSessionBinding(Base):
+    """
+    Ogni device hardware appartiene al più a una sessione.
+
+    `device_id` è l'header X-Device-Id delle chiamate HTTP o il campo
+    `device_id` dei payload MQTT; `topic_root` è la radice dei topic MQTT
+    della casa del device (es. "escape", "escape2").
+    """
+    __tablename__ = "device_session_bindings"
+    __table_args__ = (
+        Index("ix_device_session_bindings_session", "session_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(100), unique=True, nullable=False)
+    session_id = Column(Integer, ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False)
+    topic_root = Column(String(50), nullable=False, default="escape")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, Enum, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -32,7 +33,7 @@ class Element(Base):
     name = Column(String(100), nullable=False)
     type = Column(Enum(ElementType), nullable=False)
     mqtt_topic = Column(String(255), nullable=True)
-    current_state = Column(JSON, default={})
+    current_state = Column(JSONB, default={})
     default_state = Column(JSON, default={})
 
     room = relationship("Room", back_populates="elements")
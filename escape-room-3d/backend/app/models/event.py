@@ -1,16 +1,31 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
 
 class Event(Base):
+    """
+    Log eventi MQTT/elementi.
+
+    La tabella è partizionata per mese su `timestamp` (RANGE): le partizioni
+    `events_YYYY_MM` vengono create e archiviate da EventPartitionService.
+    Per questo la primary key include anche `timestamp` (vincolo PostgreSQL
+    sulle tabelle partizionate) e ogni query dovrebbe filtrare per tempo
+    per sfruttare il partition pruning.
+    """
     __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_session_id_timestamp", "session_id", "timestamp"),
+        Index("ix_events_element_id_timestamp", "element_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+    __mapper_args__ = {"eager_defaults": True}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     element_id = Column(Integer, ForeignKey("elements.id"), nullable=False)
     session_id = Column(Integer, ForeignKey("game_sessions.id"), nullable=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
     action = Column(String(100), nullable=False)
     value = Column(JSON, default={})
 
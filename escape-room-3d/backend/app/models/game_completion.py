@@ -5,6 +5,10 @@ from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
 
+# Bit di ogni stanza in completed_mask
+ROOM_BITS = {"cucina": 1, "camera": 2, "bagno": 4, "soggiorno": 8}
+ALL_ROOMS_MASK = 0b1111
+
 
 class GameCompletionState(Base):
     """
@@ -27,6 +31,14 @@ class GameCompletionState(Base):
     # }
     rooms_status = Column(JSONB, nullable=False)
     
+    # Bitmask delle stanze completate (ROOM_BITS), aggiornata nella stessa
+    # transazione dell'ultima transizione FSM della stanza: è la fonte di verità
+    # per LED porta e vittoria. rooms_status resta per i timestamp e le API esistenti.
+    completed_mask = Column(Integer, default=0, server_default="0", nullable=False)
+    
+    # Incrementata a ogni cambio di completamento (ordinamento degli update lato client)
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+    
     # Game won flag (all 4 rooms completed)
     game_won = Column(Boolean, default=False, nullable=False)
     
@@ -51,16 +63,26 @@ class GameCompletionState(Base):
             "soggiorno": {"completed": False}
         }
     
+    def is_room_completed(self, room_name: str) -> bool:
+        return bool((self.completed_mask or 0) & ROOM_BITS.get(room_name, 0))
+    
     def is_game_complete(self) -> bool:
         """Check if all 4 rooms are completed"""
-        return all(
-            room_status.get("completed", False)
-            for room_status in self.rooms_status.values()
-        )
+        return self.completed_mask == ALL_ROOMS_MASK
     
     def get_completed_rooms_count(self) -> int:
         """Count how many rooms are completed"""
-        return sum(
-            1 for room_status in self.rooms_status.values()
-            if room_status.get("completed", False)
-        )
+        return bin(self.completed_mask or 0).count("1")
+    
+    def door_led_states(self) -> dict:
+        """
+        LED porta derivati dalla bitmask (nessuna query):
+        vittoria → tutte "green", stanza completata → "blinking", altrimenti "red"
+        """
+        if self.game_won:
+            return {room_name: "green" for room_name in ROOM_BITS}
+        mask = self.completed_mask or 0
+        return {
+            room_name: "blinking" if mask & bit else "red"
+            for room_name, bit in ROOM_BITS.items()
+        }
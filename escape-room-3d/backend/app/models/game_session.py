@@ -6,6 +6,7 @@ from app.database import Base
 
 class GameSession(Base):
     __tablename__ = "game_sessions"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
@@ -15,6 +16,7 @@ class GameSession(Base):
     expected_players = Column(Integer, default=1)
     connected_players = Column(Integer, default=0)
     status = Column(String, default="waiting")  # waiting, countdown, playing, completed
+    state_seq = Column(Integer, default=0, server_default="0", nullable=False)  # ultimo seq di session_state_events (contatore)
 
     room = relationship("Room", back_populates="game_sessions")
     events = relationship("Event", back_populates="session", cascade="all, delete-orphan")
@@ -14,6 +14,7 @@ class GatePuzzle(Base):
     Quando photocell_clear=True, l'enigma è risolto.
     """
     __tablename__ = "gate_puzzles"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("game_sessions.id"), nullable=False, unique=True)
@@ -6,6 +6,7 @@ from app.database import Base
 
 class Player(Base):
     __tablename__ = "players"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("game_sessions.id"), nullable=False)
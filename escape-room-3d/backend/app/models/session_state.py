@@ -0,0 +1,47 @@
+"""Session State Models - Event log append-only + snapshot della proiezione di gioco"""
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class SessionStateEvent(Base):
+    """
+    Log append-only dei cambi di stato di una sessione (transizioni puzzle,
+    reset, completamento stanze, fotocellula).
+
+    `seq` è monotono per sessione: rileggendo gli eventi in ordine di seq
+    si ricostruisce esattamente lo stato della partita (vedi SessionStateStore.replay).
+    Il seq viene da game_sessions.state_seq (UPDATE ... RETURNING): unico anche
+    con più processi/repliche del backend.
+    """
+    __tablename__ = "session_state_events"
+    __table_args__ = (
+        UniqueConstraint("session_id", "seq", name="uq_session_state_events_session_seq"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    kind = Column(String(50), nullable=False)       # puzzle_transition, puzzle_reset, room_completion, photocell, ...
+    room = Column(String(50), nullable=True)        # cucina, camera, bagno, soggiorno, esterno
+    payload = Column(JSONB, nullable=False, default={})
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class SessionStateSnapshot(Base):
+    """
+    Snapshot periodico della proiezione in memoria (stato dopo l'evento `seq`).
+
+    Al riavvio si parte dall'ultimo snapshot e si applicano solo gli eventi successivi.
+    """
+    __tablename__ = "session_state_snapshots"
+    __table_args__ = (
+        Index("ix_session_state_snapshots_session_seq", "session_id", "seq"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    state = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,214 @@
+"""
+MQTT Codecs - codifica dei payload per prefisso di topic (JSON di default, binario opzionale)
+
+Registro prefisso → codec usato sia in pubblicazione (MQTTClient, MQTTHandler)
+sia in ricezione (MQTTHandler._handle_message). Il prefisso è il percorso
+sotto la radice della casa ("esterno/cancello1/posizione" vale per escape/ e
+escape2/), vince il prefisso più lungo.
+
+Codec disponibili (MQTT_CODECS="prefisso=codec,..."):
+- json:    default e fallback, stesso comportamento di prima (testo non JSON → stringa)
+- msgpack: MessagePack (richiede il pacchetto `msgpack`)
+- cbor:    CBOR (richiede il pacchetto `cbor2`)
+- servo:   byte 0xB1 + struct "<BB" {position, target} in gradi 0-180 (3 byte invece di ~30)
+- ir:      byte 0xB2 + struct "<?B" {libero, raw_value}
+
+Le schede usano il formato binario solo sui prefissi configurati qui e nel
+firmware: se un payload non si decodifica col codec del topic si ritenta
+in JSON, così una scheda non ancora aggiornata continua a funzionare.
+Il byte iniziale (mai valido all'inizio di un testo UTF-8) e la validazione
+dei campi evitano che un JSON corto della lunghezza giusta ("90") venga
+letto come binario.
+"""
+import json
+import logging
+import struct
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config import get_settings
+from app.core.fast_json import dumps as json_dumps
+
+try:
+    import msgpack
+except ImportError:  # codec msgpack non disponibile
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # codec cbor non disponibile
+    cbor2 = None
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class Codec(ABC):
+    name = "codec"
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, payload: bytes) -> Any:
+        """Valore decodificato; un'eccezione fa ritentare il registro in JSON"""
+
+
+class JsonCodec(Codec):
+    """JSON; le stringhe passano così come sono ("true", "false", testo libero)"""
+
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode("utf-8")
+        return json_dumps(value)
+
+    def decode(self, payload: bytes) -> Any:
+        text = payload.decode("utf-8")
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return text
+
+
+class MsgPackCodec(Codec):
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload, raw=False)
+
+
+class CborCodec(Codec):
+    name = "cbor"
+
+    def encode(self, value: Any) -> bytes:
+        return cbor2.dumps(value)
+
+    def decode(self, payload: bytes) -> Any:
+        return cbor2.loads(payload)
+
+
+class StructCodec(Codec):
+    """
+    Layout fisso: dict {campo: valore} ↔ magic + struct.pack(fmt, ...) nell'ordine dei campi
+
+    decode rifiuta (ValueError) un payload senza il byte magic, di lunghezza
+    diversa o con valori fuori dominio (`validate`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        magic: int,
+        fmt: str,
+        fields: Sequence[str],
+        validate: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ):
+        self.name = name
+        self.magic = bytes([magic])
+        self._struct = struct.Struct(fmt)
+        self.fields = tuple(fields)
+        self.validate = validate
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, (bytes, str)):
+            raise TypeError(f"{self.name} codec expects a dict with {self.fields}")
+        return self.magic + self._struct.pack(*(value[field] for field in self.fields))
+
+    def decode(self, payload: bytes) -> Any:
+        if len(payload) != 1 + self._struct.size or payload[:1] != self.magic:
+            raise ValueError(f"Not a {self.name} payload")
+        value = dict(zip(self.fields, self._struct.unpack(payload[1:])))
+        if self.validate is not None and not self.validate(value):
+            raise ValueError(f"Invalid {self.name} payload: {value}")
+        return value
+
+
+def _servo_angles(value: Dict[str, Any]) -> bool:
+    return value["position"] <= 180 and value["target"] <= 180
+
+
+JSON = JsonCodec()
+
+CODECS: Dict[str, Codec] = {
+    "json": JSON,
+    "servo": StructCodec("servo", 0xB1, "<BB", ("position", "target"), validate=_servo_angles),
+    "ir": StructCodec("ir", 0xB2, "<?B", ("libero", "raw_value")),
+}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgPackCodec()
+if cbor2 is not None:
+    CODECS["cbor"] = CborCodec()
+
+
+def topic_path(topic: str) -> str:
+    """Percorso sotto la radice della casa: "escape2/esterno/porta/posizione" → "esterno/porta/posizione\""""
+    return topic.partition("/")[2]
+
+
+class CodecRegistry:
+    """Prefisso di topic → codec (prefisso più lungo), JSON per tutto il resto"""
+
+    def __init__(self, default: Codec = JSON):
+        self.default = default
+        self._prefixes: List[Tuple[str, Codec]] = []
+        self._cache: Dict[str, Codec] = {}
+        self.stats = {"encoded": 0, "decoded": 0, "fallbacks": 0}
+
+    def register(self, prefix: str, codec: Codec):
+        self._prefixes = [entry for entry in self._prefixes if entry[0] != prefix]
+        self._prefixes.append((prefix, codec))
+        self._prefixes.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self._cache.clear()
+        logger.info(f"📦 [MQTTCodecs] {prefix}* → {codec.name}")
+
+    def configure(self, spec: str):
+        """Legge "esterno/cancello=servo,cucina/=msgpack" (codec sconosciuto → errore all'avvio)"""
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            prefix, sep, name = entry.partition("=")
+            codec = CODECS.get(name.strip())
+            if not sep or codec is None:
+                raise ValueError(f"Invalid MQTT codec entry '{entry}' (available codecs: {sorted(CODECS)})")
+            self.register(prefix.strip(), codec)
+
+    def codec_for(self, topic: str) -> Codec:
+        codec = self._cache.get(topic)
+        if codec is None:
+            path = topic_path(topic)
+            codec = next((c for prefix, c in self._prefixes if path.startswith(prefix)), self.default)
+            self._cache[topic] = codec
+        return codec
+
+    def encode(self, topic: str, value: Any) -> bytes:
+        self.stats["encoded"] += 1
+        return self.codec_for(topic).encode(value)
+
+    def decode(self, topic: str, payload: bytes) -> Any:
+        self.stats["decoded"] += 1
+        codec = self.codec_for(topic)
+        if codec is self.default:
+            return codec.decode(payload)
+        try:
+            return codec.decode(payload)
+        except Exception:
+            # Scheda con firmware ancora in JSON (o payload di debug da mosquitto_pub)
+            self.stats["fallbacks"] += 1
+            return self.default.decode(payload)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "prefixes": {prefix: codec.name for prefix, codec in self._prefixes},
+            "available": sorted(CODECS),
+            **self.stats
+        }
+
+
+mqtt_codecs = CodecRegistry()
+mqtt_codecs.configure(settings.mqtt_codecs)
@@ -1,77 +1,204 @@
 import asyncio
-import json
 import logging
-from typing import Callable, Optional, Dict, Any
-from aiomqtt import Client, MqttError
+import os
+import random
+import socket
+import time
+from typing import Awaitable, Callable, List, Optional, Dict, Any, Set
+from aiomqtt import Client, MqttError, ProtocolVersion
 from app.config import get_settings
+from app.services.device_session_router import TOPIC_ROOTS, canonical_topic
+from app.mqtt.ingest import MQTTIngestQueue
+from app.mqtt.router import TopicRouter, mqtt_router
+from app.mqtt.codecs import CodecRegistry, mqtt_codecs
+from app.mqtt.hashring import ConsistentHashRing
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+PROTOCOLS = {"3.1.1": ProtocolVersion.V311, "5": ProtocolVersion.V5}
+
+
+def client_identifier() -> str:
+    """Client id unico per replica (host + pid): due backend non si buttano fuori a vicenda dal broker"""
+    return settings.mqtt_client_id or f"escape-backend-{socket.gethostname()}-{os.getpid()}"
+
+
+def subscription_filters() -> List[str]:
+    """Una radice per casa (escape/#, escape2/#, ...): ogni replica riceve tutto il traffico"""
+    return [f"{root}/#" for root in TOPIC_ROOTS]
+
+
+# Route il cui stato è per processo (cache ultimi valori, bridge verso i socket
+# connessi a QUESTA replica): ricevono ogni topic su ogni replica. Gli altri
+# handler (elementi, cancello → DB) girano solo sulla replica proprietaria del topic.
+REPLICA_WIDE_ROUTES = ("last_value", "socket_bridge:")
+
+
+def replica_wide(route_name: str) -> bool:
+    return route_name.startswith(REPLICA_WIDE_ROUTES)
+
 
 class MQTTHandler:
-    def __init__(self):
+    def __init__(self, router: TopicRouter = mqtt_router, codecs: CodecRegistry = mqtt_codecs):
         self.client: Optional[Client] = None
         self.connected = False
-        self.message_callback: Optional[Callable] = None
-        self._reconnect_interval = 5
+        # Pattern → handler: i topic senza handler non vengono né accodati né decodificati
+        self.router = router
+        # Codec per prefisso di topic (JSON di default) in ricezione e pubblicazione
+        self.codecs = codecs
         self._running = False
+        if settings.mqtt_protocol not in PROTOCOLS:
+            raise ValueError(f"Invalid MQTT_PROTOCOL '{settings.mqtt_protocol}' (available: {sorted(PROTOCOLS)})")
+        if not 0 <= settings.mqtt_replica_index < max(settings.mqtt_replica_count, 1):
+            raise ValueError(f"MQTT_REPLICA_INDEX must be in [0, {settings.mqtt_replica_count})")
+        if settings.mqtt_shared_group:
+            # Con $share ogni replica vedrebbe solo la sua parte dei messaggi: ultimi valori
+            # e bridge Socket.IO (stato per processo) resterebbero incompleti
+            raise ValueError("MQTT_SHARED_GROUP is not supported: use MQTT_REPLICA_COUNT/MQTT_REPLICA_INDEX")
+        self.identifier = client_identifier()
+        self.filters = subscription_filters()
+        # Repliche: ogni topic ha un solo proprietario (consistent hashing) per gli handler di dominio
+        self.replica_index = settings.mqtt_replica_index
+        self.replica_ring: Optional[ConsistentHashRing[int]] = None
+        if settings.mqtt_replica_count > 1:
+            self.replica_ring = ConsistentHashRing(range(settings.mqtt_replica_count))
+        self._connect_listeners: List[Callable[[], Awaitable[None]]] = []
+        self._listener_tasks: Set[asyncio.Task] = set()
+        self._disconnected_at: Optional[float] = None
+        self.connection_stats: Dict[str, Any] = {
+            "connects": 0,
+            "disconnects": 0,
+            "attempts": 0,
+            "next_retry_seconds": None,
+            "last_connected_at": None,
+            "last_error": None,
+            "downtime_seconds": 0.0
+        }
+        # Lettura dal broker disaccoppiata dall'elaborazione (ordine per topic, overflow configurabile)
+        self.ingest = MQTTIngestQueue(
+            workers=settings.mqtt_ingest_workers,
+            max_queue=settings.mqtt_ingest_queue_max,
+            overflow=settings.mqtt_ingest_overflow
+        )
+
+    def reconnect_delay(self, attempt: int) -> float:
+        """Backoff esponenziale con jitter: metà fissa + metà casuale di min(max, min·2^n)"""
+        ceiling = min(settings.mqtt_reconnect_max_seconds, settings.mqtt_reconnect_min_seconds * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def add_connect_listener(self, callback: Callable[[], Awaitable[None]]):
+        """Callback chiamata a ogni (ri)connessione, dopo le subscribe (es. replay dei messaggi in uscita)"""
+        self._connect_listeners.append(callback)
+
+    def _set_disconnected(self, error: Exception):
+        if self.connected:
+            self.connection_stats["disconnects"] += 1
+            self._disconnected_at = time.time()
+        self.connected = False
+        self.client = None
+        self.connection_stats["last_error"] = str(error)
 
     async def connect(self):
         self._running = True
+        await self.ingest.start(self._handle_message)
+        attempt = 0
         while self._running:
             try:
                 async with Client(
                     hostname=settings.mqtt_host,
                     port=settings.mqtt_port,
-                    identifier="escape-backend"
+                    identifier=self.identifier,
+                    protocol=PROTOCOLS[settings.mqtt_protocol]
                 ) as client:
                     self.client = client
                     self.connected = True
-                    logger.info(f"Connected to MQTT broker at {settings.mqtt_host}:{settings.mqtt_port}")
+                    attempt = 0
+                    self._on_connected()
+                    logger.info(f"Connected to MQTT broker at {settings.mqtt_host}:{settings.mqtt_port} as {self.identifier}")
                     
-                    await client.subscribe("escape/#")
-                    logger.info("Subscribed to escape/# topics")
+                    # Una radice per casa: escape/#, escape2/#, ...
+                    for topic_filter in self.filters:
+                        await client.subscribe(topic_filter)
+                    logger.info(f"Subscribed to {', '.join(self.filters)} topics")
+                    
+                    for listener in self._connect_listeners:
+                        task = asyncio.create_task(listener())
+                        self._listener_tasks.add(task)
+                        task.add_done_callback(self._listener_tasks.discard)
                     
                     async for message in client.messages:
-                        await self._handle_message(message)
+                        topic = str(message.topic)
+                        routes = self.router.match(canonical_topic(topic))
+                        if not routes:
+                            continue
+                        owned = self.replica_ring is None or self.replica_ring.node_for(topic) == self.replica_index
+                        if not owned and not any(replica_wide(route.name) for route in routes):
+                            # Topic di un'altra replica, nessuna route per processo interessata
+                            continue
+                        await self.ingest.put(topic, (message, owned))
                         
             except MqttError as e:
-                self.connected = False
+                self._set_disconnected(e)
                 logger.error(f"MQTT connection error: {e}")
-                if self._running:
-                    logger.info(f"Reconnecting in {self._reconnect_interval} seconds...")
-                    await asyncio.sleep(self._reconnect_interval)
             except Exception as e:
-                self.connected = False
+                self._set_disconnected(e)
                 logger.error(f"Unexpected MQTT error: {e}")
-                if self._running:
-                    await asyncio.sleep(self._reconnect_interval)
+            if self._running:
+                delay = self.reconnect_delay(attempt)
+                attempt += 1
+                self.connection_stats["attempts"] = attempt
+                self.connection_stats["next_retry_seconds"] = round(delay, 2)
+                logger.info(f"Reconnecting in {delay:.1f} seconds (attempt {attempt})...")
+                await asyncio.sleep(delay)
+
+    def _on_connected(self):
+        now = time.time()
+        self.connection_stats["connects"] += 1
+        self.connection_stats["attempts"] = 0
+        self.connection_stats["next_retry_seconds"] = None
+        self.connection_stats["last_connected_at"] = now
+        if self._disconnected_at is not None:
+            self.connection_stats["downtime_seconds"] += now - self._disconnected_at
+            self._disconnected_at = None
+
+    def connection_metrics(self) -> Dict[str, Any]:
+        metrics = {
+            **self.connection_stats,
+            "connected": self.connected,
+            "client_id": self.identifier,
+            "subscriptions": self.filters,
+            "replica": f"{self.replica_index}/{len(self.replica_ring)}" if self.replica_ring else None
+        }
+        metrics["downtime_seconds"] = round(
+            metrics["downtime_seconds"] + (time.time() - self._disconnected_at if self._disconnected_at else 0), 1
+        )
+        return metrics
 
     async def disconnect(self):
         self._running = False
         self.connected = False
+        await self.ingest.stop()
         logger.info("MQTT handler disconnected")
 
-    async def _handle_message(self, message):
+    async def _handle_message(self, item):
+        message, owned = item
         try:
             topic = str(message.topic)
-            payload = message.payload.decode("utf-8")
+            value = self.codecs.decode(topic, message.payload)
             
-            logger.debug(f"MQTT message received: {topic} -> {payload}")
+            logger.debug(f"MQTT message received: {topic} -> {value}")
             
             parsed_data = self._parse_topic(topic)
-            
-            try:
-                value = json.loads(payload)
-            except json.JSONDecodeError:
-                value = payload
-            
             parsed_data["value"] = value
             parsed_data["raw_topic"] = topic
+            # Device che ha pubblicato (se lo dichiara nel payload): instradamento per sessione
+            if isinstance(value, dict) and value.get("device_id"):
+                parsed_data["device_id"] = str(value["device_id"])
             
-            if self.message_callback:
-                await self.message_callback(parsed_data)
+            # Pattern registrati sulla radice di default: escape2/... usa le stesse route
+            # Topic di un'altra replica: solo le route per processo
+            await self.router.dispatch(parsed_data, canonical_topic(topic), only=None if owned else replica_wide)
                 
         except Exception as e:
             logger.error(f"Error handling MQTT message: {e}")
@@ -79,6 +206,7 @@ class MQTTHandler:
     def _parse_topic(self, topic: str) -> Dict[str, Any]:
         parts = topic.split("/")
         result = {
+            "topic_root": parts[0],
             "room": None,
             "element": None,
             "action": None
@@ -99,20 +227,29 @@ class MQTTHandler:
             return False
             
         try:
-            if isinstance(payload, dict):
-                payload = json.dumps(payload)
-            elif not isinstance(payload, str):
+            if not isinstance(payload, (dict, list, str, bytes)):
                 payload = str(payload)
-                
-            await self.client.publish(topic, payload, retain=retain)
-            logger.debug(f"Published to {topic}: {payload}")
+            payload = self.codecs.encode(topic, payload)
+        except Exception as e:
+            logger.error(f"Error encoding MQTT payload for {topic}: {e}")
+            return False
+        return await self.send(topic, payload, retain=retain)
+
+    async def send(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> bool:
+        """Pubblica un payload già codificato sulla connessione persistente"""
+        if not self.client or not self.connected:
+            return False
+        try:
+            await self.client.publish(topic, payload, qos=qos, retain=retain)
+            logger.debug(f"Published to {topic}: {payload!r}")
             return True
         except Exception as e:
             logger.error(f"Error publishing to MQTT: {e}")
             return False
 
     def set_message_callback(self, callback: Callable):
-        self.message_callback = callback
+        """Compatibilità: una callback unica equivale a una route su tutti i topic"""
+        self.router.add("#", callback, name="message_callback")
 
 
 mqtt_handler = MQTTHandler()
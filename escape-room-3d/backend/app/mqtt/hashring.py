@@ -0,0 +1,48 @@
+"""
+Consistent hashing - topic → nodo (worker di ingest, replica del backend)
+
+Ogni nodo occupa `vnodes` punti su un anello di hash a 32 bit; un topic va al
+primo punto in senso orario. Stesso topic → stesso nodo (ordine per topic),
+e aggiungendo/togliendo un nodo si sposta solo ~1/N dei topic.
+"""
+import bisect
+import hashlib
+from typing import Dict, Generic, Iterable, List, TypeVar
+
+Node = TypeVar("Node")
+
+
+def _hash(key: str) -> int:
+    # blake2b a 32 bit: stabile tra processi e repliche (hash() di str è randomizzato)
+    # e ben distribuito anche per chiavi quasi uguali ("0#1", "0#2", ...)
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+class ConsistentHashRing(Generic[Node]):
+    CACHE_MAX = 8192
+
+    def __init__(self, nodes: Iterable[Node], vnodes: int = 128):
+        self.nodes: List[Node] = list(nodes)
+        if not self.nodes:
+            raise ValueError("ConsistentHashRing needs at least one node")
+        points = sorted(
+            (_hash(f"{node}#{i}"), index)
+            for index, node in enumerate(self.nodes)
+            for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+        self._cache: Dict[str, Node] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_for(self, key: str) -> Node:
+        node = self._cache.get(key)
+        if node is None:
+            position = bisect.bisect(self._points, _hash(key)) % len(self._points)
+            node = self.nodes[self._owners[position]]
+            if len(self._cache) >= self.CACHE_MAX:
+                self._cache.clear()
+            self._cache[key] = node
+        return node
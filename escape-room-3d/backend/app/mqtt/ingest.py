@@ -0,0 +1,197 @@
+"""
+MQTT Ingest - coda limitata + pool di worker tra il consumer MQTT e l'elaborazione
+
+Il loop `async for message in client.messages` ora accoda e basta: un
+messaggio lento (query, broadcast) non ferma più la lettura dal broker.
+
+- Ordine per topic: ogni topic finisce sempre nello stesso shard (consistent
+  hashing del topic), e ogni shard ha un solo worker → i messaggi di un topic vengono
+  elaborati nell'ordine di arrivo; topic diversi procedono in parallelo
+- Overflow (coda dello shard piena), configurabile con MQTT_INGEST_OVERFLOW:
+  - block:       il consumer attende (backpressure verso il broker)
+  - drop_oldest: si scarta il messaggio più vecchio dello shard
+  - coalesce:    un solo messaggio in attesa per topic, il nuovo sostituisce il
+                 vecchio (conta solo l'ultimo valore); se la coda è piena di
+                 topic diversi si scarta il più vecchio
+- Metriche: profondità per shard, picco, scarti, coalescenze, latenza di coda
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.mqtt.hashring import ConsistentHashRing
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class _Entry:
+    __slots__ = ("topic", "message", "enqueued_at")
+
+    def __init__(self, topic: str, message: Any, enqueued_at: float):
+        self.topic = topic
+        self.message = message
+        self.enqueued_at = enqueued_at
+
+
+class _Shard:
+    """Coda di un worker: deque + indice per topic (coalesce)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: Deque[_Entry] = deque()
+        self.by_topic: Dict[str, _Entry] = {}
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.space.set()
+        self.peak = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def push(self, entry: _Entry):
+        self.entries.append(entry)
+        self.by_topic[entry.topic] = entry
+        self.peak = max(self.peak, len(self.entries))
+        self.ready.set()
+        if len(self.entries) >= self.capacity:
+            self.space.clear()
+
+    def pop(self) -> _Entry:
+        entry = self.entries.popleft()
+        if self.by_topic.get(entry.topic) is entry:
+            del self.by_topic[entry.topic]
+        if not self.entries:
+            self.ready.clear()
+        self.space.set()
+        return entry
+
+
+class MQTTIngestQueue:
+    """
+    Pool di `workers` task, ognuno con la sua coda di `max_queue // workers` messaggi.
+
+    handler(message) viene chiamato dal worker dello shard del topic.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 2000, overflow: str = "drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown MQTT ingest overflow policy '{overflow}' (use one of {OVERFLOW_POLICIES})")
+        self.workers = max(1, workers)
+        self.max_queue = max(self.workers, max_queue)
+        self.overflow = overflow
+        self._handler: Optional[Callable[[Any], Awaitable[None]]] = None
+        self._shards: List[_Shard] = []
+        self._ring: Optional[ConsistentHashRing[int]] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "processed": 0, "dropped": 0, "coalesced": 0, "errors": 0}
+        self._busy = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, topic: str) -> _Shard:
+        return self._shards[self._ring.node_for(topic)]
+
+    async def start(self, handler: Callable[[Any], Awaitable[None]]):
+        if self.running:
+            return
+        self._handler = handler
+        capacity = max(1, self.max_queue // self.workers)
+        self._shards = [_Shard(capacity) for _ in range(self.workers)]
+        self._ring = ConsistentHashRing(range(self.workers))
+        self._tasks = [asyncio.create_task(self._run(shard)) for shard in self._shards]
+        logger.info(
+            f"📥 [MQTTIngest] Started {self.workers} workers "
+            f"(queue {self.max_queue}, overflow={self.overflow})"
+        )
+
+    async def stop(self, drain: bool = True, timeout: float = 5.0):
+        """Ferma i worker; con drain=True elabora prima i messaggi già in coda (al più `timeout` secondi)"""
+        deadline = time.monotonic() + timeout
+        while drain and (self.depth or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        logger.info(f"📥 [MQTTIngest] Stopped: {self.stats}")
+
+    async def put(self, topic: str, message: Any):
+        """Accoda un messaggio (politica di overflow se lo shard è pieno)"""
+        if not self.running:
+            # Coda non avviata (script/test): elaborazione diretta
+            if self._handler is not None:
+                await self._handler(message)
+            return
+
+        shard = self._shard(topic)
+        now = time.monotonic()
+
+        if self.overflow == "coalesce":
+            pending = shard.by_topic.get(topic)
+            if pending is not None:
+                # Conta solo l'ultimo valore: sostituisce quello in attesa, stessa posizione
+                pending.message = message
+                self.stats["coalesced"] += 1
+                return
+
+        if len(shard) >= shard.capacity:
+            if self.overflow == "block":
+                while len(shard) >= shard.capacity:
+                    await shard.space.wait()
+            else:
+                dropped = shard.pop()
+                self.stats["dropped"] += 1
+                if self.stats["dropped"] % 100 == 1:
+                    logger.warning(f"⚠️ [MQTTIngest] Queue full: dropped oldest message ({dropped.topic}), total {self.stats['dropped']}")
+
+        shard.push(_Entry(topic, message, now))
+        self.stats["enqueued"] += 1
+
+    async def _run(self, shard: _Shard):
+        while True:
+            await shard.ready.wait()
+            entry = shard.pop()
+            wait = time.monotonic() - entry.enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._busy += 1
+            try:
+                await self._handler(entry.message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"[MQTTIngest] Error handling {entry.topic}: {e}")
+            finally:
+                self._busy -= 1
+            self.stats["processed"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        processed = self.stats["processed"]
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "overflow": self.overflow,
+            "depth": self.depth,
+            "capacity": self.max_queue,
+            "shard_depths": [len(shard) for shard in self._shards],
+            "shard_peaks": [shard.peak for shard in self._shards],
+            "queue_wait_avg_ms": round(self._wait_total / processed * 1000, 2) if processed else 0.0,
+            "queue_wait_max_ms": round(self._wait_max * 1000, 2)
+        }
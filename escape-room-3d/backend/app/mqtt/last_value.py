@@ -0,0 +1,135 @@
+"""
+MQTT Last Value - ultimo valore di ogni topic escape/#, salvato su file e ricaricato all'avvio
+
+Dopo un riavvio il backend conosceva i valori dei sensori solo alla
+pubblicazione successiva di ogni scheda. Ora:
+
+- ogni messaggio MQTT aggiorna la cache in memoria (route "<root>/#")
+- un task salva periodicamente la cache su file (JSON gzip, scritto su .tmp
+  e rinominato) solo se è cambiata; al boot il file viene ricaricato
+- GET /mqtt/snapshot e l'evento Socket.IO requestMqttSnapshot restituiscono
+  il quadro dei device di una sessione (solo le sue radici topic) in una sola risposta
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FILE_VERSION = 1
+
+
+class LastValueCache:
+    """topic → (valore decodificato, istante di ricezione epoch)"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, float]] = {}
+        self._dirty = False
+        self.loaded_at: Optional[float] = None
+        self.saved_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def update(self, topic: str, value: Any, received_at: Optional[float] = None):
+        self._values[topic] = (value, received_at if received_at is not None else time.time())
+        self._dirty = True
+
+    async def handle_message(self, data: Dict[str, Any]):
+        """Handler per il router MQTT: registra il valore sul topic reale (ogni casa il suo)"""
+        topic = data.get("raw_topic")
+        if topic:
+            self.update(topic, data.get("value"))
+
+    def get(self, topic: str) -> Optional[Any]:
+        entry = self._values.get(topic)
+        return entry[0] if entry else None
+
+    def snapshot(self, roots: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Quadro completo: {topic: {"value", "received_at"}}, opzionalmente solo per alcune radici"""
+        prefixes = tuple(f"{root}/" for root in roots) if roots is not None else None
+        return {
+            topic: {"value": value, "received_at": received_at}
+            for topic, (value, received_at) in sorted(self._values.items())
+            if prefixes is None or topic.startswith(prefixes)
+        }
+
+    # -------------------------------------------------------------- persistenza
+
+    async def save(self, path: str) -> bool:
+        """Scrive la cache su file (in un thread) se è cambiata dall'ultimo salvataggio"""
+        if not self._dirty:
+            return False
+        # Copia sul thread del loop: handle_message continua ad aggiornare _values
+        # mentre il thread serializza; un update concorrente verrà salvato al giro dopo
+        values = dict(self._values)
+        self._dirty = False
+        try:
+            self.saved_at = await asyncio.to_thread(self._write, path, values)
+        except Exception:
+            self._dirty = True
+            raise
+        return True
+
+    @staticmethod
+    def _write(path: str, values: Dict[str, Tuple[Any, float]]) -> float:
+        document = {
+            "version": FILE_VERSION,
+            "saved_at": time.time(),
+            "topics": {topic: [value, received_at] for topic, (value, received_at) in values.items()}
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as snapshot_file:
+            json.dump(document, snapshot_file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return document["saved_at"]
+
+    def load(self, path: str) -> int:
+        """Ricarica il file salvato (i valori già ricevuti in memoria hanno la precedenza)"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as snapshot_file:
+                document = json.load(snapshot_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ [MQTTLastValue] Snapshot {path} unreadable, ignored: {e}")
+            return 0
+        if document.get("version") != FILE_VERSION:
+            logger.warning(f"⚠️ [MQTTLastValue] Snapshot {path} has unknown version {document.get('version')}, ignored")
+            return 0
+
+        loaded = 0
+        for topic, (value, received_at) in document.get("topics", {}).items():
+            if topic not in self._values:
+                self._values[topic] = (value, received_at)
+                loaded += 1
+        self.loaded_at = time.time()
+        logger.info(f"💾 [MQTTLastValue] Restored {loaded} topics from {path}")
+        return loaded
+
+    async def persist_loop(self, path: str, interval_seconds: float):
+        """Salvataggio periodico (la scrittura del file non blocca il loop)"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.save(path)
+            except Exception as e:
+                logger.error(f"[MQTTLastValue] Snapshot save failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._values),
+            "dirty": self._dirty,
+            "loaded_at": self.loaded_at,
+            "saved_at": self.saved_at
+        }
+
+
+mqtt_last_values = LastValueCache()
@@ -0,0 +1,336 @@
+"""
+MQTT Publisher - coda di pubblicazione per topic, l'ultimo valore vince
+
+Ogni chiamata a update_photocell_state_async pubblicava 5 topic, anche se
+le posizioni non erano cambiate. Ora MQTTClient.publish accoda e basta:
+
+- un messaggio in attesa per topic: un valore più recente sostituisce quello
+  non ancora inviato (coalescenza)
+- un payload identico all'ultimo inviato sul topic non viene ripubblicato
+  (salvo dopo `resend_after_seconds`, per le schede riavviate nel frattempo)
+- se un valore torna uguale all'ultimo inviato prima del flush, il messaggio
+  in attesa viene annullato: un flap aperto→chiuso→aperto non pubblica nulla
+- un task unico invia i messaggi in attesa ogni `flush_interval_ms`
+
+Il traffico verso il broker segue i cambi di stato reali, non il rumore dei sensori.
+
+Broker non raggiungibile (riavvio di Mosquitto a partita in corso):
+- i messaggi non consegnati finiscono nell'outbox, in ordine (l'ultimo valore
+  per topic vince anche qui), copiata su file: sopravvive a un riavvio del backend
+- alla riconnessione (listener del MQTTHandler) l'outbox viene rispedita in
+  ordine, un messaggio alla volta, prima dei messaggi nuovi
+- i topic di comando (MQTT_COMMAND_PREFIXES) escono con QoS 1
+
+Da codice sincrono (route nel threadpool, servizi) si usa publish_nowait:
+thread-safe e non bloccante, accoda sul loop del publisher con
+call_soon_threadsafe. Nessun event loop creato o pilotato per chiamata.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.mqtt.codecs import CodecRegistry, mqtt_codecs, topic_path
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# send(topic, payload codificato, qos, retain) → True se consegnato al broker
+Sender = Callable[[str, bytes, int, bool], Awaitable[bool]]
+
+
+class _Outbound:
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "payload": base64.b64encode(self.payload).decode("ascii"),
+            "qos": self.qos,
+            "retain": self.retain
+        }
+
+    @classmethod
+    def from_json(cls, row: Dict[str, Any]) -> "_Outbound":
+        return cls(row["topic"], base64.b64decode(row["payload"]), row.get("qos", 0), row.get("retain", False))
+
+
+class MQTTPublisher:
+    def __init__(
+        self,
+        flush_interval_ms: int = 50,
+        resend_after_seconds: float = 60,
+        outbox_path: Optional[str] = None,
+        outbox_max: int = 1000,
+        command_prefixes: Tuple[str, ...] = (),
+        codecs: CodecRegistry = mqtt_codecs
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.resend_after_seconds = resend_after_seconds
+        self.outbox_path = outbox_path
+        self.outbox_max = max(1, outbox_max)
+        self.command_prefixes = tuple(command_prefixes)
+        self.codecs = codecs
+        self._send: Optional[Sender] = None
+        self._pending: Dict[str, _Outbound] = {}
+        self._outbox: "OrderedDict[str, _Outbound]" = OrderedDict()
+        self._outbox_dirty = False
+        self._replay_lock: Optional[asyncio.Lock] = None
+        self._last_sent: Dict[str, Tuple[bytes, float]] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[Dict[str, Any]] = None
+        self.stats = {
+            "queued": 0, "sent": 0, "coalesced": 0, "suppressed": 0, "failed": 0,
+            "buffered": 0, "replayed": 0, "outbox_dropped": 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, send: Sender):
+        if self.running:
+            return
+        self._send = send
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._replay_lock = asyncio.Lock()
+        await asyncio.to_thread(self._load_outbox)
+        self._task = asyncio.create_task(self._run())
+        if self._pending:
+            # Accodati prima dell'avvio
+            self._wake.set()
+        logger.info(f"📤 [MQTTPublisher] Started (flush every {self.flush_interval * 1000:.0f} ms)")
+
+    async def stop(self, flush: bool = True):
+        if flush and self._pending:
+            await self._flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Quello che non è partito resta su disco per il prossimo avvio
+        await self._persist_outbox()
+        logger.info(f"📤 [MQTTPublisher] Stopped: {self.stats}")
+
+    def _is_duplicate(self, topic: str, payload: bytes) -> bool:
+        last = self._last_sent.get(topic)
+        return (
+            last is not None
+            and last[0] == payload
+            and time.monotonic() - last[1] < self.resend_after_seconds
+        )
+
+    async def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False, force: bool = False) -> bool:
+        """
+        Accoda un messaggio (codificato col codec del topic).
+
+        Returns:
+            False se soppresso perché identico all'ultimo valore inviato
+        """
+        return self._enqueue(topic, payload, qos, retain, force)
+
+    def publish_nowait(self, topic: str, payload: Any, qos: int = 0, retain: bool = False, force: bool = False):
+        """Thread-safe e non bloccante: accoda dal loop o da un thread qualsiasi (esito nelle metriche)"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Publisher non ancora avviato: il messaggio parte all'avvio
+            self._enqueue(topic, payload, qos, retain, force)
+            return
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is loop:
+            self._enqueue(topic, payload, qos, retain, force)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, topic, payload, qos, retain, force)
+
+    def _enqueue(self, topic: str, payload: Any, qos: int, retain: bool, force: bool) -> bool:
+        """Sempre nel thread del loop (o prima dell'avvio): nessun lock sulle strutture interne"""
+        try:
+            encoded = self.codecs.encode(topic, payload)
+        except Exception as e:
+            self._record_failure(topic, e)
+            return False
+        if self.is_command(topic):
+            qos = max(qos, 1)
+        if not force and self._is_duplicate(topic, encoded):
+            # Il valore è tornato quello già pubblicato: niente da inviare (anche se c'era un cambio in attesa)
+            if self._pending.pop(topic, None) is not None:
+                self.stats["coalesced"] += 1
+            if self._outbox.pop(topic, None) is not None:
+                self._outbox_dirty = True
+            self.stats["suppressed"] += 1
+            return False
+
+        if self._pending.pop(topic, None) is not None:
+            self.stats["coalesced"] += 1
+        self._pending[topic] = _Outbound(topic, encoded, qos, retain)
+        self.stats["queued"] += 1
+        if self._wake is not None:
+            self._wake.set()
+        return True
+
+    def _record_failure(self, topic: str, error: Any):
+        self.stats["failed"] += 1
+        self.last_error = {"topic": topic, "error": str(error), "at": time.time()}
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Finestra di coalescenza: i valori arrivati nel frattempo sostituiscono quelli in attesa
+            await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+            await self._flush()
+
+    def is_command(self, topic: str) -> bool:
+        """Topic di comando verso gli attuatori (QoS 1): prefisso sotto la radice della casa"""
+        return bool(self.command_prefixes) and topic_path(topic).startswith(self.command_prefixes)
+
+    async def _flush(self):
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        if self._outbox:
+            # Messaggi ancora da rispedire: i nuovi si accodano dietro, l'ordine resta quello di pubblicazione
+            for message in batch.values():
+                self._buffer(message)
+            await self.replay()
+            return
+        # Topic indipendenti: inviati in parallelo
+        await asyncio.gather(*(self._deliver(message) for message in batch.values()))
+        await self._persist_outbox()
+
+    async def _deliver(self, message: _Outbound) -> bool:
+        error: Any = "not connected"
+        try:
+            delivered = await self._send(message.topic, message.payload, message.qos, message.retain)
+        except Exception as e:
+            logger.error(f"[MQTTPublisher] Send to {message.topic} failed: {e}")
+            delivered, error = False, e
+        if delivered:
+            self._last_sent[message.topic] = (message.payload, time.monotonic())
+            self.stats["sent"] += 1
+        else:
+            self._record_failure(message.topic, error)
+            self._buffer(message)
+        return delivered
+
+    # ------------------------------------------------------------------ outbox
+
+    def _buffer(self, message: _Outbound):
+        """Messaggio non consegnato → outbox (ultimo valore per topic, in coda)"""
+        self._outbox.pop(message.topic, None)
+        self._outbox[message.topic] = message
+        self.stats["buffered"] += 1
+        while len(self._outbox) > self.outbox_max:
+            dropped_topic, _ = self._outbox.popitem(last=False)
+            self.stats["outbox_dropped"] += 1
+            logger.warning(f"⚠️ [MQTTPublisher] Outbox full: dropped {dropped_topic}")
+        self._outbox_dirty = True
+
+    async def replay(self):
+        """Rispedisce l'outbox in ordine; si ferma al primo invio fallito (broker ancora giù)"""
+        if self._replay_lock is None:
+            return
+        async with self._replay_lock:
+            replayed = 0
+            while self._outbox:
+                topic, message = next(iter(self._outbox.items()))
+                try:
+                    delivered = await self._send(message.topic, message.payload, message.qos, message.retain)
+                except Exception as e:
+                    logger.error(f"[MQTTPublisher] Replay of {topic} failed: {e}")
+                    delivered = False
+                if not delivered:
+                    break
+                # Durante l'await il topic può essere stato sostituito da un valore più recente
+                if self._outbox.get(topic) is message:
+                    del self._outbox[topic]
+                self._outbox_dirty = True
+                self._last_sent[topic] = (message.payload, time.monotonic())
+                self.stats["sent"] += 1
+                replayed += 1
+            if replayed:
+                self.stats["replayed"] += replayed
+                logger.info(f"📤 [MQTTPublisher] Replayed {replayed} buffered messages ({len(self._outbox)} left)")
+            await self._persist_outbox()
+
+    def _load_outbox(self):
+        if not self.outbox_path or not os.path.exists(self.outbox_path):
+            return
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as outbox_file:
+                for line in outbox_file:
+                    if line.strip():
+                        message = _Outbound.from_json(json.loads(line))
+                        self._outbox.pop(message.topic, None)
+                        self._outbox[message.topic] = message
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ [MQTTPublisher] Outbox {self.outbox_path} unreadable, ignored: {e}")
+            return
+        if self._outbox:
+            logger.info(f"💾 [MQTTPublisher] Restored {len(self._outbox)} buffered messages from {self.outbox_path}")
+
+    async def _persist_outbox(self):
+        """Copia su disco dell'outbox (solo se cambiata; file rimosso quando è vuota)"""
+        if not self.outbox_path or not self._outbox_dirty:
+            return
+        self._outbox_dirty = False
+        rows = [message.to_json() for message in self._outbox.values()]
+        try:
+            await asyncio.to_thread(self._write_outbox, rows)
+        except Exception as e:
+            self._outbox_dirty = True
+            logger.error(f"[MQTTPublisher] Outbox save failed: {e}")
+
+    def _write_outbox(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            if os.path.exists(self.outbox_path):
+                os.remove(self.outbox_path)
+            return
+        directory = os.path.dirname(self.outbox_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.outbox_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as outbox_file:
+            for row in rows:
+                outbox_file.write(json.dumps(row, separators=(",", ":")))
+                outbox_file.write("\n")
+        os.replace(tmp_path, self.outbox_path)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "outbox": len(self._outbox),
+            "topics_tracked": len(self._last_sent),
+            "last_error": self.last_error
+        }
+
+
+mqtt_publisher = MQTTPublisher(
+    flush_interval_ms=settings.mqtt_publish_flush_ms,
+    resend_after_seconds=settings.mqtt_publish_resend_seconds,
+    outbox_path=settings.mqtt_outbox_path,
+    outbox_max=settings.mqtt_outbox_max,
+    command_prefixes=tuple(p.strip() for p in settings.mqtt_command_prefixes.split(",") if p.strip())
+)
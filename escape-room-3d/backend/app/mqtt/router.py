@@ -0,0 +1,177 @@
+"""
+MQTT Router - pattern MQTT (+, #) compilati in un trie, un handler per pattern
+
+Al posto di una callback globale che decide tutto con query al DB, ogni tipo
+di device registra il suo pattern:
+
+    mqtt_router.add("escape/esterno/ir-sensor/lettura", handle_gate_photocell, name="gate_photocell")
+    mqtt_router.replace("elements", element_topics, handle_mqtt_message)
+
+Il match percorre il trie livello per livello (letterale, `+`, `#`) e il
+risultato per topic è memorizzato: un topic senza handler viene scartato
+con un lookup in un dict, prima del decode del payload. Un messaggio va a
+TUTTI gli handler che lo corrispondono, in ordine di registrazione.
+I pattern si scrivono sulla radice di default: il handler MQTT confronta il
+topic canonico, quindi escape2/... usa le stesse route.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Route(NamedTuple):
+    order: int
+    name: str
+    pattern: str
+    handler: Handler
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash", "routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.plus: Optional["_Node"] = None
+        self.hash: List[Route] = []    # pattern che terminano con "#" a questo livello
+        self.routes: List[Route] = []  # pattern che terminano esattamente qui
+
+
+def validate_pattern(pattern: str):
+    """Regole MQTT: `#` solo come ultimo livello, `+`/`#` occupano un livello intero"""
+    levels = pattern.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            raise ValueError(f"Invalid MQTT pattern '{pattern}': '#' must be the last level")
+        if "+" in level and level != "+":
+            raise ValueError(f"Invalid MQTT pattern '{pattern}': '+' must occupy a whole level")
+
+
+class TopicRouter:
+    """Trie dei pattern + cache topic → handler"""
+
+    CACHE_MAX = 4096
+
+    def __init__(self):
+        self._root = _Node()
+        self._routes: List[Route] = []
+        self._cache: Dict[str, Tuple[Route, ...]] = {}
+        self.stats = {"dispatched": 0, "unmatched": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def add(self, pattern: str, handler: Handler, name: Optional[str] = None) -> Route:
+        validate_pattern(pattern)
+        route = Route(len(self._routes), name or getattr(handler, "__name__", pattern), pattern, handler)
+        self._routes.append(route)
+        self._insert(route)
+        self._cache.clear()
+        logger.info(f"🧭 [MQTTRouter] {pattern} → {route.name}")
+        return route
+
+    def remove(self, name: str) -> int:
+        """Rimuove le route con questo nome e ricompila il trie"""
+        kept = [route for route in self._routes if route.name != name]
+        removed = len(self._routes) - len(kept)
+        self._routes = [route._replace(order=i) for i, route in enumerate(kept)]
+        self._root = _Node()
+        for route in self._routes:
+            self._insert(route)
+        self._cache.clear()
+        return removed
+
+    def replace(self, name: str, patterns: Iterable[str], handler: Handler) -> int:
+        """
+        Sostituisce in blocco le route con questo nome (es. un pattern esatto per
+        ogni topic del catalogo elementi): un solo ricompilo del trie.
+        """
+        patterns = list(dict.fromkeys(patterns))
+        for pattern in patterns:
+            validate_pattern(pattern)
+        kept = [route for route in self._routes if route.name != name]
+        self._routes = [route._replace(order=i) for i, route in enumerate(kept)]
+        self._routes += [Route(len(self._routes) + i, name, pattern, handler) for i, pattern in enumerate(patterns)]
+        self._root = _Node()
+        for route in self._routes:
+            self._insert(route)
+        self._cache.clear()
+        logger.info(f"🧭 [MQTTRouter] {len(patterns)} patterns → {name}")
+        return len(patterns)
+
+    def _insert(self, route: Route):
+        node = self._root
+        for level in route.pattern.split("/"):
+            if level == "#":
+                node.hash.append(route)
+                return
+            if level == "+":
+                if node.plus is None:
+                    node.plus = _Node()
+                node = node.plus
+            else:
+                node = node.children.setdefault(level, _Node())
+        node.routes.append(route)
+
+    def match(self, topic: str) -> Tuple[Route, ...]:
+        """Route che corrispondono al topic, in ordine di registrazione (memorizzato per topic)"""
+        cached = self._cache.get(topic)
+        if cached is not None:
+            return cached
+
+        found: List[Route] = []
+        levels = topic.split("/")
+        # I topic che iniziano con $ (es. $SYS) non corrispondono a wildcard al primo livello
+        wildcard_root = not topic.startswith("$")
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.hash and (depth > 0 or wildcard_root):
+                found.extend(node.hash)
+            if depth == len(levels):
+                found.extend(node.routes)
+                continue
+            child = node.children.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            if node.plus is not None and (depth > 0 or wildcard_root):
+                stack.append((node.plus, depth + 1))
+
+        result = tuple(sorted(set(found), key=lambda route: route.order))
+        if len(self._cache) >= self.CACHE_MAX:
+            self._cache.clear()
+        self._cache[topic] = result
+        return result
+
+    def matches(self, topic: str) -> bool:
+        return bool(self.match(topic))
+
+    async def dispatch(self, data: Dict[str, Any], topic: Optional[str] = None, only: Optional[Callable[[str], bool]] = None):
+        """Consegna il messaggio a tutti gli handler del topic (un errore non ferma gli altri), o solo alle route `only(nome)`"""
+        routes = self.match(topic if topic is not None else data.get("raw_topic", ""))
+        if only is not None:
+            routes = tuple(route for route in routes if only(route.name))
+        if not routes:
+            self.stats["unmatched"] += 1
+            return
+        self.stats["dispatched"] += 1
+        if len(routes) == 1:
+            await self._call(routes[0], data)
+            return
+        await asyncio.gather(*(self._call(route, data) for route in routes))
+
+    async def _call(self, route: Route, data: Dict[str, Any]):
+        try:
+            await route.handler(data)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"[MQTTRouter] Handler {route.name} failed on {data.get('raw_topic')}: {e}")
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [{"pattern": route.pattern, "handler": route.name} for route in self._routes]
+
+
+mqtt_router = TopicRouter()
@@ -1,9 +1,9 @@
 """MQTT Client Singleton for ESP32 Communication"""
 import asyncio
 import aiomqtt
-import os
-from typing import Optional
+from typing import Any, List, Optional
 from app.config import get_settings
+from app.mqtt.codecs import mqtt_codecs
 
 class MQTTClient:
     """
@@ -27,54 +27,94 @@ class MQTTClient:
         return cls._instance
     
     @classmethod
-    async def publish(cls, topic: str, payload: str, qos: int = 0):
+    async def publish(cls, topic: str, payload: Any, qos: int = 0):
         """
         Publish a message to MQTT broker.
         
+        Con il publisher avviato il messaggio viene solo accodato: l'ultimo valore
+        per topic vince e i payload identici all'ultimo inviato non vengono ripubblicati.
+        
         Args:
             topic: MQTT topic (e.g., "escape/game-completion/won")
-            payload: Message payload (e.g., "true" or "false")
+            payload: Message payload (e.g., "true" or "false", or a dict encoded
+                with the topic's codec - JSON unless MQTT_CODECS says otherwise)
             qos: Quality of Service (0, 1, or 2)
         """
+        from app.mqtt.publisher import mqtt_publisher
+        try:
+            if mqtt_publisher.running:
+                await mqtt_publisher.publish(topic, payload, qos=qos)
+            else:
+                # Script/test senza lifespan: invio diretto
+                await cls.send(topic, mqtt_codecs.encode(topic, payload), qos)
+        except Exception as e:
+            print(f"⚠️ [MQTT] Failed to publish to '{topic}': {e}")
+            # Non-blocking: continue even if MQTT fails
+    
+    @classmethod
+    def publish_nowait(cls, topic: str, payload: Any, qos: int = 0):
+        """Versione per codice sincrono (thread qualsiasi): accoda sul publisher e ritorna subito"""
+        from app.mqtt.publisher import mqtt_publisher
+        mqtt_publisher.publish_nowait(topic, payload, qos=qos)
+    
+    @classmethod
+    async def send(cls, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> bool:
+        """
+        Invio effettivo di un payload già codificato.
+        
+        Usa la connessione persistente del MQTTHandler; se non è connesso, un
+        client temporaneo (fire-and-forget pattern).
+        """
+        from app.mqtt.handler import mqtt_handler
+        if mqtt_handler.connected:
+            return await mqtt_handler.send(topic, payload, qos=qos, retain=retain)
+        
         try:
             # Get broker config from settings
             broker_host, broker_port = cls._get_broker_config()
             
-            # Create temporary client for each publish (fire-and-forget pattern)
             async with aiomqtt.Client(broker_host, port=broker_port) as client:
-                await client.publish(topic, payload, qos=qos)
-                print(f"📤 [MQTT] Published to '{topic}' on {broker_host}:{broker_port}: {payload}")
+                await client.publish(topic, payload, qos=qos, retain=retain)
+                print(f"📤 [MQTT] Published to '{topic}' on {broker_host}:{broker_port}: {payload!r}")
+            return True
         except Exception as e:
             print(f"⚠️ [MQTT] Failed to publish to '{topic}': {e}")
-            # Non-blocking: continue even if MQTT fails
+            return False
+    
+    @classmethod
+    def session_topics(cls, session_id: Optional[int], path: str) -> List[str]:
+        """
+        Topic di una sessione: `path` sotto la radice MQTT di ogni casa della sessione.
+        
+        Senza session_id (chiamate legacy) la radice di default "escape".
+        """
+        from app.services.device_session_router import DEFAULT_TOPIC_ROOT, device_session_router
+        roots = device_session_router.topic_roots(session_id) if session_id is not None else [DEFAULT_TOPIC_ROOT]
+        return [f"{root}/{path}" for root in roots]
     
     @classmethod
-    async def publish_game_won(cls, won: bool):
+    async def publish_game_won(cls, won: bool, session_id: Optional[int] = None):
         """
         Publish game victory status to ESP32 devices.
         
         Args:
             won: True if game is won (all 4 rooms completed), False otherwise
+            session_id: sessione vinta - pubblicato solo sui topic della sua casa
         """
         payload = "true" if won else "false"
-        await cls.publish("escape/game-completion/won", payload)
-        print(f"🏆 [MQTT] Game won status published: {payload}")
+        topics = cls.session_topics(session_id, "game-completion/won")
+        await asyncio.gather(*(cls.publish(topic, payload) for topic in topics))
+        print(f"🏆 [MQTT] Game won status published: {payload} (session {session_id})")
 
 
-# Convenience function for sync contexts (wraps async call)
-def publish_game_won_sync(won: bool):
+# Convenience function for sync contexts
+def publish_game_won_sync(won: bool, session_id: Optional[int] = None):
     """
-    Synchronous wrapper for publishing game won status.
+    Synchronous version of publish_game_won.
     
-    Creates a new event loop if needed (for use in sync functions).
+    Thread-safe e non bloccante: accoda sul publisher MQTT (nessun event loop
+    creato o pilotato qui); consegna e fallimenti nelle metriche del publisher.
     """
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If loop is already running, schedule as task
-            asyncio.create_task(MQTTClient.publish_game_won(won))
-        else:
-            # Create new loop for this publish
-            loop.run_until_complete(MQTTClient.publish_game_won(won))
-    except Exception as e:
-        print(f"⚠️ [MQTT] Error in sync publish: {e}")
\ No newline at end of file
+    payload = "true" if won else "false"
+    for topic in MQTTClient.session_topics(session_id, "game-completion/won"):
+        MQTTClient.publish_nowait(topic, payload)
@@ -26,6 +26,7 @@ class GameCompletionResponse(BaseModel):
     game_won: bool
     victory_time: Optional[datetime] = None
     completed_rooms_count: int
+    version: int = 0  # incrementata a ogni cambio di completamento
     updated_at: datetime
     
     class Config:
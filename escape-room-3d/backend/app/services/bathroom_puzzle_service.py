@@ -1,7 +1,5 @@
 """Bathroom Puzzle Service - FSM and validation logic"""
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
-from datetime import datetime
 from typing import Optional, Dict, Any
 from app.models.bathroom_puzzle import BathroomPuzzleState
 from app.schemas.bathroom_puzzle import (
@@ -10,6 +8,8 @@ from app.schemas.bathroom_puzzle import (
     LEDStates,
     PuzzleStateDetail
 )
+from app.services import persistence
+from app.services.puzzle_fsm import BATHROOM_FSM
 
 
 class BathroomPuzzleService:
@@ -22,9 +22,9 @@ class BathroomPuzzleService:
     """
     
     @staticmethod
-    def _get_led_states(puzzle_states: Dict[str, Any]) -> LEDStates:
+    def _get_led_states(state: BathroomPuzzleState) -> LEDStates:
         """
-        Convert puzzle states to LED colors.
+        Convert puzzle states to LED colors (tabella compilata in BATHROOM_FSM).
         
         Rules:
         - locked → off (per doccia e ventola)
@@ -32,16 +32,7 @@ class BathroomPuzzleService:
         - done → green
         - specchio_white → on when specchio done (LED bianco P33)
         """
-        specchio_done = puzzle_states["specchio"]["status"] == "done"
-        
-        return LEDStates(
-            specchio="green" if specchio_done else "red",
-            specchio_white="on" if specchio_done else "off",
-            porta_finestra="green" if puzzle_states["doccia"]["status"] == "done" else 
-                          "red" if puzzle_states["doccia"]["status"] == "active" else "off",
-            ventola="green" if puzzle_states["ventola"]["status"] == "done" else 
-                   "red" if puzzle_states["ventola"]["status"] == "active" else "off"
-        )
+        return LEDStates(**BATHROOM_FSM.led_states(state))
     
     @staticmethod
     def _puzzle_states_to_schema(puzzle_states: Dict[str, Any]) -> BathroomPuzzleStates:
@@ -102,9 +93,7 @@ class BathroomPuzzleService:
             window_servo_should_close=False,   # Finestra aperta inizialmente
             fan_should_run=False               # Ventola spenta inizialmente
         )
-        db.add(state)
-        db.commit()
-        db.refresh(state)
+        persistence.save(db, state)
         return state
     
     @staticmethod
@@ -120,15 +109,30 @@ class BathroomPuzzleService:
             BathroomPuzzleStateResponse with current state
         """
         state = BathroomPuzzleService.get_or_create_state(db, session_id)
-        
+        return BathroomPuzzleService._build_state_response(state)
+    
+    @staticmethod
+    def _build_state_response(state: BathroomPuzzleState) -> BathroomPuzzleStateResponse:
+        """Costruisce la response da un'istanza già caricata (nessuna query sullo stato)"""
         return BathroomPuzzleStateResponse(
             session_id=state.session_id,
             room_name=state.room_name,
             states=BathroomPuzzleService._puzzle_states_to_schema(state.puzzle_states),
-            led_states=BathroomPuzzleService._get_led_states(state.puzzle_states),
+            led_states=BathroomPuzzleService._get_led_states(state),
             updated_at=state.updated_at
         )
     
+    @staticmethod
+    def state_document(state: BathroomPuzzleState) -> Dict[str, Any]:
+        """Stessa forma di BathroomPuzzleStateResponse come dict pronto per fast_json"""
+        return {
+            "session_id": state.session_id,
+            "room_name": state.room_name,
+            "states": BATHROOM_FSM.states_document(state),
+            "led_states": BATHROOM_FSM.led_states(state),
+            "updated_at": state.updated_at
+        }
+    
     @staticmethod
     def validate_specchio_complete(db: Session, session_id: int) -> Optional[BathroomPuzzleStateResponse]:
         """
@@ -148,24 +152,11 @@ class BathroomPuzzleService:
         """
         state = BathroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if specchio is active
-        if state.puzzle_states["specchio"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BATHROOM_FSM.apply(db, session_id, state, "specchio") is None:
+            return None
         
-        # Atomic update
-        state.puzzle_states["specchio"]["status"] = "done"
-        state.puzzle_states["specchio"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["doccia"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes (only if already persisted)
-        if state.id is not None:
-            flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        return BathroomPuzzleService.get_state_response(db, session_id)
+        return BathroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def validate_doccia_complete(db: Session, session_id: int) -> Optional[BathroomPuzzleStateResponse]:
@@ -186,24 +177,11 @@ class BathroomPuzzleService:
         """
         state = BathroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if doccia is active
-        if state.puzzle_states["doccia"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
-        
-        # Atomic update
-        state.puzzle_states["doccia"]["status"] = "done"
-        state.puzzle_states["doccia"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["ventola"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes (only if already persisted)
-        if state.id is not None:
-            flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BATHROOM_FSM.apply(db, session_id, state, "doccia") is None:
+            return None
         
-        return BathroomPuzzleService.get_state_response(db, session_id)
+        return BathroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def validate_ventola_complete(db: Session, session_id: int) -> Optional[BathroomPuzzleStateResponse]:
@@ -225,34 +203,11 @@ class BathroomPuzzleService:
         """
         state = BathroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if ventola is active
-        if state.puzzle_states["ventola"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BATHROOM_FSM.apply(db, session_id, state, "ventola") is None:
+            return None
         
-        # Atomic update
-        state.puzzle_states["ventola"]["status"] = "done"
-        state.puzzle_states["ventola"]["completed_at"] = datetime.utcnow().isoformat()
-        state.updated_at = datetime.utcnow()
-        
-        # 🔧 Attiva hardware fisico quando ventola completata
-        state.window_servo_should_close = True   # Finestra si chiude (P25: 30° → 0°)
-        state.fan_should_run = True              # Ventola si attiva (P32: LOW → HIGH)
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes (only if already persisted)
-        if state.id is not None:
-            flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        # 🆕 Notifica game completion che bagno è completato
-        from app.services.game_completion_service import GameCompletionService
-        GameCompletionService.mark_room_completed(db, session_id, "bagno")
-        
-        # 🔥 FIX: Forza un flush per assicurarci che il database sia aggiornato
-        db.flush()
-        
-        return BathroomPuzzleService.get_state_response(db, session_id)
+        return BathroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def reset_puzzles(db: Session, session_id: int, level: str = "full", puzzles_to_reset: Optional[list] = None) -> BathroomPuzzleStateResponse:
@@ -270,38 +225,8 @@ class BathroomPuzzleService:
         """
         state = BathroomPuzzleService.get_or_create_state(db, session_id)
         
-        if level == "full":
-            # Full reset - back to initial state
-            state.puzzle_states = BathroomPuzzleState.get_initial_state()
-            
-            # 🔧 Reset hardware flags
-            state.door_servo_should_open = False       # Porta chiusa (0°)
-            state.window_servo_should_close = False    # Finestra aperta (30°)
-            state.fan_should_run = False               # Ventola spenta
-            
-            # 🆕 IMPORTANTE: Resetta ANCHE game_completion per questa stanza
-            from app.services.game_completion_service import GameCompletionService
-            GameCompletionService.unmark_room_completed(db, session_id, "bagno")
-            
-        elif level == "partial" and puzzles_to_reset:
-            # Partial reset - reset specific puzzles
-            initial = BathroomPuzzleState.get_initial_state()
-            for puzzle_name in puzzles_to_reset:
-                if puzzle_name in state.puzzle_states:
-                    state.puzzle_states[puzzle_name] = initial[puzzle_name]
-                    
-            # 🔧 Se resettiamo ventola, resettiamo anche hardware
-            if "ventola" in puzzles_to_reset:
-                state.window_servo_should_close = False
-                state.fan_should_run = False
-        
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes (only if already persisted)
-        if state.id is not None:
-            flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
+        # Full reset: stato iniziale + game_completion della stanza (evita inconsistenze)
+        # Partial reset: solo i puzzle indicati
+        BATHROOM_FSM.reset(db, session_id, state, level, puzzles_to_reset)
         
-        return BathroomPuzzleService.get_state_response(db, session_id)
\ No newline at end of file
+        return BathroomPuzzleService._build_state_response(state)
\ No newline at end of file
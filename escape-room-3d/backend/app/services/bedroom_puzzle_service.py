@@ -1,8 +1,5 @@
 """Bedroom Puzzle Service - FSM and validation logic"""
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy.exc import IntegrityError
-from datetime import datetime
 from typing import Optional, Dict, Any
 from app.models.bedroom_puzzle import BedroomPuzzleState
 from app.models.game_session import GameSession
@@ -13,6 +10,8 @@ from app.schemas.bedroom_puzzle import (
     PuzzleStateDetail,
     PortaStateDetail
 )
+from app.services import persistence
+from app.services.puzzle_fsm import BEDROOM_FSM
 
 
 class BedroomPuzzleService:
@@ -27,9 +26,9 @@ class BedroomPuzzleService:
     """
     
     @staticmethod
-    def _get_led_states(puzzle_states: Dict[str, Any]) -> LEDStates:
+    def _get_led_states(state: BedroomPuzzleState) -> LEDStates:
         """
-        Convert puzzle states to LED colors.
+        Convert puzzle states to LED colors (tabella compilata in BEDROOM_FSM).
         
         Rules:
         - locked → off (per comodino, poltrona, ventola)
@@ -38,15 +37,7 @@ class BedroomPuzzleService:
         - done → green
         - porta locked → red, unlocked → green
         """
-        return LEDStates(
-            porta="green" if puzzle_states["porta"]["status"] == "unlocked" else "red",
-            materasso="green" if puzzle_states["materasso"]["status"] == "done" else 
-                     "red" if puzzle_states["materasso"]["status"] == "active" else "red",  # Red anche se locked (stato iniziale)
-            poltrona="green" if puzzle_states["poltrona"]["status"] == "done" else 
-                    "red" if puzzle_states["poltrona"]["status"] == "active" else "off",
-            ventola="green" if puzzle_states["ventola"]["status"] == "done" else 
-                   "red" if puzzle_states["ventola"]["status"] == "active" else "off"
-        )
+        return LEDStates(**BEDROOM_FSM.led_states(state))
     
     @staticmethod
     def _puzzle_states_to_schema(puzzle_states: Dict[str, Any]) -> BedroomPuzzleStates:
@@ -90,9 +81,7 @@ class BedroomPuzzleService:
             room_name="camera",
             puzzle_states=BedroomPuzzleState.get_initial_state()
         )
-        db.add(state)
-        db.commit()
-        db.refresh(state)
+        persistence.save(db, state)
         return state
     
     @staticmethod
@@ -108,15 +97,30 @@ class BedroomPuzzleService:
             BedroomPuzzleStateResponse with current state
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
-        
+        return BedroomPuzzleService._build_state_response(state)
+    
+    @staticmethod
+    def _build_state_response(state: BedroomPuzzleState) -> BedroomPuzzleStateResponse:
+        """Costruisce la response da un'istanza già caricata (nessuna query sullo stato)"""
         return BedroomPuzzleStateResponse(
             session_id=state.session_id,
             room_name=state.room_name,
             states=BedroomPuzzleService._puzzle_states_to_schema(state.puzzle_states),
-            led_states=BedroomPuzzleService._get_led_states(state.puzzle_states),
+            led_states=BedroomPuzzleService._get_led_states(state),
             updated_at=state.updated_at
         )
     
+    @staticmethod
+    def state_document(state: BedroomPuzzleState) -> Dict[str, Any]:
+        """Stessa forma di BedroomPuzzleStateResponse come dict pronto per fast_json"""
+        return {
+            "session_id": state.session_id,
+            "room_name": state.room_name,
+            "states": BEDROOM_FSM.states_document(state),
+            "led_states": BEDROOM_FSM.led_states(state),
+            "updated_at": state.updated_at
+        }
+    
     @staticmethod
     def validate_comodino_complete(db: Session, session_id: int) -> Optional[BedroomPuzzleStateResponse]:
         """
@@ -134,18 +138,11 @@ class BedroomPuzzleService:
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Atomic update - marca come done senza sbloccare altro
-        state.puzzle_states["comodino"]["status"] = "done"
-        state.puzzle_states["comodino"]["completed_at"] = datetime.utcnow().isoformat()
-        state.updated_at = datetime.utcnow()
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BEDROOM_FSM.apply(db, session_id, state, "comodino") is None:
+            return None
         
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        return BedroomPuzzleService.get_state_response(db, session_id)
+        return BedroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def validate_materasso_complete(db: Session, session_id: int) -> Optional[BedroomPuzzleStateResponse]:
@@ -166,23 +163,11 @@ class BedroomPuzzleService:
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if materasso is active
-        if state.puzzle_states["materasso"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
-        
-        # Atomic update
-        state.puzzle_states["materasso"]["status"] = "done"
-        state.puzzle_states["materasso"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["poltrona"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BEDROOM_FSM.apply(db, session_id, state, "materasso") is None:
+            return None
         
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        return BedroomPuzzleService.get_state_response(db, session_id)
+        return BedroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def validate_poltrona_complete(db: Session, session_id: int) -> Optional[BedroomPuzzleStateResponse]:
@@ -203,23 +188,11 @@ class BedroomPuzzleService:
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if poltrona is active
-        if state.puzzle_states["poltrona"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
-        
-        # Atomic update
-        state.puzzle_states["poltrona"]["status"] = "done"
-        state.puzzle_states["poltrona"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["ventola"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BEDROOM_FSM.apply(db, session_id, state, "poltrona") is None:
+            return None
         
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        return BedroomPuzzleService.get_state_response(db, session_id)
+        return BedroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def validate_ventola_complete(db: Session, session_id: int) -> Optional[BedroomPuzzleStateResponse]:
@@ -240,27 +213,11 @@ class BedroomPuzzleService:
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if ventola is active
-        if state.puzzle_states["ventola"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
-        
-        # Atomic update
-        state.puzzle_states["ventola"]["status"] = "done"
-        state.puzzle_states["ventola"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["porta"]["status"] = "unlocked"
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        # 🆕 Notifica game completion che camera è completata
-        from app.services.game_completion_service import GameCompletionService
-        GameCompletionService.mark_room_completed(db, session_id, "camera")
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if BEDROOM_FSM.apply(db, session_id, state, "ventola") is None:
+            return None
         
-        return BedroomPuzzleService.get_state_response(db, session_id)
+        return BedroomPuzzleService._build_state_response(state)
     
     @staticmethod
     def reset_puzzles(db: Session, session_id: int, level: str = "full", puzzles_to_reset: Optional[list] = None) -> BedroomPuzzleStateResponse:
@@ -278,28 +235,8 @@ class BedroomPuzzleService:
         """
         state = BedroomPuzzleService.get_or_create_state(db, session_id)
         
-        if level == "full":
-            # Full reset - back to initial state
-            state.puzzle_states = BedroomPuzzleState.get_initial_state()
-            
-            # 🆕 IMPORTANTE: Resetta ANCHE game_completion per questa stanza
-            # Altrimenti c'è inconsistenza tra bedroom_puzzles e game_completion
-            from app.services.game_completion_service import GameCompletionService
-            GameCompletionService.unmark_room_completed(db, session_id, "camera")
-            
-        elif level == "partial" and puzzles_to_reset:
-            # Partial reset - reset specific puzzles
-            initial = BedroomPuzzleState.get_initial_state()
-            for puzzle_name in puzzles_to_reset:
-                if puzzle_name in state.puzzle_states:
-                    state.puzzle_states[puzzle_name] = initial[puzzle_name]
-        
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
+        # Full reset: stato iniziale + game_completion della stanza (evita inconsistenze)
+        # Partial reset: solo i puzzle indicati
+        BEDROOM_FSM.reset(db, session_id, state, level, puzzles_to_reset)
         
-        return BedroomPuzzleService.get_state_response(db, session_id)
\ No newline at end of file
+        return BedroomPuzzleService._build_state_response(state)
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""Device Session Router - instradamento per sessione del traffico hardware (MQTT, polling ESP32)"""
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.device_session_binding import DeviceSessionBinding
+from app.models.game_session import GameSession
+from app.services import persistence
+from app.services.routing_sync import DEVICES, routing_sync
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TOPIC_ROOTS = [root.strip() for root in settings.mqtt_topic_roots.split(",") if root.strip()] or ["escape"]
+DEFAULT_TOPIC_ROOT = TOPIC_ROOTS[0]
+
+
+def canonical_topic(topic: str) -> str:
+    """Topic riportato sulla radice di default ("escape2/cucina/x" → "escape/cucina/x"): il catalogo elementi è unico"""
+    root, sep, rest = topic.partition("/")
+    if sep and root != DEFAULT_TOPIC_ROOT and root in TOPIC_ROOTS:
+        return f"{DEFAULT_TOPIC_ROOT}/{rest}"
+    return topic
+
+
+class DeviceRoute(NamedTuple):
+    session_id: int
+    topic_root: str
+
+
+class DeviceSessionRouter:
+    """
+    Indice in memoria della tabella device_session_bindings.
+
+    Risoluzione di un messaggio (device_id, topic_root) → session_id:
+    1. device associato esplicitamente → la sua sessione
+    2. radice topic usata dai device di UNA sola sessione → quella sessione
+    3. nessuna associazione → sessione attiva più recente senza device associati
+       (comportamento storico, disattivabile con MQTT_UNBOUND_FALLBACK=false)
+    Se la risoluzione è ambigua il messaggio non viene attribuito a nessuna
+    sessione: meglio perderlo che accendere i LED della casa sbagliata.
+    """
+
+    def __init__(self):
+        self._by_device: Dict[str, DeviceRoute] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_device)
+
+    def rebuild(self, db: Session) -> int:
+        """Ricarica tutte le associazioni (avvio)"""
+        rows = db.query(
+            DeviceSessionBinding.device_id, DeviceSessionBinding.session_id, DeviceSessionBinding.topic_root
+        ).all()
+        by_device = {device_id: DeviceRoute(session_id, topic_root) for device_id, session_id, topic_root in rows}
+        with self._lock:
+            self._by_device = by_device
+        logger.info(f"🔌 [DeviceRouter] Loaded {len(by_device)} device bindings")
+        return len(by_device)
+
+    # ------------------------------------------------------------------ binding
+
+    def bind(self, db: Session, device_id: str, session_id: int, topic_root: Optional[str] = None) -> DeviceSessionBinding:
+        """Associa (o riassocia) un device a una sessione"""
+        topic_root = topic_root or DEFAULT_TOPIC_ROOT
+        binding = db.query(DeviceSessionBinding).filter(DeviceSessionBinding.device_id == device_id).first()
+        if binding is None:
+            binding = DeviceSessionBinding(device_id=device_id, session_id=session_id, topic_root=topic_root)
+            db.add(binding)
+        else:
+            binding.session_id = session_id
+            binding.topic_root = topic_root
+        routing_sync.stage(db, DEVICES)
+        persistence.commit(db)
+        with self._lock:
+            self._by_device[device_id] = DeviceRoute(session_id, topic_root)
+        logger.info(f"🔌 [DeviceRouter] {device_id} → session {session_id} ({topic_root}/#)")
+        return binding
+
+    def unbind(self, db: Session, device_id: str, session_id: Optional[int] = None) -> bool:
+        """Rimuove l'associazione di un device (se session_id è dato, solo se appartiene a quella sessione)"""
+        query = db.query(DeviceSessionBinding).filter(DeviceSessionBinding.device_id == device_id)
+        if session_id is not None:
+            query = query.filter(DeviceSessionBinding.session_id == session_id)
+        deleted = query.delete(synchronize_session=False)
+        if deleted:
+            routing_sync.stage(db, DEVICES)
+        persistence.commit(db)
+        if deleted:
+            with self._lock:
+                self._by_device.pop(device_id, None)
+        return bool(deleted)
+
+    def release_session(self, db: Session, session_id: int) -> int:
+        """Libera i device di una sessione terminata (committato dal chiamante)"""
+        deleted = db.query(DeviceSessionBinding).filter(
+            DeviceSessionBinding.session_id == session_id
+        ).delete(synchronize_session=False)
+        if deleted:
+            routing_sync.stage(db, DEVICES)
+        self.forget_session(session_id)
+        return deleted
+
+    def forget_session(self, session_id: int):
+        with self._lock:
+            for device_id in [d for d, route in self._by_device.items() if route.session_id == session_id]:
+                del self._by_device[device_id]
+
+    def devices(self, session_id: int) -> Dict[str, str]:
+        """device_id → topic_root dei device di una sessione"""
+        with self._lock:
+            return {d: route.topic_root for d, route in self._by_device.items() if route.session_id == session_id}
+
+    # --------------------------------------------------------------- risoluzione
+
+    def _sessions_for_root(self, topic_root: str) -> Set[int]:
+        with self._lock:
+            return {route.session_id for route in self._by_device.values() if route.topic_root == topic_root}
+
+    def _bound_sessions(self) -> Set[int]:
+        with self._lock:
+            return {route.session_id for route in self._by_device.values()}
+
+    def resolve(self, db: Session, device_id: Optional[str] = None, topic_root: Optional[str] = None) -> Optional[int]:
+        """Sessione a cui appartiene il traffico di un device (None = nessuna / ambigua)"""
+        if device_id:
+            with self._lock:
+                route = self._by_device.get(device_id)
+            if route is not None:
+                return route.session_id
+
+        root = topic_root or DEFAULT_TOPIC_ROOT
+        claimed = self._sessions_for_root(root)
+        if len(claimed) == 1:
+            return next(iter(claimed))
+        if len(claimed) > 1:
+            logger.warning(f"⚠️ [DeviceRouter] {root}/# shared by sessions {sorted(claimed)}: unbound device {device_id or '?'} ignored")
+            return None
+
+        if not settings.mqtt_unbound_fallback:
+            return None
+        return self._latest_unbound_session(db)
+
+    def _latest_unbound_session(self, db: Session) -> Optional[int]:
+        """Sessione attiva più recente che non ha device associati (ordine deterministico)"""
+        query = db.query(GameSession.id).filter(GameSession.end_time == None)
+        bound = self._bound_sessions()
+        if bound:
+            query = query.filter(GameSession.id.notin_(bound))
+        row = query.order_by(GameSession.start_time.desc(), GameSession.id.desc()).first()
+        return row[0] if row else None
+
+    def topic_roots(self, session_id: int) -> List[str]:
+        """
+        Radici MQTT su cui pubblicare lo stato di una sessione.
+
+        Le radici dei suoi device; senza device la radice di default, purché
+        nessun'altra sessione l'abbia rivendicata.
+        """
+        with self._lock:
+            roots = {route.topic_root for route in self._by_device.values() if route.session_id == session_id}
+            if roots:
+                return sorted(roots)
+            if any(route.topic_root == DEFAULT_TOPIC_ROOT for route in self._by_device.values()):
+                return []
+        return [DEFAULT_TOPIC_ROOT]
+
+
+device_session_router = DeviceSessionRouter()
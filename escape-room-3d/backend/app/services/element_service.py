@@ -1,12 +1,20 @@
+from sqlalchemy import bindparam, cast, func, update
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from app.models.element import Element
 from app.schemas.element import ElementCreate, ElementUpdate, ElementStateUpdate
 import logging
+from app.services import persistence
 
 logger = logging.getLogger(__name__)
 
 
+def _merged_state(table, patch):
+    """Espressione SQL `coalesce(current_state, '{}'::jsonb) || patch`"""
+    return func.coalesce(table.c.current_state, cast({}, JSONB)).op("||")(patch)
+
+
 class ElementService:
     def __init__(self, db: Session):
         self.db = db
@@ -25,9 +33,7 @@ class ElementService:
 
     def create(self, element_data: ElementCreate) -> Element:
         element = Element(**element_data.model_dump())
-        self.db.add(element)
-        self.db.commit()
-        self.db.refresh(element)
+        persistence.save(self.db, element)
         logger.info(f"Created element: {element.name} in room {element.room_id}")
         return element
 
@@ -40,8 +46,7 @@ class ElementService:
         for field, value in update_data.items():
             setattr(element, field, value)
         
-        self.db.commit()
-        self.db.refresh(element)
+        persistence.commit(self.db)
         logger.info(f"Updated element: {element.name}")
         return element
 
@@ -51,21 +56,57 @@ class ElementService:
             return None
         
         element.current_state = state_data.current_state
-        self.db.commit()
-        self.db.refresh(element)
+        persistence.commit(self.db)
         logger.info(f"Updated state for element: {element.name}")
         return element
 
-    def update_state_by_topic(self, topic: str, state: Dict[str, Any]) -> Optional[Element]:
-        element = self.get_by_mqtt_topic(topic)
-        if not element:
-            return None
-        
-        element.current_state = {**element.current_state, **state}
+    def merge_state(self, element_id: int, patch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Merge di `patch` in current_state eseguito dal database con un solo statement:
+        UPDATE elements SET current_state = coalesce(current_state, '{}') || :patch ... RETURNING current_state
+
+        Niente read-modify-write in Python: aggiornamenti concorrenti di chiavi diverse
+        non si sovrascrivono. Restituisce lo stato risultante, None se l'elemento non esiste.
+        """
+        table = Element.__table__
+        merged = self.db.execute(
+            update(table)
+            .where(table.c.id == element_id)
+            .values(current_state=_merged_state(table, bindparam("patch", type_=JSONB)))
+            .returning(table.c.current_state),
+            {"patch": patch}
+        ).scalar_one_or_none()
         self.db.commit()
-        self.db.refresh(element)
-        logger.info(f"Updated state for element via MQTT: {element.name}")
-        return element
+        return merged
+
+    def merge_states(self, patches: Dict[int, Dict[str, Any]]) -> int:
+        """
+        Variante batch di merge_state: un UPDATE eseguito in executemany, un solo commit.
+
+        Args:
+            patches: {element_id: patch}
+
+        Returns:
+            Numero di elementi aggiornati
+        """
+        if not patches:
+            return 0
+
+        table = Element.__table__
+        result = self.db.execute(
+            update(table)
+            .where(table.c.id == bindparam("element_id"))
+            .values(current_state=_merged_state(table, bindparam("patch", type_=JSONB))),
+            [{"element_id": element_id, "patch": patch} for element_id, patch in patches.items()]
+        )
+        self.db.commit()
+        return result.rowcount
+
+    def update_state_by_topic(self, topic: str, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        element_id = self.db.query(Element.id).filter(Element.mqtt_topic == topic).order_by(Element.id).scalar()
+        if element_id is None:
+            return None
+        return self.merge_state(element_id, state)
 
     def delete(self, element_id: int) -> bool:
         element = self.get_by_id(element_id)
@@ -0,0 +1,136 @@
+"""Element Topic Index - risoluzione in memoria topic MQTT → elemento"""
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.element import Element
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedElement(NamedTuple):
+    """Vista leggera di un elemento (niente oggetti ORM legati a una sessione chiusa)"""
+    id: int
+    name: str
+    room_id: int
+
+
+class ElementTopicIndex:
+    """
+    Indice `mqtt_topic → IndexedElement` costruito all'avvio dalla tabella elements.
+
+    Il path MQTT risolve il topic senza query: i topic che non corrispondono a
+    nessun elemento (la maggior parte del traffico escape/#) vengono scartati
+    senza aprire una sessione DB. Gli endpoint create/update/delete di
+    /elements (e delete di /rooms) mantengono l'indice allineato; i listener (route MQTT per
+    elemento) vengono avvisati a ogni modifica.
+    """
+
+    def __init__(self):
+        self._by_topic: Dict[str, IndexedElement] = {}   # topic → elemento risolto (id più basso)
+        self._ids_by_topic: Dict[str, List[int]] = {}    # topic → id ordinati
+        self._elements: Dict[int, IndexedElement] = {}
+        self._topic_by_id: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._by_topic)
+
+    def rebuild(self, db: Session) -> int:
+        """Ricostruisce l'indice leggendo tutti gli elementi con un topic MQTT"""
+        rows = db.query(Element.id, Element.name, Element.room_id, Element.mqtt_topic).filter(
+            Element.mqtt_topic.isnot(None)
+        ).all()
+
+        elements = {}
+        topic_by_id = {}
+        ids_by_topic: Dict[str, List[int]] = {}
+        for element_id, name, room_id, topic in rows:
+            elements[element_id] = IndexedElement(element_id, name, room_id)
+            topic_by_id[element_id] = topic
+            ids_by_topic.setdefault(topic, []).append(element_id)
+        for ids in ids_by_topic.values():
+            ids.sort()
+        # Stesso comportamento della vecchia query .first(): vince l'id più basso
+        by_topic = {topic: elements[ids[0]] for topic, ids in ids_by_topic.items()}
+
+        with self._lock:
+            self._by_topic = by_topic
+            self._ids_by_topic = ids_by_topic
+            self._elements = elements
+            self._topic_by_id = topic_by_id
+
+        logger.info(f"🗂️ [ElementTopicIndex] Indexed {len(by_topic)} MQTT topics")
+        self._notify()
+        return len(by_topic)
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return sorted(self._by_topic)
+
+    def add_listener(self, listener: Callable[[], None]):
+        """Chiamato dopo ogni modifica dell'indice (anche dal threadpool degli endpoint sync)"""
+        self._listeners.append(listener)
+
+    def _notify(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"❌ [ElementTopicIndex] Listener failed: {e}")
+
+    def resolve(self, topic: str) -> Optional[IndexedElement]:
+        return self._by_topic.get(topic)
+
+    def upsert(self, element: Element):
+        """Aggiorna l'indice dopo la creazione/modifica di un elemento"""
+        with self._lock:
+            self._discard(element.id)
+            if element.mqtt_topic:
+                topic = element.mqtt_topic
+                self._elements[element.id] = IndexedElement(element.id, element.name, element.room_id)
+                self._topic_by_id[element.id] = topic
+                bisect.insort(self._ids_by_topic.setdefault(topic, []), element.id)
+                self._resolve_topic(topic)
+        self._notify()
+
+    def remove(self, element_id: int):
+        """Rimuove un elemento eliminato dall'indice"""
+        with self._lock:
+            self._discard(element_id)
+        self._notify()
+
+    def remove_room(self, room_id: int) -> int:
+        """Rimuove gli elementi di una stanza eliminata (cascade sul DB), un solo avviso ai listener"""
+        with self._lock:
+            element_ids = [element_id for element_id, indexed in self._elements.items() if indexed.room_id == room_id]
+            for element_id in element_ids:
+                self._discard(element_id)
+        if element_ids:
+            self._notify()
+        return len(element_ids)
+
+    def _discard(self, element_id: int):
+        self._elements.pop(element_id, None)
+        topic = self._topic_by_id.pop(element_id, None)
+        if topic is None:
+            return
+        ids = self._ids_by_topic.get(topic, [])
+        if element_id in ids:
+            ids.remove(element_id)
+        # Il topic passa al prossimo id più basso (se c'è)
+        self._resolve_topic(topic)
+
+    def _resolve_topic(self, topic: str):
+        ids = self._ids_by_topic.get(topic)
+        if ids:
+            self._by_topic[topic] = self._elements[ids[0]]
+        else:
+            self._ids_by_topic.pop(topic, None)
+            self._by_topic.pop(topic, None)
+
+element_topic_index = ElementTopicIndex()
@@ -0,0 +1,167 @@
+"""Event Partition Service - Partizioni mensili, retention e archiviazione della tabella events"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "events_"
+_PARTITION_NAME_RE = re.compile(r"^events_(\d{4})_(\d{2})$")
+
+
+def _month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value: date, months: int) -> date:
+    month_index = value.year * 12 + (value.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+class EventPartitionService:
+    """
+    Gestione delle partizioni mensili della tabella `events`.
+
+    - ensure_partitions: crea in anticipo le partizioni del mese corrente e dei successivi
+      (gli INSERT dal path MQTT non devono mai trovare un mese senza partizione)
+    - archive_expired_partitions: esporta le partizioni più vecchie della retention in un
+      file JSON Lines compresso (gzip), poi DETACH + DROP della partizione
+
+    Le query su events filtrano sempre per `timestamp` così PostgreSQL
+    esclude automaticamente le partizioni non coinvolte (partition pruning).
+    """
+
+    @staticmethod
+    def partition_name(month_start: date) -> str:
+        """Nome della partizione per un mese, es. events_2026_10"""
+        return f"{PARTITION_PREFIX}{month_start.year:04d}_{month_start.month:02d}"
+
+    @staticmethod
+    def parse_partition_name(name: str) -> Optional[date]:
+        """Inverso di partition_name: restituisce il primo giorno del mese o None"""
+        match = _PARTITION_NAME_RE.match(name)
+        if not match:
+            return None
+        return date(int(match.group(1)), int(match.group(2)), 1)
+
+    @staticmethod
+    def ensure_partitions(db: Session, months_ahead: int = 1, today: Optional[date] = None) -> List[str]:
+        """
+        Crea (se mancanti) le partizioni dal mese corrente fino a `months_ahead` mesi in avanti.
+
+        Returns:
+            Lista dei nomi delle partizioni garantite
+        """
+        current = _month_start(today or datetime.utcnow().date())
+        names = []
+
+        for offset in range(months_ahead + 1):
+            start = _add_months(current, offset)
+            end = _add_months(start, 1)
+            name = EventPartitionService.partition_name(start)
+            db.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF events '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            names.append(name)
+
+        db.commit()
+        return names
+
+    @staticmethod
+    def list_partitions(db: Session) -> List[Tuple[str, date]]:
+        """Partizioni mensili attualmente collegate a events, ordinate per mese"""
+        rows = db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'events'"
+        )).fetchall()
+
+        partitions = []
+        for (name,) in rows:
+            month = EventPartitionService.parse_partition_name(name)
+            if month is not None:
+                partitions.append((name, month))
+
+        return sorted(partitions, key=lambda item: item[1])
+
+    @staticmethod
+    def _export_partition(db: Session, name: str, archive_dir: str) -> Tuple[str, int]:
+        """
+        Scrive tutte le righe della partizione in `<archive_dir>/<name>.jsonl.gz`.
+
+        Il file viene scritto su un .tmp e rinominato solo a export completato,
+        così un crash a metà non lascia mai un archivio troncato con il nome finale.
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+        final_path = os.path.join(archive_dir, f"{name}.jsonl.gz")
+        tmp_path = final_path + ".tmp"
+
+        result = db.execute(text(
+            f'SELECT id, element_id, session_id, timestamp, action, value FROM "{name}" ORDER BY timestamp, id'
+        ).execution_options(stream_results=True, yield_per=1000))
+
+        count = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+            for row in result:
+                archive.write(json.dumps({
+                    "id": row.id,
+                    "element_id": row.element_id,
+                    "session_id": row.session_id,
+                    "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+                    "action": row.action,
+                    "value": row.value
+                }, separators=(",", ":")))
+                archive.write("\n")
+                count += 1
+
+        os.replace(tmp_path, final_path)
+        return final_path, count
+
+    @staticmethod
+    def archive_expired_partitions(
+        db: Session,
+        retention_months: int,
+        archive_dir: str,
+        today: Optional[date] = None
+    ) -> List[dict]:
+        """
+        Archivia e rimuove le partizioni interamente più vecchie di `retention_months`.
+
+        Con retention_months=3 e oggi = ottobre, vengono archiviate le partizioni
+        fino a giugno compreso (luglio, agosto, settembre e ottobre restano online).
+
+        Returns:
+            Lista di {"partition", "archive", "rows"} per ogni partizione archiviata
+        """
+        cutoff = _add_months(_month_start(today or datetime.utcnow().date()), -retention_months)
+        archived = []
+
+        for name, month in EventPartitionService.list_partitions(db):
+            if month >= cutoff:
+                continue
+
+            path, count = EventPartitionService._export_partition(db, name, archive_dir)
+
+            db.execute(text(f'ALTER TABLE events DETACH PARTITION "{name}"'))
+            db.execute(text(f'DROP TABLE "{name}"'))
+            db.commit()
+
+            logger.info(f"📦 [EventPartition] Archived {name}: {count} rows → {path}")
+            archived.append({"partition": name, "archive": path, "rows": count})
+
+        return archived
+
+    @staticmethod
+    def run_maintenance(db: Session, retention_months: int, archive_dir: str) -> List[dict]:
+        """Job periodico: prima garantisce le partizioni future, poi applica la retention"""
+        EventPartitionService.ensure_partitions(db)
+        return EventPartitionService.archive_expired_partitions(db, retention_months, archive_dir)
@@ -1,8 +1,11 @@
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 from app.models.event import Event
 from app.schemas.event import EventCreate
 import logging
+from app.services import persistence
 
 logger = logging.getLogger(__name__)
 
@@ -17,19 +20,35 @@ class EventService:
     def get_by_id(self, event_id: int) -> Optional[Event]:
         return self.db.query(Event).filter(Event.id == event_id).first()
 
-    def get_by_session(self, session_id: int) -> List[Event]:
-        return self.db.query(Event).filter(Event.session_id == session_id).order_by(Event.timestamp.desc()).all()
-
-    def get_by_element(self, element_id: int) -> List[Event]:
-        return self.db.query(Event).filter(Event.element_id == element_id).order_by(Event.timestamp.desc()).all()
+    def _paginate(self, query, limit: int, before: Optional[datetime], since: Optional[datetime], before_id: Optional[int] = None):
+        # Filtri su timestamp → PostgreSQL scarta le partizioni mensili fuori intervallo
+        if before is not None:
+            if before_id is not None:
+                # Cursore keyset (timestamp, id): gli eventi con lo stesso timestamp
+                # del confine (insert in batch) non vengono saltati tra una pagina e l'altra
+                query = query.filter(
+                    Event.timestamp <= before,
+                    tuple_(Event.timestamp, Event.id) < tuple_(before, before_id)
+                )
+            else:
+                query = query.filter(Event.timestamp < before)
+        if since is not None:
+            query = query.filter(Event.timestamp >= since)
+        return query.order_by(Event.timestamp.desc(), Event.id.desc()).limit(limit).all()
+
+    def get_by_session(self, session_id: int, limit: int = 100, before: Optional[datetime] = None, since: Optional[datetime] = None, before_id: Optional[int] = None) -> List[Event]:
+        query = self.db.query(Event).filter(Event.session_id == session_id)
+        return self._paginate(query, limit, before, since, before_id)
+
+    def get_by_element(self, element_id: int, limit: int = 100, before: Optional[datetime] = None, since: Optional[datetime] = None, before_id: Optional[int] = None) -> List[Event]:
+        query = self.db.query(Event).filter(Event.element_id == element_id)
+        return self._paginate(query, limit, before, since, before_id)
 
     def create(self, event_data: EventCreate) -> Event:
         event = Event(**event_data.model_dump())
-        self.db.add(event)
-        self.db.commit()
-        self.db.refresh(event)
+        persistence.save(self.db, event)
         logger.info(f"Created event: {event.action} for element {event.element_id}")
         return event
 
-    def get_recent(self, limit: int = 100) -> List[Event]:
-        return self.db.query(Event).order_by(Event.timestamp.desc()).limit(limit).all()
+    def get_recent(self, limit: int = 100, before: Optional[datetime] = None, since: Optional[datetime] = None, before_id: Optional[int] = None) -> List[Event]:
+        return self._paginate(self.db.query(Event), limit, before, since, before_id)
@@ -0,0 +1,142 @@
+"""Event Sink - scrittura write-behind e in batch degli eventi MQTT"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.event import Event
+from app.schemas.event import EventCreate
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class EventSink:
+    """
+    Buffer asincrono per gli eventi generati dal path MQTT.
+
+    Invece di una transazione (INSERT + COMMIT + SELECT di refresh) per ogni
+    messaggio, gli eventi vengono accodati e scritti con un unico INSERT multi-riga
+    ogni `flush_interval_ms` millisecondi oppure appena si raggiungono `batch_size` record.
+
+    - Backpressure: la coda è limitata (`max_queue`); `enqueue` attende se è piena
+    - Timestamp: assegnato all'arrivo del messaggio, non al momento del flush
+    - Shutdown: `stop()` svuota la coda e scrive l'ultimo batch
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval_ms: int = 250, max_queue: int = 5000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Event sink started (batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval * 1000:.0f}ms, max_queue={self.max_queue})"
+        )
+
+    async def stop(self):
+        if not self._task:
+            return
+        # Sentinel: il worker scrive tutto ciò che è in coda e termina
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(f"Event sink stopped: {self.stats}")
+
+    async def enqueue(self, event_data: EventCreate):
+        """Accoda un evento. Se la coda è piena attende (backpressure verso il consumer MQTT)."""
+        row = event_data.model_dump()
+        row["timestamp"] = datetime.now(timezone.utc)
+
+        if not self.running:
+            # Sink non avviato (es. script/test): scrittura diretta
+            await asyncio.to_thread(self._write_batch, [row])
+            return
+
+        await self._queue.put(row)
+        self.stats["enqueued"] += 1
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Eventuali eventi arrivati dopo il sentinel
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        if remaining:
+            await self._flush(remaining)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            logger.debug(f"Event sink flushed {len(batch)} events")
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error(f"Event sink flush failed ({len(batch)} events lost): {e}")
+
+    @staticmethod
+    def _write_batch(rows: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            # executemany → INSERT ... VALUES (...), (...), ... in un'unica transazione
+            db.execute(insert(Event), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+event_sink = EventSink(
+    batch_size=settings.event_batch_size,
+    flush_interval_ms=settings.event_flush_interval_ms,
+    max_queue=settings.event_queue_max
+)
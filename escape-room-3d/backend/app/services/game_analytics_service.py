@@ -0,0 +1,186 @@
+"""Game Analytics Service - tempi di enigmi, stanze e vittorie aggregati a ogni transizione"""
+import logging
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, String, cast, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.analytics import AnalyticsAggregate
+from app.models.game_session import GameSession
+
+logger = logging.getLogger(__name__)
+
+METRIC_PUZZLE = "puzzle_solve"
+METRIC_ROOM = "room_completion"
+METRIC_VICTORY = "victory"
+PERIODS = ("day", "week")
+
+# Sketch a bucket logaritmici: ogni percentile ha errore relativo ≤ SKETCH_ACCURACY
+SKETCH_ACCURACY = 0.05
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+QUANTILES = (0.5, 0.9, 0.95)
+
+
+def sketch_bucket(seconds: float) -> int:
+    """Indice del bucket di un valore (bucket 0 = sotto il secondo)"""
+    if seconds <= 1:
+        return 0
+    return math.ceil(math.log(seconds) / _LOG_GAMMA)
+
+
+def sketch_value(bucket: int) -> float:
+    """Valore rappresentativo di un bucket (centro in scala logaritmica)"""
+    if bucket <= 0:
+        return 1.0
+    return 2 * _GAMMA ** bucket / (_GAMMA + 1)
+
+
+def sketch_quantile(sketch: Dict[str, int], q: float) -> Optional[float]:
+    """Quantile q (0..1) da uno sketch {bucket: conteggio}"""
+    buckets = sorted((int(bucket), count) for bucket, count in sketch.items())
+    total = sum(count for _, count in buckets)
+    if total == 0:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        if seen > rank:
+            return round(sketch_value(bucket), 1)
+    return round(sketch_value(buckets[-1][0]), 1)
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def period_start(period: str, day: date) -> date:
+    """Primo giorno del periodo: il giorno stesso o il lunedì della settimana"""
+    return day - timedelta(days=day.weekday()) if period == "week" else day
+
+
+class GameAnalyticsService:
+    """
+    Aggregati mantenuti in modo incrementale: ogni campione è un solo
+    INSERT ... ON CONFLICT DO UPDATE (giorno + settimana) nella transazione
+    della transizione che lo genera. Le dashboard leggono solo le righe
+    del periodo richiesto, mai i JSON delle sessioni storiche.
+
+    Campioni:
+    - puzzle_solve: secondi tra lo sblocco dell'enigma (ultima scrittura della
+      riga della stanza) e la sua risoluzione
+    - room_completion: secondi dall'inizio della sessione al completamento della stanza
+    - victory: secondi dall'inizio della sessione alla vittoria
+    """
+
+    @staticmethod
+    def stage_sample(db: Session, metric: str, subject: str, seconds: float, at: datetime):
+        """Aggiunge un campione agli aggregati del giorno e della settimana (senza commit)"""
+        seconds = max(0.0, float(seconds))
+        bucket = str(sketch_bucket(seconds))
+        day = at.date()
+        rows = [{
+            "metric": metric,
+            "subject": subject,
+            "period": period,
+            "period_start": period_start(period, day),
+            "count": 1,
+            "total_seconds": seconds,
+            "min_seconds": seconds,
+            "max_seconds": seconds,
+            "sketch": {bucket: 1},
+            "updated_at": at
+        } for period in PERIODS]
+
+        table = AnalyticsAggregate.__table__
+        stmt = pg_insert(AnalyticsAggregate).values(rows).on_conflict_do_update(
+            constraint="uq_analytics_aggregates_key",
+            set_={
+                "count": table.c.count + 1,
+                "total_seconds": table.c.total_seconds + seconds,
+                "min_seconds": func.least(table.c.min_seconds, seconds),
+                "max_seconds": func.greatest(table.c.max_seconds, seconds),
+                "sketch": table.c.sketch.op("||")(func.jsonb_build_object(
+                    cast(bucket, String), func.coalesce(table.c.sketch[bucket].astext.cast(Integer), 0) + 1
+                )),
+                "updated_at": at
+            }
+        )
+        db.execute(stmt)
+
+    @staticmethod
+    def stage_puzzle_solved(db: Session, room: str, puzzle: str, unlocked_at: Optional[datetime], solved_at: datetime):
+        unlocked_at = _naive_utc(unlocked_at)
+        if unlocked_at is None:
+            return
+        GameAnalyticsService.stage_sample(
+            db, METRIC_PUZZLE, f"{room}/{puzzle}", (solved_at - unlocked_at).total_seconds(), solved_at
+        )
+
+    @staticmethod
+    def _session_elapsed(db: Session, session_id: int, at: datetime) -> Optional[float]:
+        start_time = _naive_utc(db.query(GameSession.start_time).filter(GameSession.id == session_id).scalar())
+        if start_time is None:
+            return None
+        return (at - start_time).total_seconds()
+
+    @staticmethod
+    def stage_room_completed(db: Session, session_id: int, room: str, won: bool, at: datetime):
+        """Completamento stanza (+ vittoria se è l'ultima stanza): tempo dall'inizio della sessione"""
+        elapsed = GameAnalyticsService._session_elapsed(db, session_id, at)
+        if elapsed is None:
+            return
+        GameAnalyticsService.stage_sample(db, METRIC_ROOM, room, elapsed, at)
+        if won:
+            GameAnalyticsService.stage_sample(db, METRIC_VICTORY, "game", elapsed, at)
+
+    @staticmethod
+    def stage_session_sample(db: Session, session_id: int, metric: str, subject: str, at: datetime):
+        """Campione misurato dall'inizio della sessione (es. enigma dell'esterno)"""
+        elapsed = GameAnalyticsService._session_elapsed(db, session_id, at)
+        if elapsed is not None:
+            GameAnalyticsService.stage_sample(db, metric, subject, elapsed, at)
+
+    # ------------------------------------------------------------------ lettura
+
+    @staticmethod
+    def summarize(row: AnalyticsAggregate) -> Dict[str, Any]:
+        summary = {
+            "count": row.count,
+            "mean_seconds": round(row.total_seconds / row.count, 1) if row.count else None,
+            "min_seconds": row.min_seconds,
+            "max_seconds": row.max_seconds
+        }
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}_seconds"] = sketch_quantile(row.sketch or {}, q)
+        return summary
+
+    @staticmethod
+    def dashboard(db: Session, period: str = "week", day: Optional[date] = None) -> Dict[str, Any]:
+        """Tutte le metriche di un giorno/settimana: solo le righe di quel periodo (indice period, period_start)"""
+        start = period_start(period, day or datetime.utcnow().date())
+        rows = db.query(AnalyticsAggregate).filter(
+            AnalyticsAggregate.period == period,
+            AnalyticsAggregate.period_start == start
+        ).all()
+
+        metrics: Dict[str, Dict[str, Any]] = {METRIC_PUZZLE: {}, METRIC_ROOM: {}, METRIC_VICTORY: {}}
+        for row in rows:
+            metrics.setdefault(row.metric, {})[row.subject] = GameAnalyticsService.summarize(row)
+        return {"period": period, "period_start": start.isoformat(), "metrics": metrics}
+
+    @staticmethod
+    def trend(db: Session, metric: str, subject: str, period: str = "day", limit: int = 30) -> List[Dict[str, Any]]:
+        """Serie storica di un soggetto: gli ultimi `limit` periodi, dal più recente"""
+        rows = db.query(AnalyticsAggregate).filter(
+            AnalyticsAggregate.metric == metric,
+            AnalyticsAggregate.subject == subject,
+            AnalyticsAggregate.period == period
+        ).order_by(AnalyticsAggregate.period_start.desc()).limit(limit).all()
+        return [{"period_start": row.period_start.isoformat(), **GameAnalyticsService.summarize(row)} for row in rows]
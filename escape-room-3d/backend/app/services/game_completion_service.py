@@ -1,13 +1,18 @@
 """Game Completion Service - Coordinates all room completions"""
+from sqlalchemy import and_, case, cast
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
 from datetime import datetime
-from typing import Dict
-from app.models.game_completion import GameCompletionState
+from typing import Dict, Optional, Tuple
+from app.models.game_completion import GameCompletionState, ROOM_BITS, ALL_ROOMS_MASK
 from app.models.kitchen_puzzle import KitchenPuzzleState
 from app.models.bedroom_puzzle import BedroomPuzzleState
 from app.models.bathroom_puzzle import BathroomPuzzleState
 from app.models.livingroom_puzzle import LivingRoomPuzzleState
+from app.services import persistence
+from app.services.game_analytics_service import GameAnalyticsService
+from app.services.session_state_store import PendingEvent, session_state_store
 
 
 class GameCompletionService:
@@ -46,9 +51,7 @@ class GameCompletionService:
             rooms_status=GameCompletionState.get_initial_state(),
             game_won=False
         )
-        db.add(state)
-        db.commit()
-        db.refresh(state)
+        persistence.save(db, state)
         return state
     
     @staticmethod
@@ -113,39 +116,115 @@ class GameCompletionService:
         return False
     
     @staticmethod
-    def mark_room_completed(db: Session, session_id: int, room_name: str):
+    def stage_room_completion(
+        db: Session,
+        session_id: int,
+        room_name: str,
+        completed: bool
+    ) -> Tuple[Optional[GameCompletionState], Optional[PendingEvent]]:
         """
-        Mark a room as completed and check for game victory.
+        Aggiorna il completamento di una stanza nella transazione corrente (senza commit).
         
-        This is called by individual room puzzle services when
-        their final puzzle is solved.
-        """
-        state = GameCompletionService.get_or_create_state(db, session_id)
+        Un solo statement: INSERT ... ON CONFLICT (session_id) DO UPDATE che
+        imposta/azzera il bit della stanza, incrementa version e ricava game_won
+        dalla nuova maschera. Usato dall'FSM delle stanze per scrivere il
+        completamento insieme all'ultima transizione del puzzle.
         
-        # Update room status
-        if room_name not in state.rooms_status:
-            return  # Invalid room name
+        Idempotente: su una stanza già completata il ramo UPDATE non scatta
+        (WHERE completed_mask & bit = 0), quindi niente version, completion_time,
+        evento né analytics duplicati.
         
-        state.rooms_status[room_name] = {
-            "completed": True,
-            "completion_time": datetime.utcnow().isoformat()
+        Returns:
+            (stato aggiornato, evento di stato da proiettare dopo il commit),
+            (stato attuale, None) se la stanza era già completata,
+            (None, None) se room_name non è una stanza valida
+        """
+        bit = ROOM_BITS.get(room_name)
+        if bit is None:
+            return None, None  # Invalid room name
+        
+        table = GameCompletionState.__table__
+        now = datetime.utcnow()
+        room_status = {
+            "completed": completed,
+            "completion_time": now.isoformat() if completed else None
         }
         
-        # Check if game is now won (all 4 rooms completed)
-        if state.is_game_complete() and not state.game_won:
-            state.game_won = True
-            state.victory_time = datetime.utcnow()
+        if completed:
+            new_mask = table.c.completed_mask.op("|")(bit)
+            changes = table.c.completed_mask.op("&")(bit) == 0
+            game_won = new_mask == ALL_ROOMS_MASK
+            victory_time = case(
+                (and_(table.c.game_won.is_(False), new_mask == ALL_ROOMS_MASK), now),
+                else_=table.c.victory_time
+            )
+        else:
+            new_mask = table.c.completed_mask.op("&")(ALL_ROOMS_MASK & ~bit)
+            game_won = False
+            victory_time = None
+            changes = None
+        
+        initial_status = GameCompletionState.get_initial_state()
+        initial_status[room_name] = room_status
+        
+        stmt = pg_insert(GameCompletionState).values(
+            session_id=session_id,
+            rooms_status=initial_status,
+            completed_mask=bit if completed else 0,
+            version=1,
+            game_won=False,
+            created_at=now,
+            updated_at=now
+        ).on_conflict_do_update(
+            index_elements=[table.c.session_id],
+            set_={
+                "rooms_status": table.c.rooms_status.op("||")(cast({room_name: room_status}, JSONB)),
+                "completed_mask": new_mask,
+                "version": table.c.version + 1,
+                "game_won": game_won,
+                "victory_time": victory_time,
+                "updated_at": now
+            },
+            where=changes
+        ).returning(GameCompletionState)
+        
+        state = db.scalars(stmt, execution_options={"populate_existing": True}).one_or_none()
+        if state is None:
+            # Stanza già completata: nessuna riga aggiornata
+            existing = db.query(GameCompletionState).filter(GameCompletionState.session_id == session_id).first()
+            return existing, None
+        
+        won_now = completed and state.game_won and state.victory_time == now
+        if won_now:
             print(f"🏆 [GameCompletion] Session {session_id} - GAME WON!")
+        if completed:
+            # Tempi di stanza/vittoria negli aggregati analytics, stessa transazione
+            GameAnalyticsService.stage_room_completed(db, session_id, room_name, won_now, now)
+        
+        event = session_state_store.stage(
+            db, session_id, "room_completion",
+            {"completed": completed, "game_won": state.game_won, "version": state.version},
+            room=room_name
+        )
+        return state, event
+    
+    @staticmethod
+    def mark_room_completed(db: Session, session_id: int, room_name: str):
+        """
+        Mark a room as completed and check for game victory.
         
-        state.updated_at = datetime.utcnow()
-        flag_modified(state, "rooms_status")
+        I servizi puzzle passano dall'FSM (stesso commit della transizione);
+        questo metodo resta per le chiamate isolate (admin, script).
+        """
+        state, event = GameCompletionService.stage_room_completion(db, session_id, room_name, True)
+        if event is None:
+            # Stanza non valida o già completata: nulla da scrivere
+            return state
         
-        db.commit()
-        db.refresh(state)
+        persistence.commit(db)
+        session_state_store.apply(db, event)
         
         # ✅ WebSocket broadcast is now handled by the API endpoint (async context)
-        # No longer trying to broadcast from this SYNC service method
-        
         return state
     
     @staticmethod
@@ -156,36 +235,21 @@ class GameCompletionService:
         This is called when resetting puzzles to ensure
         game_completion state stays in sync.
         """
-        state = GameCompletionService.get_or_create_state(db, session_id)
-        
-        # Update room status
-        if room_name not in state.rooms_status:
-            return  # Invalid room name
-        
-        state.rooms_status[room_name] = {
-            "completed": False,
-            "completion_time": None
-        }
-        
-        # If game was won, reset it
-        if state.game_won:
-            state.game_won = False
-            state.victory_time = None
-            print(f"🔄 [GameCompletion] Session {session_id} - Game victory reset")
-        
-        state.updated_at = datetime.utcnow()
-        flag_modified(state, "rooms_status")
-        
-        db.commit()
-        db.refresh(state)
+        state, event = GameCompletionService.stage_room_completion(db, session_id, room_name, False)
+        if state is None:
+            return None
         
-        # ✅ WebSocket broadcast is now handled by the API endpoint (async context)
-        # No longer trying to broadcast from this SYNC service method
+        persistence.commit(db)
+        session_state_store.apply(db, event)
         
         return state
     
     @staticmethod
-    def get_door_led_states(db: Session, session_id: int) -> Dict[str, str]:
+    def get_door_led_states(
+        db: Session,
+        session_id: int,
+        state: Optional[GameCompletionState] = None
+    ) -> Dict[str, str]:
         """
         Calculate LED states for all 4 door LEDs.
         
@@ -197,32 +261,33 @@ class GameCompletionService:
         - Room not completed → "red"
         - Room completed, game not won → "blinking" (only this room)
         - Game won (all 4 completed) → "green" (all rooms)
-        """
-        print(f"\n🔍 [get_door_led_states] Calculating for session {session_id}")
-        state = GameCompletionService.get_or_create_state(db, session_id)
-        print(f"🔍 [get_door_led_states] game_won={state.game_won}, rooms_status={state.rooms_status}")
-        
-        led_states = {}
-        
-        for room_name in ["cucina", "camera", "bagno", "soggiorno"]:
-            # 🆕 FIX: Check REAL puzzle state instead of trusting cached value
-            room_completed = GameCompletionService._is_room_completed(db, session_id, room_name)
-            print(f"🔍 [get_door_led_states] {room_name}: room_completed={room_completed}")
-            
-            if state.game_won:
-                # Game won → all doors green (GLOBAL)
-                led_states[room_name] = "green"
-            elif room_completed:
-                # Room completed but game not won → blinking (PER-ROOM)
-                led_states[room_name] = "blinking"
-            else:
-                # Room not completed → red (PER-ROOM)
-                led_states[room_name] = "red"
-            
-            print(f"🔍 [get_door_led_states] {room_name}: LED = {led_states[room_name]}")
         
-        print(f"🔍 [get_door_led_states] Final LED states: {led_states}\n")
-        return led_states
+        Derivati da completed_mask: al massimo una SELECT della riga di
+        completamento (nessuna se `state` è già stato caricato dal chiamante).
+        """
+        if state is None:
+            state = GameCompletionService.get_or_create_state(db, session_id)
+        return state.door_led_states()
+    
+    @staticmethod
+    def state_document(state: GameCompletionState) -> Dict:
+        """
+        Stessa forma di GameCompletionResponse come dict pronto per fast_json
+        (LED porta derivati dalla bitmask, nessuna query)
+        """
+        return {
+            "session_id": state.session_id,
+            "rooms_status": {
+                room: {"completed": bool(status.get("completed")), "completion_time": status.get("completion_time")}
+                for room, status in (state.rooms_status or {}).items()
+            },
+            "door_led_states": state.door_led_states(),
+            "game_won": state.game_won,
+            "victory_time": state.victory_time,
+            "completed_rooms_count": state.get_completed_rooms_count(),
+            "version": state.version,
+            "updated_at": state.updated_at
+        }
     
     @staticmethod
     def check_and_update_all_rooms(db: Session, session_id: int) -> GameCompletionState:
@@ -233,22 +298,30 @@ class GameCompletionService:
         - Recovery after server restart
         - Admin dashboard sync
         - Debug verification
+        
+        È l'unico path che rilegge le tabelle delle stanze: ricostruisce
+        completed_mask se dovesse divergere dallo stato reale dei puzzle.
         """
         state = GameCompletionService.get_or_create_state(db, session_id)
         
+        mask = state.completed_mask or 0
+        
         # Check each room's actual puzzle status
-        for room_name in ["cucina", "camera", "bagno", "soggiorno"]:
+        for room_name, bit in ROOM_BITS.items():
             is_completed = GameCompletionService._is_room_completed(db, session_id, room_name)
             
-            current_status = state.rooms_status[room_name].get("completed", False)
-            
             # Update if changed
-            if is_completed and not current_status:
+            if is_completed and not mask & bit:
+                mask |= bit
                 state.rooms_status[room_name] = {
                     "completed": True,
                     "completion_time": datetime.utcnow().isoformat()
                 }
         
+        if mask != state.completed_mask:
+            state.completed_mask = mask
+            state.version = (state.version or 0) + 1
+        
         # Check for game victory
         if state.is_game_complete() and not state.game_won:
             state.game_won = True
@@ -258,24 +331,48 @@ class GameCompletionService:
         state.updated_at = datetime.utcnow()
         flag_modified(state, "rooms_status")
         
-        db.commit()
-        db.refresh(state)
+        persistence.commit(db)
         
         return state
     
     @staticmethod
-    def reset_game_completion(db: Session, session_id: int):
-        """Reset game completion state (for new game)"""
-        state = GameCompletionService.get_or_create_state(db, session_id)
-        
-        state.rooms_status = GameCompletionState.get_initial_state()
-        state.game_won = False
-        state.victory_time = None
-        state.updated_at = datetime.utcnow()
+    def stage_reset(db: Session, session_id: int) -> Tuple[GameCompletionState, PendingEvent]:
+        """
+        Azzera il completamento nella transazione corrente (senza commit):
+        un solo INSERT ... ON CONFLICT (session_id) DO UPDATE ... RETURNING.
         
-        flag_modified(state, "rooms_status")
+        Returns:
+            (stato azzerato, evento game_completion_reset da proiettare dopo il commit)
+        """
+        table = GameCompletionState.__table__
+        now = datetime.utcnow()
+        reset_values = {
+            "rooms_status": GameCompletionState.get_initial_state(),
+            "completed_mask": 0,
+            "game_won": False,
+            "victory_time": None,
+            "updated_at": now
+        }
         
-        db.commit()
-        db.refresh(state)
+        stmt = pg_insert(GameCompletionState).values(
+            session_id=session_id,
+            version=1,
+            created_at=now,
+            **reset_values
+        ).on_conflict_do_update(
+            index_elements=[table.c.session_id],
+            set_={**reset_values, "version": table.c.version + 1}
+        ).returning(GameCompletionState)
+        
+        state = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+        event = session_state_store.stage(db, session_id, "game_completion_reset", {})
+        return state, event
+    
+    @staticmethod
+    def reset_game_completion(db: Session, session_id: int):
+        """Reset game completion state (for new game)"""
+        state, event = GameCompletionService.stage_reset(db, session_id)
+        persistence.commit(db)
+        session_state_store.apply(db, event)
         
-        return state
\ No newline at end of file
+        return state
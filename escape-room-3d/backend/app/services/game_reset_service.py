@@ -0,0 +1,99 @@
+"""Game Reset Service - reset globale della casa (4 stanze + esterno + completamento) in una transazione"""
+import asyncio
+import logging
+from typing import Any, Dict, NamedTuple
+
+from sqlalchemy.orm import Session
+
+from app.models.game_completion import GameCompletionState
+from app.models.game_session import GameSession
+from app.models.gate_puzzle import GatePuzzle
+from app.services import persistence
+from app.services.bathroom_puzzle_service import BathroomPuzzleService
+from app.services.bedroom_puzzle_service import BedroomPuzzleService
+from app.services.game_completion_service import GameCompletionService
+from app.services.gate_puzzle_service import GatePuzzleService
+from app.services.kitchen_puzzle_service import KitchenPuzzleService
+from app.services.livingroom_puzzle_service import LivingRoomPuzzleService
+from app.services.puzzle_fsm import ROOM_FSMS
+from app.services.session_state_store import session_state_store
+
+logger = logging.getLogger(__name__)
+
+
+class GameReset(NamedTuple):
+    """Stato dopo il reset: istanze già caricate dai RETURNING (nessuna query per i broadcast)"""
+    session_id: int
+    rooms: Dict[str, Any]
+    gate: GatePuzzle
+    completion: GameCompletionState
+
+    @property
+    def puzzle_count(self) -> int:
+        return sum(len(fsm.spec.triggers) for fsm in ROOM_FSMS.values()) + 1   # + esterno
+
+
+class GameResetService:
+    """
+    Reset "RESET ENIGMI" della lobby admin.
+
+    Un solo commit per tutta la casa: un UPDATE ... RETURNING per stanza
+    (INSERT se la riga non esiste ancora), un upsert per esterno e
+    game_completion e gli eventi di stato nella stessa transazione.
+    Se qualcosa fallisce il rollback lascia la casa com'era: mai mezza resettata.
+    """
+
+    @staticmethod
+    def reset_session(db: Session, session_id: int) -> GameReset:
+        """
+        Raises:
+            ValueError: se la sessione non esiste
+        """
+        if db.query(GameSession.id).filter(GameSession.id == session_id).first() is None:
+            raise ValueError(f"Session {session_id} not found")
+
+        pending = []
+        rooms = {}
+        try:
+            for room, fsm in ROOM_FSMS.items():
+                rooms[room], event = fsm.stage_full_reset(db, session_id)
+                pending.append(event)
+            gate, event = GatePuzzleService.stage_reset(db, session_id)
+            pending.append(event)
+            completion, event = GameCompletionService.stage_reset(db, session_id)
+            pending.append(event)
+            persistence.commit(db)
+        except Exception:
+            db.rollback()
+            raise
+
+        for event in pending:
+            session_state_store.apply(db, event)
+
+        logger.info(f"[GameReset] 🔄 Session {session_id}: {len(rooms)} rooms + esterno + completion reset in one commit")
+        return GameReset(session_id, rooms, gate, completion)
+
+    @staticmethod
+    def room_documents(reset: GameReset) -> Dict[str, Any]:
+        """Response di ogni stanza costruite dalle istanze del reset"""
+        rooms = reset.rooms
+        return {
+            "cucina": KitchenPuzzleService.state_document(rooms["cucina"], reset.completion),
+            "camera": BedroomPuzzleService.state_document(rooms["camera"]),
+            "bagno": BathroomPuzzleService.state_document(rooms["bagno"]),
+            "soggiorno": LivingRoomPuzzleService._build_response(rooms["soggiorno"])
+        }
+
+    @staticmethod
+    async def broadcast(reset: GameReset):
+        """Broadcast in parallelo: state_diff unico (stanze + completamento, + MQTT game_won) e stato esterno via MQTT"""
+        from app.websocket.state_diff import state_diff_broadcaster
+
+        results = await asyncio.gather(
+            state_diff_broadcaster.publish_rooms(reset.session_id, GameResetService.room_documents(reset), reset.completion),
+            GatePuzzleService._publish_mqtt_state(reset.gate),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"[GameReset] ⚠️ Broadcast error (non-blocking): {result}")
@@ -1,11 +1,16 @@
 """Gate Puzzle Service - Esterno"""
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional, Tuple
 import asyncio
-import json
 from app.models.gate_puzzle import GatePuzzle
 from app.services.game_completion_service import GameCompletionService
+from app.services.game_analytics_service import GameAnalyticsService, METRIC_PUZZLE
 from app.mqtt_client import MQTTClient
+from app.services import persistence
+from app.services.session_state_store import PendingEvent, session_state_store
 
 
 class GatePuzzleService:
@@ -16,7 +21,7 @@ class GatePuzzleService:
         """
         Publish gate puzzle state to MQTT for frontend animation sync.
         
-        Topics:
+        Topics (radice "escape" o quella della casa della sessione):
         - escape/esterno/ir-sensor/stato
         - escape/esterno/cancello1/posizione
         - escape/esterno/cancello2/posizione
@@ -25,32 +30,31 @@ class GatePuzzleService:
         """
         try:
             # IR Sensor state
-            ir_payload = json.dumps({
+            ir_payload = {
                 "libero": puzzle.photocell_clear,
                 "raw_value": 1 if puzzle.photocell_clear else 0
-            })
-            await MQTTClient.publish("escape/esterno/ir-sensor/stato", ir_payload)
+            }
             
             # Servo positions (0-90 for gates/door, 0-180 for roof)
             target_gates = 90 if puzzle.gates_open else 0
             target_door = 90 if puzzle.door_open else 0
             target_roof = 180 if puzzle.roof_open else 0
             
-            # Cancello 1
-            cancello1_payload = json.dumps({"position": target_gates, "target": 90})
-            await MQTTClient.publish("escape/esterno/cancello1/posizione", cancello1_payload)
-            
-            # Cancello 2
-            cancello2_payload = json.dumps({"position": target_gates, "target": 90})
-            await MQTTClient.publish("escape/esterno/cancello2/posizione", cancello2_payload)
-            
-            # Porta
-            porta_payload = json.dumps({"position": target_door, "target": 90})
-            await MQTTClient.publish("escape/esterno/porta/posizione", porta_payload)
+            payloads = {
+                "esterno/ir-sensor/stato": ir_payload,
+                "esterno/cancello1/posizione": {"position": target_gates, "target": 90},
+                "esterno/cancello2/posizione": {"position": target_gates, "target": 90},
+                "esterno/porta/posizione": {"position": target_door, "target": 90},
+                "esterno/tetto/posizione": {"position": target_roof, "target": 180}
+            }
             
-            # Tetto
-            tetto_payload = json.dumps({"position": target_roof, "target": 180})
-            await MQTTClient.publish("escape/esterno/tetto/posizione", tetto_payload)
+            # Codificati da MQTTClient col codec del topic (JSON, o struct "servo"/"ir" se configurato)
+            # Topic indipendenti (sotto la radice della casa della sessione): pubblicati in parallelo
+            await asyncio.gather(*(
+                MQTTClient.publish(topic, payload)
+                for path, payload in payloads.items()
+                for topic in MQTTClient.session_topics(puzzle.session_id, path)
+            ))
             
             print(f"✅ [MQTT] Published gate state: gates={target_gates}, door={target_door}, roof={target_roof}")
             
@@ -66,9 +70,7 @@ class GatePuzzleService:
         
         if not puzzle:
             puzzle = GatePuzzle(session_id=session_id)
-            db.add(puzzle)
-            db.commit()
-            db.refresh(puzzle)
+            persistence.save(db, puzzle)
         
         return puzzle
     
@@ -104,13 +106,19 @@ class GatePuzzleService:
         if is_clear and puzzle.completed_at is None:
             puzzle.completed_at = datetime.utcnow()
             print(f"🚪 Gate puzzle completato! session_id={session_id}")
+            GameAnalyticsService.stage_session_sample(db, session_id, METRIC_PUZZLE, "esterno/fotocellula", puzzle.completed_at)
         
         # Check game completion per RGB strip
         game_state = GameCompletionService.get_or_create_state(db, session_id)
         puzzle.rgb_strip_on = is_clear and game_state.game_won
         
-        db.commit()
-        db.refresh(puzzle)
+        event = session_state_store.stage(db, session_id, "photocell", {
+            "photocell_clear": is_clear,
+            "completed": puzzle.completed_at is not None,
+            "rgb_strip_on": puzzle.rgb_strip_on
+        }, room="esterno")
+        persistence.commit(db)
+        session_state_store.apply(db, event)
         
         return puzzle
     
@@ -137,6 +145,27 @@ class GatePuzzleService:
         
         return puzzle
     
+    @staticmethod
+    def apply_mqtt_photocell(db: Session, session_id: int, is_clear: bool) -> Optional[GatePuzzle]:
+        """
+        Lettura della fotocellula pubblicata dalla scheda su MQTT - SYNC (threadpool).
+        
+        Arriva da esterno/ir-sensor/lettura, topic su cui il backend non pubblica:
+        nessuna eco di _publish_mqtt_state (che usa esterno/ir-sensor/stato).
+        
+        Returns:
+            Puzzle aggiornato, None se lo stato non cambia (valore già ricevuto via REST)
+        """
+        puzzle = GatePuzzleService.get_or_create(db, session_id)
+        if puzzle.photocell_clear == is_clear:
+            return None
+        return GatePuzzleService.update_photocell_state(db, session_id, is_clear)
+    
+    @staticmethod
+    async def publish_state(puzzle: GatePuzzle):
+        """Pubblica lo stato del cancello dopo un aggiornamento fatto fuori dal loop"""
+        await GatePuzzleService._publish_mqtt_state(puzzle)
+    
     @staticmethod
     def get_state(db: Session, session_id: int) -> GatePuzzle:
         """Get current gate puzzle state"""
@@ -156,31 +185,56 @@ class GatePuzzleService:
         """
         puzzle = GatePuzzleService.get_or_create(db, session_id)
         game_state = GameCompletionService.get_or_create_state(db, session_id)
-        
+        return GatePuzzleService.esp32_document(puzzle, game_state)
+    
+    @staticmethod
+    def esp32_document(puzzle: GatePuzzle, game_state) -> dict:
+        """Stato minimo ESP32 da istanze già caricate (nessuna query)"""
         # RGB strip ON solo se fotocellula libera AND tutte 4 stanze completate
-        rgb_on = puzzle.photocell_clear and game_state.game_won
-        
         return {
-            "rgb_strip_on": rgb_on,
+            "rgb_strip_on": puzzle.photocell_clear and game_state.game_won,
             "led_status": puzzle.led_status,
             "all_rooms_complete": game_state.game_won
         }
     
+    @staticmethod
+    def stage_reset(db: Session, session_id: int) -> Tuple[GatePuzzle, PendingEvent]:
+        """
+        Reset nella transazione corrente (senza commit né SELECT preliminare):
+        INSERT ... ON CONFLICT (session_id) DO UPDATE ... RETURNING.
+        
+        Returns:
+            (puzzle azzerato, evento gate_reset da proiettare dopo il commit)
+        """
+        reset_values = {
+            "photocell_clear": False,
+            "gates_open": False,
+            "door_open": False,
+            "roof_open": False,
+            "led_status": "red",
+            "rgb_strip_on": False,
+            "completed_at": None,
+            "updated_at": func.now()
+        }
+        stmt = pg_insert(GatePuzzle).values(session_id=session_id, **reset_values).on_conflict_do_update(
+            index_elements=[GatePuzzle.__table__.c.session_id],
+            set_=reset_values
+        ).returning(GatePuzzle)
+        puzzle = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+        
+        event = session_state_store.stage(db, session_id, "gate_reset", {
+            "photocell_clear": False,
+            "completed": False,
+            "rgb_strip_on": False
+        }, room="esterno")
+        return puzzle, event
+    
     @staticmethod
     def reset(db: Session, session_id: int) -> GatePuzzle:
         """Reset gate puzzle to initial state"""
-        puzzle = GatePuzzleService.get_or_create(db, session_id)
-        
-        puzzle.photocell_clear = False
-        puzzle.gates_open = False
-        puzzle.door_open = False
-        puzzle.roof_open = False
-        puzzle.led_status = "red"
-        puzzle.rgb_strip_on = False
-        puzzle.completed_at = None
-        
-        db.commit()
-        db.refresh(puzzle)
+        puzzle, event = GatePuzzleService.stage_reset(db, session_id)
+        persistence.commit(db)
+        session_state_store.apply(db, event)
         
         return puzzle
     
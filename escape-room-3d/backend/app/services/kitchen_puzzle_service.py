@@ -1,8 +1,5 @@
 """Kitchen Puzzle Service - FSM and validation logic"""
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy.exc import IntegrityError
-from datetime import datetime
 from typing import Optional, Dict, Any
 from app.models.kitchen_puzzle import KitchenPuzzleState
 from app.models.game_session import GameSession
@@ -13,6 +10,8 @@ from app.schemas.kitchen_puzzle import (
     PuzzleStateDetail,
     PortaStateDetail
 )
+from app.services import persistence
+from app.services.puzzle_fsm import KITCHEN_FSM
 
 
 class KitchenPuzzleService:
@@ -25,11 +24,11 @@ class KitchenPuzzleService:
     """
     
     @staticmethod
-    def _get_led_states(puzzle_states: Dict[str, Any], db: Session, session_id: int) -> LEDStates:
+    def _get_led_states(state: KitchenPuzzleState, db: Session) -> LEDStates:
         """
         Convert puzzle states to LED colors.
         
-        Rules:
+        Rules (tabella compilata in KITCHEN_FSM):
         - locked → off
         - active → red
         - done → green
@@ -37,15 +36,10 @@ class KitchenPuzzleService:
         """
         # Consulta game_completion per stato LED porta
         from app.services.game_completion_service import GameCompletionService
-        door_led_states = GameCompletionService.get_door_led_states(db, session_id)
+        door_led_states = GameCompletionService.get_door_led_states(db, state.session_id)
         
         return LEDStates(
-            fornelli="green" if puzzle_states["fornelli"]["status"] == "done" else 
-                    "red" if puzzle_states["fornelli"]["status"] == "active" else "off",
-            frigo="green" if puzzle_states["frigo"]["status"] == "done" else 
-                 "red" if puzzle_states["frigo"]["status"] == "active" else "off",
-            serra="green" if puzzle_states["serra"]["status"] == "done" else 
-                 "red" if puzzle_states["serra"]["status"] == "active" else "off",
+            **KITCHEN_FSM.led_states(state),
             porta=door_led_states.get("cucina", "red")  # Usa logica game_completion
         )
     
@@ -93,9 +87,7 @@ class KitchenPuzzleService:
             room_name="cucina",
             puzzle_states=KitchenPuzzleState.get_initial_state()
         )
-        db.add(state)
-        db.commit()
-        db.refresh(state)
+        persistence.save(db, state)
         return state
     
     @staticmethod
@@ -111,15 +103,33 @@ class KitchenPuzzleService:
             KitchenPuzzleStateResponse with current state
         """
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
-        
+        return KitchenPuzzleService._build_state_response(db, state)
+    
+    @staticmethod
+    def _build_state_response(db: Session, state: KitchenPuzzleState) -> KitchenPuzzleStateResponse:
+        """Costruisce la response da un'istanza già caricata (nessuna query sullo stato)"""
         return KitchenPuzzleStateResponse(
             session_id=state.session_id,
             room_name=state.room_name,
             states=KitchenPuzzleService._puzzle_states_to_schema(state.puzzle_states),
-            led_states=KitchenPuzzleService._get_led_states(state.puzzle_states, db, session_id),
+            led_states=KitchenPuzzleService._get_led_states(state, db),
             updated_at=state.updated_at
         )
     
+    @staticmethod
+    def state_document(state: KitchenPuzzleState, completion) -> Dict[str, Any]:
+        """
+        Stessa forma di KitchenPuzzleStateResponse ma come dict pronto per
+        fast_json (route di polling: niente ricostruzione dei modelli Pydantic)
+        """
+        return {
+            "session_id": state.session_id,
+            "room_name": state.room_name,
+            "states": KITCHEN_FSM.states_document(state),
+            "led_states": {**KITCHEN_FSM.led_states(state), "porta": completion.door_led_states().get("cucina", "red")},
+            "updated_at": state.updated_at
+        }
+    
     @staticmethod
     def validate_fornelli_complete(db: Session, session_id: int) -> Optional[KitchenPuzzleStateResponse]:
         """
@@ -139,23 +149,11 @@ class KitchenPuzzleService:
         """
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if fornelli is active
-        if state.puzzle_states["fornelli"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if KITCHEN_FSM.apply(db, session_id, state, "fornelli") is None:
+            return None
         
-        # Atomic update
-        state.puzzle_states["fornelli"]["status"] = "done"
-        state.puzzle_states["fornelli"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["frigo"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        return KitchenPuzzleService.get_state_response(db, session_id)
+        return KitchenPuzzleService._build_state_response(db, state)
     
     @staticmethod
     def validate_frigo_closed(db: Session, session_id: int) -> Optional[KitchenPuzzleStateResponse]:
@@ -176,23 +174,11 @@ class KitchenPuzzleService:
         """
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if frigo is active
-        if state.puzzle_states["frigo"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
-        
-        # Atomic update
-        state.puzzle_states["frigo"]["status"] = "done"
-        state.puzzle_states["frigo"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["serra"]["status"] = "active"
-        state.updated_at = datetime.utcnow()
-        
-        # Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if KITCHEN_FSM.apply(db, session_id, state, "frigo") is None:
+            return None
         
-        return KitchenPuzzleService.get_state_response(db, session_id)
+        return KitchenPuzzleService._build_state_response(db, state)
     
     @staticmethod
     def validate_serra_activated(db: Session, session_id: int) -> Optional[KitchenPuzzleStateResponse]:
@@ -202,7 +188,8 @@ class KitchenPuzzleService:
         Atomic operation:
         1. Check serra is 'active'
         2. Mark serra as 'done'
-        3. Unlock porta (set to 'unlocked')
+        3. Unlock porta (set to 'unlocked') + strip LED accesa
+        4. Notifica game_completion (cucina completata)
         
         Args:
             db: Database session
@@ -213,35 +200,11 @@ class KitchenPuzzleService:
         """
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        # Guard: Check if serra is active
-        if state.puzzle_states["serra"]["status"] != "active":
-            return None  # Ignore double trigger or wrong sequence
+        # Guard + transizione + UPDATE condizionato (ignora doppio trigger o sequenza sbagliata)
+        if KITCHEN_FSM.apply(db, session_id, state, "serra") is None:
+            return None
         
-        # Atomic update
-        state.puzzle_states["serra"]["status"] = "done"
-        state.puzzle_states["serra"]["completed_at"] = datetime.utcnow().isoformat()
-        state.puzzle_states["porta"]["status"] = "unlocked"
-        
-        # 🆕 Sincronizza strip LED fisica con serra virtuale
-        state.puzzle_states["strip_led"]["is_on"] = True
-        
-        state.updated_at = datetime.utcnow()
-        
-        # ✅ FIX: Flag as modified for SQLAlchemy to detect JSONB changes
-        flag_modified(state, "puzzle_states")
-        
-        db.commit()
-        db.refresh(state)
-        
-        # 🆕 Notifica game completion che cucina è completata
-        # IMPORTANTE: Passa la db session per garantire che il commit sia sincronizzato
-        from app.services.game_completion_service import GameCompletionService
-        completion_state = GameCompletionService.mark_room_completed(db, session_id, "cucina")
-        
-        # 🔥 FIX: Forza un flush per assicurarci che il database sia aggiornato
-        db.flush()
-        
-        return KitchenPuzzleService.get_state_response(db, session_id)
+        return KitchenPuzzleService._build_state_response(db, state)
     
     @staticmethod
     def reset_puzzles(db: Session, session_id: int, level: str = "full", puzzles_to_reset: Optional[list] = None) -> KitchenPuzzleStateResponse:
@@ -259,27 +222,8 @@ class KitchenPuzzleService:
         """
         state = KitchenPuzzleService.get_or_create_state(db, session_id)
         
-        if level == "full":
-            # Full reset - back to initial state
-            state.puzzle_states = KitchenPuzzleState.get_initial_state()
-            
-            # 🆕 IMPORTANTE: Resetta ANCHE game_completion per questa stanza
-            # Altrimenti c'è inconsistenza tra kitchen_puzzles e game_completion
-            from app.services.game_completion_service import GameCompletionService
-            GameCompletionService.unmark_room_completed(db, session_id, "cucina")
-            
-        elif level == "partial" and puzzles_to_reset:
-            # Partial reset - reset specific puzzles
-            initial = KitchenPuzzleState.get_initial_state()
-            for puzzle_name in puzzles_to_reset:
-                if puzzle_name in state.puzzle_states:
-                    state.puzzle_states[puzzle_name] = initial[puzzle_name]
-            # Solo per partial reset serve flag_modified
-            flag_modified(state, "puzzle_states")
-        
-        state.updated_at = datetime.utcnow()
-        
-        db.commit()
-        db.refresh(state)
+        # Full reset: stato iniziale + game_completion della cucina (evita inconsistenze)
+        # Partial reset: solo i puzzle indicati
+        KITCHEN_FSM.reset(db, session_id, state, level, puzzles_to_reset)
         
-        return KitchenPuzzleService.get_state_response(db, session_id)
\ No newline at end of file
+        return KitchenPuzzleService._build_state_response(db, state)
\ No newline at end of file
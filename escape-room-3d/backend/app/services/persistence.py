@@ -0,0 +1,42 @@
+"""Persistence helpers - commit senza SELECT di refresh"""
+from contextlib import contextmanager
+
+from sqlalchemy.orm import Session
+
+
+@contextmanager
+def _keep_loaded(db: Session):
+    previous = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        yield
+    finally:
+        db.expire_on_commit = previous
+
+
+def commit(db: Session) -> None:
+    """
+    Commit che lascia valide le istanze già caricate.
+
+    Con il default `expire_on_commit=True` ogni attributo letto dopo il commit
+    provoca una SELECT (è quello che il vecchio `db.refresh(obj)` faceva in modo esplicito).
+    Qui le istanze restano popolate con i valori appena scritti; i valori generati
+    dal server (id, server_default, onupdate) arrivano già durante il flush tramite
+    RETURNING sui modelli con `eager_defaults`.
+    """
+    with _keep_loaded(db):
+        db.commit()
+
+
+def save(db: Session, instance):
+    """db.add + commit: restituisce l'istanza pronta all'uso, id incluso"""
+    db.add(instance)
+    commit(db)
+    return instance
+
+
+def save_all(db: Session, instances: list) -> list:
+    """Come save per più istanze, in un'unica transazione"""
+    db.add_all(instances)
+    commit(db)
+    return instances
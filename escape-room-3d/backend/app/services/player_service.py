@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models.player import Player
 from app.models.game_session import GameSession
+from app.services import persistence
 from datetime import datetime
 
 
@@ -25,8 +26,7 @@ class PlayerService:
         if session:
             session.connected_players = self.get_players_count(session_id)
         
-        self.db.commit()
-        self.db.refresh(player)
+        persistence.commit(self.db)
         return player
 
     def get_player_by_id(self, player_id: int) -> Optional[Player]:
@@ -60,8 +60,7 @@ class PlayerService:
         player = self.get_player_by_id(player_id)
         if player:
             player.current_room = room
-            self.db.commit()
-            self.db.refresh(player)
+            persistence.commit(self.db)
         return player
 
     def update_player_status(self, player_id: int, status: str) -> Optional[Player]:
@@ -69,8 +68,7 @@ class PlayerService:
         player = self.get_player_by_id(player_id)
         if player:
             player.status = status
-            self.db.commit()
-            self.db.refresh(player)
+            persistence.commit(self.db)
         return player
 
     def update_socket_id(self, player_id: int, socket_id: str) -> Optional[Player]:
@@ -78,8 +76,7 @@ class PlayerService:
         player = self.get_player_by_id(player_id)
         if player:
             player.socket_id = socket_id
-            self.db.commit()
-            self.db.refresh(player)
+            persistence.commit(self.db)
         return player
 
     def remove_player(self, player_id: int) -> bool:
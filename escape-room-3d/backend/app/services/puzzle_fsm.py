@@ -0,0 +1,512 @@
+"""
+Puzzle FSM - Motore a tabelle condiviso dai servizi puzzle delle stanze
+
+Ogni stanza è descritta solo da dati (RoomSpec): puzzle, stati possibili,
+trigger (guardia → stato completato + sblocchi + flag hardware) e mappa LED.
+All'import ogni spec viene compilata in tabelle dense:
+
+- lo stato della stanza è codificato come intero (mixed radix sugli stati dei puzzle)
+- per ogni trigger una lista `codice stato → Transition | None`
+- una lista `codice stato → colori LED`
+
+Dato stato + trigger, nuovo stato, flag e LED si ottengono con un accesso a lista.
+La scrittura è sempre un solo UPDATE condizionato (compare-and-set sullo stato
+richiesto dalla guardia): due trigger concorrenti non possono applicare
+la stessa transizione due volte.
+
+Aggiungere una stanza = aggiungere una RoomSpec in fondo a questo file.
+"""
+import itertools
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.bathroom_puzzle import BathroomPuzzleState
+from app.models.bedroom_puzzle import BedroomPuzzleState
+from app.models.kitchen_puzzle import KitchenPuzzleState
+from app.models.livingroom_puzzle import LivingRoomPuzzleState
+from app.services import persistence
+from app.services.game_analytics_service import GameAnalyticsService
+from app.services.session_state_store import session_state_store
+
+logger = logging.getLogger(__name__)
+
+LOCKED = "locked"
+ACTIVE = "active"
+DONE = "done"
+UNLOCKED = "unlocked"
+COMPLETED = "completed"   # soggiorno usa "completed" al posto di "done"
+
+PUZZLE_STATUSES = (LOCKED, ACTIVE, DONE)
+DOOR_STATUSES = (LOCKED, UNLOCKED)
+
+# Mappe LED ricorrenti
+LED_CHAIN = {LOCKED: "off", ACTIVE: "red", DONE: "green"}
+LED_CHAIN_RED_IDLE = {LOCKED: "red", ACTIVE: "red", DONE: "green"}
+LED_DOOR = {LOCKED: "red", UNLOCKED: "green"}
+
+
+@dataclass(frozen=True)
+class TriggerSpec:
+    """Un evento di gioco: completa `puzzle` se la guardia è soddisfatta"""
+    puzzle: str
+    requires: Optional[str] = ACTIVE                           # None = nessuna guardia
+    unlocks: Dict[str, str] = field(default_factory=dict)      # altri puzzle → nuovo stato
+    actuators: Dict[str, Any] = field(default_factory=dict)    # flag hardware / chiavi JSON extra
+    completes_room: bool = False
+
+
+@dataclass(frozen=True)
+class RoomSpec:
+    room: str                                    # nome usato da game_completion (cucina, camera, ...)
+    model: type
+    storage: str                                 # "json" (colonna puzzle_states) | "columns" (<puzzle>_status)
+    puzzles: Dict[str, Tuple[str, ...]]          # puzzle → stati possibili (ordine stabile)
+    initial: Dict[str, str]
+    triggers: Dict[str, TriggerSpec]
+    leds: Dict[str, Tuple[str, Dict[str, str]]]  # led → (puzzle sorgente, stato → colore)
+    done_status: str = DONE
+    reset_actuators: Dict[str, Any] = field(default_factory=dict)
+    partial_reset_actuators: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    unmark_completion_on_reset: bool = True
+
+
+@dataclass(frozen=True)
+class Transition:
+    trigger: str
+    state: int                     # codice del nuovo stato
+    statuses: Dict[str, str]       # nuovo stato di ogni puzzle
+    changed: Dict[str, str]        # solo i puzzle modificati
+    completed: str                 # puzzle marcato come completato (→ completed_at)
+    actuators: Dict[str, Any]
+    completes_room: bool
+    leds: Dict[str, str]
+
+
+class _JsonStore:
+    """Stato nella colonna JSONB `puzzle_states`: {puzzle: {"status", "completed_at"}}"""
+
+    column = "puzzle_states"
+
+    def __init__(self, spec: RoomSpec):
+        self.spec = spec
+        self.table = spec.model.__table__
+
+    def read(self, instance) -> Dict[str, str]:
+        states = instance.puzzle_states or {}
+        return {name: states.get(name, {}).get("status") for name in self.spec.puzzles}
+
+    def guard(self, puzzle: str, status: str):
+        return self.table.c.puzzle_states[(puzzle, "status")].astext == status
+
+    def transition_values(self, instance, transition: Transition, now: datetime) -> Dict[str, Any]:
+        states = {key: dict(value) for key, value in (instance.puzzle_states or {}).items()}
+        for name, status in transition.changed.items():
+            states.setdefault(name, {})["status"] = status
+        states.setdefault(transition.completed, {})["completed_at"] = now.isoformat()
+
+        values = {}
+        for key, value in transition.actuators.items():
+            if key in self.table.c:
+                values[key] = value
+            else:
+                states[key] = {**states.get(key, {}), **value}
+        values[self.column] = states
+        return values
+
+    def reset_values(self, instance, initial: Dict[str, Any], names: Optional[List[str]]) -> Dict[str, Any]:
+        if names is None:
+            return {self.column: initial}
+        states = {key: dict(value) for key, value in (instance.puzzle_states or {}).items()}
+        for name in names:
+            if name in states and name in initial:
+                states[name] = initial[name]
+        return {self.column: states}
+
+
+class _ColumnStore:
+    """Stato in colonne `<puzzle>_status` (soggiorno)"""
+
+    def __init__(self, spec: RoomSpec):
+        self.spec = spec
+        self.table = spec.model.__table__
+
+    def read(self, instance) -> Dict[str, str]:
+        return {name: getattr(instance, f"{name}_status") for name in self.spec.puzzles}
+
+    def guard(self, puzzle: str, status: str):
+        return self.table.c[f"{puzzle}_status"] == status
+
+    def transition_values(self, instance, transition: Transition, now: datetime) -> Dict[str, Any]:
+        values = {f"{name}_status": status for name, status in transition.changed.items()}
+        values.update(transition.actuators)
+        return values
+
+    def reset_values(self, instance, initial: Dict[str, Any], names: Optional[List[str]]) -> Dict[str, Any]:
+        return {f"{name}_status": initial[name] for name in (names or self.spec.puzzles)}
+
+
+class RoomFSM:
+    """Spec compilata: lookup O(1) di transizioni e LED + path di scrittura a singolo UPDATE"""
+
+    def __init__(self, spec: RoomSpec):
+        self.spec = spec
+        self.room = spec.room
+        self.names = tuple(spec.puzzles)
+        self._digits = {name: {status: i for i, status in enumerate(spec.puzzles[name])} for name in self.names}
+        self._radix = []
+        weight = 1
+        for name in self.names:
+            self._radix.append(weight)
+            weight *= len(spec.puzzles[name])
+        self.size = weight
+        self.store = _JsonStore(spec) if spec.storage == "json" else _ColumnStore(spec)
+        self.broadcast_hook: Optional[Callable[[int, Any], Awaitable[None]]] = None
+
+        self._leds: List[Dict[str, str]] = [None] * self.size
+        self._transitions: Dict[str, List[Optional[Transition]]] = {
+            trigger: [None] * self.size for trigger in spec.triggers
+        }
+        for combo in itertools.product(*(spec.puzzles[name] for name in self.names)):
+            statuses = dict(zip(self.names, combo))
+            code = self.encode(statuses)
+            self._leds[code] = self._compute_leds(statuses)
+            for trigger, trigger_spec in spec.triggers.items():
+                self._transitions[trigger][code] = self._compile(trigger, trigger_spec, statuses)
+
+    # ------------------------------------------------------------------ compile
+
+    def _compute_leds(self, statuses: Dict[str, str]) -> Dict[str, str]:
+        return {led: colours.get(statuses.get(puzzle), "off") for led, (puzzle, colours) in self.spec.leds.items()}
+
+    def _compile(self, trigger: str, trigger_spec: TriggerSpec, statuses: Dict[str, str]) -> Optional[Transition]:
+        if trigger_spec.requires is not None and statuses[trigger_spec.puzzle] != trigger_spec.requires:
+            return None
+        changes = {trigger_spec.puzzle: self.spec.done_status, **trigger_spec.unlocks}
+        new_statuses = {**statuses, **changes}
+        if new_statuses == statuses:
+            # Trigger senza guardia ripetuto (TASTO K): niente UPDATE, evento né campione analytics
+            return None
+        return Transition(
+            trigger=trigger,
+            state=self.encode(new_statuses),
+            statuses=new_statuses,
+            changed={name: status for name, status in changes.items() if statuses[name] != status},
+            completed=trigger_spec.puzzle,
+            actuators=dict(trigger_spec.actuators),
+            completes_room=trigger_spec.completes_room,
+            leds=self._compute_leds(new_statuses)
+        )
+
+    # ------------------------------------------------------------------ lookup
+
+    def encode(self, statuses: Dict[str, str]) -> Optional[int]:
+        code = 0
+        for name, weight in zip(self.names, self._radix):
+            digit = self._digits[name].get(statuses.get(name))
+            if digit is None:
+                return None   # stato non previsto dalla spec (dati corrotti)
+            code += digit * weight
+        return code
+
+    def next(self, statuses: Dict[str, str], trigger: str) -> Optional[Transition]:
+        code = self.encode(statuses)
+        if code is None or trigger not in self._transitions:
+            return None
+        return self._transitions[trigger][code]
+
+    def leds(self, statuses: Dict[str, str]) -> Dict[str, str]:
+        code = self.encode(statuses)
+        if code is None:
+            return self._compute_leds(statuses)
+        return self._leds[code]
+
+    def statuses(self, instance) -> Dict[str, str]:
+        return self.store.read(instance)
+
+    def led_states(self, instance) -> Dict[str, str]:
+        return self.leds(self.store.read(instance))
+
+    def initial_state(self) -> Dict[str, str]:
+        return dict(self.spec.initial)
+
+    def states_document(self, instance) -> Dict[str, Dict[str, Any]]:
+        """
+        Stati dei puzzle già nella forma del campo `states` delle response
+        (porte: solo status; puzzle JSON: status + completed_at) senza passare dai modelli Pydantic
+        """
+        if self.spec.storage != "json":
+            return {name: {"status": status} for name, status in self.store.read(instance).items()}
+        states = instance.puzzle_states or {}
+        document = {}
+        for name, statuses in self.spec.puzzles.items():
+            detail = states.get(name, {})
+            if statuses == DOOR_STATUSES:
+                document[name] = {"status": detail.get("status")}
+            else:
+                document[name] = {"status": detail.get("status"), "completed_at": detail.get("completed_at")}
+        return document
+
+    # ------------------------------------------------------------------ write path
+
+    def _write(
+        self,
+        db: Session,
+        instance,
+        values: Dict[str, Any],
+        *guards,
+        event: Optional[Tuple[str, Dict[str, Any]]] = None,
+        completion: Optional[bool] = None,
+        solved: Optional[Tuple[str, Optional[datetime]]] = None
+    ) -> bool:
+        table = self.store.table
+        now = values.get("updated_at") or datetime.utcnow()
+        result = db.execute(update(table).where(table.c.id == instance.id, *guards).values(**values))
+        if result.rowcount == 0:
+            db.rollback()
+            return False
+        for key, value in values.items():
+            set_committed_value(instance, key, value)
+
+        pending = []
+        if event is not None:
+            # Evento di stato nella stessa transazione dell'UPDATE
+            pending.append(self._stage_event(db, instance, *event))
+
+        if solved is not None:
+            # Tempo di risoluzione negli aggregati analytics, stessa transazione
+            GameAnalyticsService.stage_puzzle_solved(db, self.room, solved[0], solved[1], now)
+
+        if completion is not None:
+            # Completamento stanza (bitmask game_completion) nello stesso commit della transizione
+            from app.services.game_completion_service import GameCompletionService
+            _, completion_event = GameCompletionService.stage_room_completion(db, instance.session_id, self.room, completion)
+            if completion_event is not None:
+                pending.append(completion_event)
+
+        persistence.commit(db)
+        for staged in pending:
+            session_state_store.apply(db, staged)
+        return True
+
+    def _stage_event(self, db: Session, instance, kind: str, payload: Dict[str, Any]):
+        statuses = self.store.read(instance)
+        return session_state_store.stage(
+            db, instance.session_id, kind,
+            {**payload, "statuses": statuses, "leds": self.leds(statuses)},
+            room=self.room
+        )
+
+    def apply(self, db: Session, session_id: int, instance, trigger: str) -> Optional[Transition]:
+        """
+        Applica un trigger: lookup della transizione + un solo UPDATE condizionato.
+
+        Returns:
+            La Transition applicata, None se la guardia non è soddisfatta
+            (doppio trigger, sequenza sbagliata o trigger concorrente già applicato)
+        """
+        transition = self.next(self.store.read(instance), trigger)
+        if transition is None:
+            return None
+        # L'enigma è sbloccato dall'ultima scrittura della stanza (transizione precedente o reset)
+        unlocked_at = instance.updated_at
+
+        now = datetime.utcnow()
+        values = self.store.transition_values(instance, transition, now)
+        values["updated_at"] = now
+
+        trigger_spec = self.spec.triggers[trigger]
+        # Senza guardia: compare-and-set sullo stato letto, così due pressioni concorrenti non scrivono due volte
+        expected = trigger_spec.requires if trigger_spec.requires is not None else self.store.read(instance)[trigger_spec.puzzle]
+        guards = [self.store.guard(trigger_spec.puzzle, expected)]
+
+        event = ("puzzle_transition", {
+            "trigger": trigger,
+            "changed": transition.changed,
+            "actuators": transition.actuators
+        })
+        completion = True if transition.completes_room else None
+        solved = (transition.completed, unlocked_at)
+        if not self._write(db, instance, values, *guards, event=event, completion=completion, solved=solved):
+            logger.warning(f"[PuzzleFSM] {self.room}/{trigger}: concurrent transition, ignored (session {session_id})")
+            return None
+
+        logger.info(f"[PuzzleFSM] {self.room}/{trigger} → {transition.changed} (session {session_id})")
+        return transition
+
+    def reset(self, db: Session, session_id: int, instance, level: str = "full", puzzles_to_reset: Optional[list] = None):
+        """Reset full/partial con un solo UPDATE (+ upsert game_completion nello stesso commit per il full reset)"""
+        initial = self._initial_values()
+
+        if level == "full":
+            values = self.store.reset_values(instance, initial, None)
+            actuators = dict(self.spec.reset_actuators)
+        elif level == "partial" and puzzles_to_reset:
+            values = self.store.reset_values(instance, initial, list(puzzles_to_reset))
+            actuators = {}
+            for name in puzzles_to_reset:
+                actuators.update(self.spec.partial_reset_actuators.get(name, {}))
+        else:
+            values = {}
+            actuators = {}
+        values.update(actuators)
+
+        values["updated_at"] = datetime.utcnow()
+        completion = False if level == "full" and self.spec.unmark_completion_on_reset else None
+        self._write(db, instance, values, event=("puzzle_reset", {"level": level, "actuators": actuators}), completion=completion)
+        return instance
+
+    def stage_full_reset(self, db: Session, session_id: int):
+        """
+        Full reset set-based nella transazione corrente (senza commit né SELECT preliminare):
+        UPDATE ... RETURNING sulle righe della sessione, INSERT ... RETURNING se non esistono.
+        Il completamento della stanza è a carico del chiamante (GameResetService).
+
+        Returns:
+            (istanza aggiornata, evento puzzle_reset da proiettare dopo il commit)
+        """
+        model = self.spec.model
+        actuators = dict(self.spec.reset_actuators)
+        values = {**self.store.reset_values(None, self._initial_values(), None), **actuators, "updated_at": datetime.utcnow()}
+
+        instance = db.scalars(
+            update(model).where(model.session_id == session_id).values(**values).returning(model),
+            execution_options={"populate_existing": True}
+        ).first()
+        if instance is None:
+            instance = db.scalars(insert(model).values(session_id=session_id, **values).returning(model)).one()
+
+        event = self._stage_event(db, instance, "puzzle_reset", {"level": "full", "actuators": actuators})
+        return instance, event
+
+    def _initial_values(self) -> Dict[str, Any]:
+        return self.spec.model.get_initial_state() if self.spec.storage == "json" else self.initial_state()
+
+    # ------------------------------------------------------------------ broadcast
+
+    async def broadcast(self, session_id: int, response: Any, completion=None):
+        """
+        Broadcast della transizione: hook registrato per la stanza, altrimenti
+        un solo messaggio state_diff (stato stanza + completamento se passato)
+        """
+        try:
+            if self.broadcast_hook is not None:
+                await self.broadcast_hook(session_id, response)
+                return
+            from app.websocket.state_diff import state_diff_broadcaster
+            await state_diff_broadcaster.publish(session_id, self.room, response, completion)
+        except Exception as e:
+            logger.error(f"[PuzzleFSM] ❌ WebSocket broadcast error ({self.room}): {e}")
+
+
+# ---------------------------------------------------------------------- specs
+
+KITCHEN_SPEC = RoomSpec(
+    room="cucina",
+    model=KitchenPuzzleState,
+    storage="json",
+    puzzles={"fornelli": PUZZLE_STATUSES, "frigo": PUZZLE_STATUSES, "serra": PUZZLE_STATUSES, "porta": DOOR_STATUSES},
+    initial={"fornelli": ACTIVE, "frigo": LOCKED, "serra": LOCKED, "porta": LOCKED},
+    triggers={
+        "fornelli": TriggerSpec("fornelli", unlocks={"frigo": ACTIVE}),
+        "frigo": TriggerSpec("frigo", unlocks={"serra": ACTIVE}),
+        "serra": TriggerSpec(
+            "serra",
+            unlocks={"porta": UNLOCKED},
+            actuators={"strip_led": {"is_on": True}},   # strip LED fisica sincronizzata con la serra
+            completes_room=True
+        ),
+    },
+    # porta: colore calcolato da game_completion (lampeggio)
+    leds={"fornelli": ("fornelli", LED_CHAIN), "frigo": ("frigo", LED_CHAIN), "serra": ("serra", LED_CHAIN)},
+)
+
+BEDROOM_SPEC = RoomSpec(
+    room="camera",
+    model=BedroomPuzzleState,
+    storage="json",
+    puzzles={
+        "comodino": PUZZLE_STATUSES, "materasso": PUZZLE_STATUSES,
+        "poltrona": PUZZLE_STATUSES, "ventola": PUZZLE_STATUSES, "porta": DOOR_STATUSES
+    },
+    initial={"comodino": LOCKED, "materasso": ACTIVE, "poltrona": LOCKED, "ventola": LOCKED, "porta": LOCKED},
+    triggers={
+        # TASTO K: marker della sequenza comodino, nessuna guardia e nessuno sblocco
+        "comodino": TriggerSpec("comodino", requires=None),
+        "materasso": TriggerSpec("materasso", unlocks={"poltrona": ACTIVE}),
+        "poltrona": TriggerSpec("poltrona", unlocks={"ventola": ACTIVE}),
+        "ventola": TriggerSpec("ventola", unlocks={"porta": UNLOCKED}, completes_room=True),
+    },
+    leds={
+        "porta": ("porta", LED_DOOR),
+        "materasso": ("materasso", LED_CHAIN_RED_IDLE),   # rosso anche se locked (stato iniziale)
+        "poltrona": ("poltrona", LED_CHAIN),
+        "ventola": ("ventola", LED_CHAIN),
+    },
+)
+
+BATHROOM_SPEC = RoomSpec(
+    room="bagno",
+    model=BathroomPuzzleState,
+    storage="json",
+    puzzles={"specchio": PUZZLE_STATUSES, "doccia": PUZZLE_STATUSES, "ventola": PUZZLE_STATUSES},
+    initial={"specchio": ACTIVE, "doccia": LOCKED, "ventola": LOCKED},
+    triggers={
+        "specchio": TriggerSpec("specchio", unlocks={"doccia": ACTIVE}),
+        "doccia": TriggerSpec("doccia", unlocks={"ventola": ACTIVE}),
+        "ventola": TriggerSpec(
+            "ventola",
+            actuators={"window_servo_should_close": True, "fan_should_run": True},
+            completes_room=True
+        ),
+    },
+    leds={
+        "specchio": ("specchio", LED_CHAIN_RED_IDLE),
+        "specchio_white": ("specchio", {LOCKED: "off", ACTIVE: "off", DONE: "on"}),   # LED bianco P33
+        "porta_finestra": ("doccia", LED_CHAIN),
+        "ventola": ("ventola", LED_CHAIN),
+    },
+    reset_actuators={"door_servo_should_open": False, "window_servo_should_close": False, "fan_should_run": False},
+    partial_reset_actuators={"ventola": {"window_servo_should_close": False, "fan_should_run": False}},
+)
+
+LIVINGROOM_SPEC = RoomSpec(
+    room="soggiorno",
+    model=LivingRoomPuzzleState,
+    storage="columns",
+    puzzles={
+        "tv": (LOCKED, ACTIVE, COMPLETED),
+        "pianta": (LOCKED, ACTIVE, COMPLETED),
+        "condizionatore": (LOCKED, ACTIVE, COMPLETED)
+    },
+    initial={"tv": ACTIVE, "pianta": LOCKED, "condizionatore": LOCKED},
+    done_status=COMPLETED,
+    triggers={
+        "tv": TriggerSpec("tv", unlocks={"pianta": ACTIVE}),
+        "pianta": TriggerSpec("pianta", unlocks={"condizionatore": ACTIVE}),
+        "condizionatore": TriggerSpec(
+            "condizionatore",
+            actuators={"door_servo_should_close": True, "fan_should_run": True},   # P32 porta, P26 ventola
+            completes_room=True
+        ),
+    },
+    # porta: gestita da game_completion; la TV non ha LED
+    leds={
+        "pianta": ("pianta", {LOCKED: "off", ACTIVE: "red", COMPLETED: "green"}),
+        "condizionatore": ("condizionatore", {LOCKED: "off", ACTIVE: "red", COMPLETED: "green"}),
+    },
+    reset_actuators={"door_servo_should_close": False, "fan_should_run": False},
+    unmark_completion_on_reset=False,
+)
+
+KITCHEN_FSM = RoomFSM(KITCHEN_SPEC)
+BEDROOM_FSM = RoomFSM(BEDROOM_SPEC)
+BATHROOM_FSM = RoomFSM(BATHROOM_SPEC)
+LIVINGROOM_FSM = RoomFSM(LIVINGROOM_SPEC)
+
+ROOM_FSMS: Dict[str, RoomFSM] = {fsm.room: fsm for fsm in (KITCHEN_FSM, BEDROOM_FSM, BATHROOM_FSM, LIVINGROOM_FSM)}
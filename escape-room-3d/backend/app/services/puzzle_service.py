@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models.puzzle import Puzzle
 from app.models.game_session import GameSession
+from app.services import persistence
 from datetime import datetime
 
 
@@ -36,13 +37,7 @@ class PuzzleService:
                     puzzle_name=f"{room.capitalize()} - Enigma {puzzle_num}"
                 ))
         
-        self.db.add_all(puzzles)
-        self.db.commit()
-        
-        for puzzle in puzzles:
-            self.db.refresh(puzzle)
-        
-        return puzzles
+        return persistence.save_all(self.db, puzzles)
 
     def get_puzzle(self, session_id: int, room: str, puzzle_number: int) -> Optional[Puzzle]:
         """Ottiene un enigma specifico"""
@@ -72,8 +67,7 @@ class PuzzleService:
             puzzle.solved = True
             puzzle.solved_by = solved_by
             puzzle.solved_at = datetime.utcnow()
-            self.db.commit()
-            self.db.refresh(puzzle)
+            persistence.commit(self.db)
         return puzzle
 
     def is_puzzle_solved(self, session_id: int, room: str, puzzle_number: int) -> bool:
@@ -141,10 +135,6 @@ class PuzzleService:
                 puzzle.solved_at = None
                 reset_count += 1
         
-        self.db.commit()
-        
-        # Refresh tutti i puzzle
-        for puzzle in puzzles:
-            self.db.refresh(puzzle)
+        persistence.commit(self.db)
         
         return reset_count
\ No newline at end of file
@@ -3,6 +3,7 @@ from typing import List, Optional
 from app.models.room import Room
 from app.schemas.room import RoomCreate, RoomUpdate
 import logging
+from app.services import persistence
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +23,7 @@ class RoomService:
 
     def create(self, room_data: RoomCreate) -> Room:
         room = Room(**room_data.model_dump())
-        self.db.add(room)
-        self.db.commit()
-        self.db.refresh(room)
+        persistence.save(self.db, room)
         logger.info(f"Created room: {room.name}")
         return room
 
@@ -37,8 +36,7 @@ class RoomService:
         for field, value in update_data.items():
             setattr(room, field, value)
         
-        self.db.commit()
-        self.db.refresh(room)
+        persistence.commit(self.db)
         logger.info(f"Updated room: {room.name}")
         return room
 
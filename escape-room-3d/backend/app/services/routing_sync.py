@@ -0,0 +1,125 @@
+"""
+Routing Sync - indici di instradamento allineati tra repliche (PostgreSQL LISTEN/NOTIFY)
+
+device_session_router ed element_topic_index sono indici in memoria,
+caricati all'avvio. Con più repliche (MQTT_REPLICA_COUNT) o più worker un
+bind o un elemento creato via REST su una replica era invisibile alle altre:
+il traffico andava alla sessione di fallback (cross-talk) o veniva scartato.
+
+- chi modifica binding/elementi aggiunge un pg_notify alla sua transazione:
+  PostgreSQL lo consegna solo al commit (mai per una modifica annullata)
+- ogni replica ascolta il canale e ricarica l'indice indicato (tabelle
+  piccole: una SELECT), ignorando le notifiche partite da sé stessa
+- la ricarica degli elementi riallinea anche le route MQTT per elemento
+  (listener di element_topic_index)
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.services import persistence
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL = "escape_routing"
+DEVICES = "devices"
+ELEMENTS = "elements"
+
+
+class RoutingSync:
+    """Notifiche di modifica degli indici di instradamento + listener che li ricarica"""
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}-{os.getpid()}"
+        self._connection = None
+        self._reloading: set = set()
+        self.stats = {"sent": 0, "received": 0, "reloads": 0, "errors": 0}
+
+    # ------------------------------------------------------------------ invio
+
+    def stage(self, db: Session, kind: str):
+        """Notifica nella transazione corrente: consegnata alle altre repliche al commit"""
+        if db.get_bind().dialect.name != "postgresql":
+            return   # SQLite nei test: una sola replica
+        payload = json.dumps({"kind": kind, "origin": self.origin})
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+        self.stats["sent"] += 1
+
+    def notify(self, db: Session, kind: str):
+        """Notifica dopo una modifica già committata (service che fanno il loro commit)"""
+        self.stage(db, kind)
+        persistence.commit(db)
+
+    # ------------------------------------------------------------------ ascolto
+
+    async def start(self):
+        if not settings.database_url.startswith("postgresql"):
+            return
+        import asyncpg
+
+        # asyncpg vuole il DSN libpq, senza il driver SQLAlchemy (postgresql+psycopg2://)
+        dsn = "postgresql://" + settings.database_url.split("://", 1)[1]
+        try:
+            self._connection = await asyncpg.connect(dsn)
+            await self._connection.add_listener(CHANNEL, self._on_notification)
+            logger.info(f"🔁 [RoutingSync] Listening on '{CHANNEL}' as {self.origin}")
+        except Exception as e:
+            self._connection = None
+            logger.error(f"❌ [RoutingSync] LISTEN failed, routing indexes are local to this replica: {e}")
+
+    async def stop(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return   # modifica nostra: indice già aggiornato
+        self.stats["received"] += 1
+        kind = message.get("kind")
+        if kind in (DEVICES, ELEMENTS) and kind not in self._reloading:
+            # Una sola ricarica in corso per indice: le notifiche a raffica si fondono
+            self._reloading.add(kind)
+            asyncio.get_running_loop().create_task(self._reload(kind))
+
+    async def _reload(self, kind: str):
+        try:
+            await asyncio.to_thread(self.reload, kind)
+            self.stats["reloads"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ [RoutingSync] Reload of {kind} failed: {e}")
+        finally:
+            self._reloading.discard(kind)
+
+    @staticmethod
+    def reload(kind: str, db: Optional[Session] = None):
+        from app.services.device_session_router import device_session_router
+        from app.services.element_topic_index import element_topic_index
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            if kind == DEVICES:
+                device_session_router.rebuild(db)
+            elif kind == ELEMENTS:
+                element_topic_index.rebuild(db)
+        finally:
+            if own_session:
+                db.close()
+
+
+routing_sync = RoutingSync()
@@ -0,0 +1,207 @@
+"""Session Archive Service - archiviazione a freddo delle sessioni terminate"""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session, defer
+
+from app.core.fast_json import response_cache
+from app.models.archived_session import ArchivedSession
+from app.models.device_session_binding import DeviceSessionBinding
+from app.models.event import Event
+from app.models.game_completion import GameCompletionState
+from app.models.game_session import GameSession
+from app.models.gate_puzzle import GatePuzzle
+from app.models.player import Player
+from app.models.puzzle import Puzzle
+from app.models.session_state import SessionStateEvent, SessionStateSnapshot
+from app.services import persistence
+from app.services.puzzle_fsm import ROOM_FSMS
+from app.services.session_state_store import session_state_store
+
+logger = logging.getLogger(__name__)
+
+
+def _row(instance) -> Dict[str, Any]:
+    """Tutte le colonne di una riga ORM, datetime in ISO 8601"""
+    row = {}
+    for column in instance.__table__.columns:
+        value = getattr(instance, column.key)
+        row[column.name] = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return row
+
+
+class SessionArchiveService:
+    """
+    Sposta le sessioni terminate da più di N giorni fuori dalle tabelle calde.
+
+    Per ogni sessione:
+    1. gli eventi MQTT vengono esportati in `<archive_dir>/session_<id>.jsonl.gz`
+       (scritto su .tmp e rinominato, come gli archivi delle partizioni events)
+    2. in UNA transazione: riga in archived_sessions con il documento completo,
+       DELETE delle righe della sessione da tutte le tabelle calde e della sessione
+
+    Se la transazione fallisce la sessione resta com'era (il file viene
+    riscritto al giro successivo). Le sessioni archiviate restano leggibili
+    con get_archived / list_archived.
+    """
+
+    @staticmethod
+    def _session_rows(db: Session, session_id: int) -> Dict[str, Any]:
+        def rows(model):
+            return [_row(r) for r in db.query(model).filter(model.session_id == session_id).order_by(model.id)]
+
+        def one(model):
+            found = rows(model)
+            return found[0] if found else None
+
+        return {
+            "players": rows(Player),
+            "puzzles": rows(Puzzle),
+            "rooms": {room: one(fsm.spec.model) for room, fsm in ROOM_FSMS.items()},
+            "gate": one(GatePuzzle),
+            "completion": one(GameCompletionState),
+            "state_events": [
+                {"seq": e.seq, "kind": e.kind, "room": e.room, "payload": e.payload,
+                 "created_at": e.created_at.isoformat() if e.created_at else None}
+                for e in db.query(SessionStateEvent).filter(
+                    SessionStateEvent.session_id == session_id
+                ).order_by(SessionStateEvent.seq)
+            ]
+        }
+
+    @staticmethod
+    def _export_events(db: Session, session: GameSession, archive_dir: str) -> Tuple[Optional[str], int]:
+        # Indice (session_id, timestamp) su ogni partizione: niente scansione completa
+        events = db.query(Event).filter(Event.session_id == session.id).order_by(Event.timestamp, Event.id)
+        os.makedirs(archive_dir, exist_ok=True)
+        final_path = os.path.join(archive_dir, f"session_{session.id}.jsonl.gz")
+        tmp_path = final_path + ".tmp"
+
+        count = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+            for event in events.yield_per(1000):
+                archive.write(json.dumps({
+                    "id": event.id,
+                    "element_id": event.element_id,
+                    "timestamp": event.timestamp.isoformat() if event.timestamp else None,
+                    "action": event.action,
+                    "value": event.value
+                }, separators=(",", ":")))
+                archive.write("\n")
+                count += 1
+
+        if count == 0:
+            os.remove(tmp_path)
+            return None, 0
+        os.replace(tmp_path, final_path)
+        return final_path, count
+
+    @staticmethod
+    def archive_session(db: Session, session_id: int, archive_dir: str) -> Optional[ArchivedSession]:
+        """
+        Archivia una sessione terminata.
+
+        Returns:
+            La riga di archived_sessions, None se la sessione non esiste o è ancora attiva
+        """
+        session = db.query(GameSession).filter(GameSession.id == session_id).first()
+        if session is None or session.end_time is None:
+            return None
+
+        events_path, events_count = SessionArchiveService._export_events(db, session, archive_dir)
+        document = SessionArchiveService._session_rows(db, session_id)
+        completion = document["completion"]
+
+        try:
+            archived = ArchivedSession(
+                id=session.id,
+                room_id=session.room_id,
+                pin=session.pin,
+                status=session.status,
+                start_time=session.start_time,
+                end_time=session.end_time,
+                expected_players=session.expected_players,
+                players_count=len(document["players"]),
+                game_won=bool(completion and completion["game_won"]),
+                document=document,
+                events_archive=events_path,
+                events_count=events_count
+            )
+            db.add(archived)
+
+            db.execute(delete(Event).where(Event.session_id == session_id))
+            child_models = [Player, Puzzle, GatePuzzle, GameCompletionState, SessionStateEvent,
+                            SessionStateSnapshot, DeviceSessionBinding] + [fsm.spec.model for fsm in ROOM_FSMS.values()]
+            for model in child_models:
+                db.execute(delete(model).where(model.session_id == session_id))
+            db.execute(delete(GameSession).where(GameSession.id == session_id))
+            persistence.commit(db)
+        except Exception:
+            db.rollback()
+            raise
+
+        db.expunge(session)
+        # Stato in memoria della sessione archiviata (di norma già liberato da end_session)
+        session_state_store.forget(session_id)
+        response_cache.forget(session_id)
+        from app.websocket.state_diff import state_diff_broadcaster
+        state_diff_broadcaster.forget(session_id)
+        logger.info(f"🧊 [SessionArchive] Session {session_id} archived ({events_count} events → {events_path})")
+        return archived
+
+    @staticmethod
+    def archive_ended_sessions(
+        db: Session,
+        older_than_days: int,
+        archive_dir: str,
+        limit: int = 50,
+        now: Optional[datetime] = None
+    ) -> List[int]:
+        """
+        Archivia le sessioni terminate da più di `older_than_days` giorni (al più `limit` per giro).
+
+        Returns:
+            Id delle sessioni archiviate
+        """
+        cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+        candidates = [row[0] for row in db.query(GameSession.id).filter(
+            GameSession.end_time.isnot(None),
+            GameSession.end_time < cutoff
+        ).order_by(GameSession.end_time).limit(limit)]
+
+        archived = []
+        for session_id in candidates:
+            try:
+                if SessionArchiveService.archive_session(db, session_id, archive_dir) is not None:
+                    archived.append(session_id)
+            except Exception as e:
+                logger.error(f"⚠️ [SessionArchive] Session {session_id} not archived: {e}")
+        return archived
+
+    # ------------------------------------------------------------------ lettura
+
+    @staticmethod
+    def list_archived(db: Session, limit: int = 50, offset: int = 0) -> List[ArchivedSession]:
+        """Sessioni archiviate, le più recenti prima (senza caricare i documenti)"""
+        return db.query(ArchivedSession).options(defer(ArchivedSession.document)).order_by(
+            ArchivedSession.end_time.desc(), ArchivedSession.id.desc()
+        ).offset(offset).limit(limit).all()
+
+    @staticmethod
+    def get_archived(db: Session, session_id: int) -> Optional[ArchivedSession]:
+        return db.query(ArchivedSession).filter(ArchivedSession.id == session_id).first()
+
+    @staticmethod
+    def iter_archived_events(archived: ArchivedSession) -> Iterator[Dict[str, Any]]:
+        """Eventi MQTT di una sessione archiviata, riletti dal .jsonl.gz"""
+        if not archived.events_archive or not os.path.exists(archived.events_archive):
+            return
+        with gzip.open(archived.events_archive, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                if line.strip():
+                    yield json.loads(line)
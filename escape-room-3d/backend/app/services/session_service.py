@@ -6,6 +6,10 @@ from app.schemas.game_session import GameSessionCreate, GameSessionUpdate
 import logging
 import secrets
 import string
+from app.core.fast_json import response_cache
+from app.services import persistence
+from app.services.device_session_router import device_session_router
+from app.services.session_state_store import session_state_store
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +25,10 @@ class SessionService:
         return self.db.query(GameSession).filter(GameSession.id == session_id).first()
 
     def get_active(self) -> Optional[GameSession]:
-        return self.db.query(GameSession).filter(GameSession.end_time == None).first()
+        """Sessione attiva più recente (con più sessioni attive usare device_session_router.resolve)"""
+        return self.db.query(GameSession).filter(GameSession.end_time == None).order_by(
+            GameSession.start_time.desc(), GameSession.id.desc()
+        ).first()
 
     def get_active_by_room(self, room_id: int) -> Optional[GameSession]:
         return self.db.query(GameSession).filter(
@@ -29,11 +36,9 @@ class SessionService:
             GameSession.end_time == None
         ).first()
 
-    def create(self, session_data: GameSessionCreate) -> GameSession:
-        session = GameSession(**session_data.model_dump())
-        self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
+    def create(self, session_data: GameSessionCreate, pin: Optional[str] = None) -> GameSession:
+        session = GameSession(**session_data.model_dump(), pin=pin)
+        persistence.save(self.db, session)
         logger.info(f"Created game session: {session.id} for room {session.room_id}")
         return session
 
@@ -46,8 +51,7 @@ class SessionService:
         for field, value in update_data.items():
             setattr(session, field, value)
         
-        self.db.commit()
-        self.db.refresh(session)
+        persistence.commit(self.db)
         logger.info(f"Updated game session: {session.id}")
         return session
 
@@ -57,8 +61,13 @@ class SessionService:
             return None
         
         session.end_time = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(session)
+        # I device tornano liberi per la prossima partita
+        device_session_router.release_session(self.db, session.id)
+        persistence.commit(self.db)
+        session_state_store.forget(session.id)
+        response_cache.forget(session.id)
+        from app.websocket.state_diff import state_diff_broadcaster
+        state_diff_broadcaster.forget(session.id)
         logger.info(f"Ended game session: {session.id}")
         return session
 
@@ -68,8 +77,7 @@ class SessionService:
             return None
         
         session.connected_players += 1
-        self.db.commit()
-        self.db.refresh(session)
+        persistence.commit(self.db)
         return session
 
     def decrement_players(self, session_id: int) -> Optional[GameSession]:
@@ -79,8 +87,7 @@ class SessionService:
         
         if session.connected_players > 0:
             session.connected_players -= 1
-            self.db.commit()
-            self.db.refresh(session)
+            persistence.commit(self.db)
         return session
 
     def generate_unique_pin(self) -> str:
@@ -0,0 +1,290 @@
+"""Session State Store - event log per sessione + proiezione in memoria + snapshot"""
+import copy
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.game_session import GameSession
+from app.models.session_state import SessionStateEvent, SessionStateSnapshot
+from app.services import persistence
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ROOMS = ("cucina", "camera", "bagno", "soggiorno")
+
+
+def initial_state() -> Dict[str, Any]:
+    """Stato di una sessione prima di qualsiasi evento"""
+    return {
+        "rooms": {
+            room: {"puzzles": {}, "leds": {}, "actuators": {}, "completed": False}
+            for room in ROOMS
+        },
+        "gate": {"photocell_clear": False, "completed": False, "rgb_strip_on": False},
+        "game_won": False
+    }
+
+
+def apply_event(state: Dict[str, Any], kind: str, room: Optional[str], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reducer: applica un evento allo stato (in place) e lo restituisce.
+
+    È l'unica funzione che conosce la forma dello stato: proiezione live,
+    recovery da snapshot e replay passano tutti da qui.
+    """
+    if kind in ("puzzle_transition", "puzzle_reset"):
+        room_state = state["rooms"].setdefault(room, {"puzzles": {}, "leds": {}, "actuators": {}, "completed": False})
+        room_state["puzzles"].update(payload.get("statuses", {}))
+        room_state["leds"] = dict(payload.get("leds", {}))
+        room_state["actuators"].update(payload.get("actuators", {}))
+    elif kind == "room_completion":
+        state["rooms"].setdefault(room, {"puzzles": {}, "leds": {}, "actuators": {}, "completed": False})
+        state["rooms"][room]["completed"] = payload["completed"]
+        state["game_won"] = payload.get("game_won", state["game_won"])
+    elif kind == "game_completion_reset":
+        for room_state in state["rooms"].values():
+            room_state["completed"] = False
+        state["game_won"] = False
+    elif kind in ("photocell", "gate_reset"):
+        state["gate"].update(payload)
+    else:
+        logger.warning(f"[SessionState] Unknown event kind '{kind}' ignored")
+    return state
+
+
+class PendingEvent(NamedTuple):
+    """Evento già inserito nella transazione corrente, da proiettare dopo il commit"""
+    session_id: int
+    seq: int
+    kind: str
+    room: Optional[str]
+    payload: Dict[str, Any]
+
+
+class _Projection:
+    __slots__ = ("state", "seq", "since_snapshot")
+
+    def __init__(self, state: Dict[str, Any], seq: int, since_snapshot: int = 0):
+        self.state = state
+        self.seq = seq                      # ultimo evento applicato
+        self.since_snapshot = since_snapshot
+
+
+class SessionStateStore:
+    """
+    Stato di gioco event-sourced.
+
+    - Scrittura: un INSERT in `session_state_events` nella stessa transazione
+      della modifica (stage → commit del chiamante → apply)
+    - Lettura: `get()` restituisce la proiezione in memoria, verificata contro
+      game_sessions.state_seq (eventi di altri processi → riallineamento dal log)
+    - La proiezione serve GET /api/sessions/{id}/state e il replay: gli
+      endpoint delle stanze leggono ancora le loro tabelle
+    - Snapshot: ogni `snapshot_every` eventi la proiezione viene salvata in
+      `session_state_snapshots`; il recovery parte dall'ultimo snapshot
+    - Replay: `replay()` rilegge l'intero log e restituisce lo stato dopo ogni evento
+    """
+
+    def __init__(self, snapshot_every: int = 50):
+        self.snapshot_every = snapshot_every
+        self._projections: Dict[int, _Projection] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ write
+
+    def stage(self, db: Session, session_id: int, kind: str, payload: Dict[str, Any], room: Optional[str] = None) -> PendingEvent:
+        """Aggiunge l'evento alla transazione corrente (senza commit)"""
+        self._projection(db, session_id)
+        seq = self._next_seq(db, session_id)
+        db.execute(insert(SessionStateEvent).values(
+            session_id=session_id, seq=seq, kind=kind, room=room, payload=payload
+        ))
+        return PendingEvent(session_id, seq, kind, room, payload)
+
+    @staticmethod
+    def _next_seq(db: Session, session_id: int) -> int:
+        """
+        Seq assegnato dal database: contatore sulla riga della sessione.
+
+        L'UPDATE tiene il lock sulla riga fino al commit, quindi due processi
+        (o repliche) non ottengono mai lo stesso seq e scrivono in ordine.
+        """
+        return db.execute(
+            update(GameSession)
+            .where(GameSession.id == session_id)
+            .values(state_seq=GameSession.state_seq + 1)
+            .returning(GameSession.state_seq)
+            .execution_options(synchronize_session=False)
+        ).scalar_one()
+
+    def apply(self, db: Session, event: PendingEvent):
+        """
+        Proietta in memoria un evento committato (ed eventualmente scrive lo snapshot).
+
+        I chiamanti finiscono in ordine sparso (thread del threadpool, altre
+        repliche che scrivono sulla stessa sessione): la proiezione avanza solo
+        di seq consecutivi. Un evento già applicato viene ignorato; se manca
+        qualcosa prima di questo evento la proiezione si riallinea dal log
+        (un seq committato implica che i precedenti sono già committati).
+        """
+        projection = self._projections.get(event.session_id)
+        if projection is None:
+            return   # sessione dimenticata nel frattempo: verrà ricaricata dal DB
+        with self._lock:
+            if event.seq <= projection.seq:
+                return
+            in_order = event.seq == projection.seq + 1
+            if in_order:
+                snapshot = self._advance(projection, event.seq, event.kind, event.room, event.payload)
+        if not in_order:
+            self._catch_up(db, event.session_id, projection)
+        elif snapshot is not None:
+            self._write_snapshot(db, event.session_id, *snapshot)
+
+    def _advance(self, projection: _Projection, seq: int, kind: str, room: Optional[str], payload: Dict[str, Any]):
+        """Applica l'evento successivo (lock già preso); restituisce (seq, stato) se va scritto uno snapshot"""
+        apply_event(projection.state, kind, room, payload)
+        projection.seq = seq
+        projection.since_snapshot += 1
+        if projection.since_snapshot < self.snapshot_every:
+            return None
+        # Prefisso senza buchi: lo stato contiene tutti gli eventi fino a seq
+        projection.since_snapshot = 0
+        return seq, copy.deepcopy(projection.state)
+
+    def _catch_up(self, db: Session, session_id: int, projection: _Projection):
+        """Applica dal log gli eventi committati dopo projection.seq (da altri thread o repliche)"""
+        events = self._events_after(db, session_id, projection.seq)
+        snapshot = None
+        with self._lock:
+            for seq, kind, room, payload in events:
+                if seq != projection.seq + 1:
+                    continue   # già applicato da un catch-up concorrente
+                snapshot = self._advance(projection, seq, kind, room, payload) or snapshot
+        if events:
+            logger.debug(f"[SessionState] Session {session_id} caught up to seq {projection.seq}")
+        if snapshot is not None:
+            self._write_snapshot(db, session_id, *snapshot)
+
+    @staticmethod
+    def _events_after(db: Session, session_id: int, seq: int) -> List[tuple]:
+        return db.query(
+            SessionStateEvent.seq, SessionStateEvent.kind, SessionStateEvent.room, SessionStateEvent.payload
+        ).filter(
+            SessionStateEvent.session_id == session_id,
+            SessionStateEvent.seq > seq
+        ).order_by(SessionStateEvent.seq).all()
+
+    def record(self, db: Session, session_id: int, kind: str, payload: Dict[str, Any], room: Optional[str] = None) -> PendingEvent:
+        """stage + commit + apply per gli eventi senza altre scritture nella stessa transazione"""
+        event = self.stage(db, session_id, kind, payload, room)
+        persistence.commit(db)
+        self.apply(db, event)
+        return event
+
+    def _write_snapshot(self, db: Session, session_id: int, seq: int, state: Dict[str, Any]):
+        try:
+            db.execute(insert(SessionStateSnapshot).values(session_id=session_id, seq=seq, state=state))
+            persistence.commit(db)
+            logger.debug(f"📸 [SessionState] Snapshot session {session_id} @ seq {seq}")
+        except Exception as e:
+            # Lo snapshot è solo un'ottimizzazione: il log resta la fonte di verità
+            db.rollback()
+            logger.error(f"❌ [SessionState] Snapshot failed for session {session_id}: {e}")
+
+    # ------------------------------------------------------------------ read
+
+    def get(self, db: Session, session_id: int) -> Dict[str, Any]:
+        """
+        Stato corrente della sessione (copia: il chiamante può modificarla).
+
+        La proiezione è locale al processo: prima della lettura il contatore
+        game_sessions.state_seq dice se altri processi/repliche hanno scritto
+        eventi non ancora applicati qui (un SELECT di una colonna; il log viene
+        letto solo in quel caso).
+        """
+        projection = self._projection(db, session_id)
+        committed = db.query(GameSession.state_seq).filter(GameSession.id == session_id).scalar()
+        if committed is not None and committed > projection.seq:
+            self._catch_up(db, session_id, projection)
+        with self._lock:
+            return {"session_id": session_id, "seq": projection.seq, **copy.deepcopy(projection.state)}
+
+    def seq(self, session_id: int) -> Optional[int]:
+        projection = self._projections.get(session_id)
+        return projection.seq if projection else None
+
+    def _projection(self, db: Session, session_id: int) -> _Projection:
+        projection = self._projections.get(session_id)
+        if projection is not None:
+            return projection
+        loaded = self._load(db, session_id)
+        with self._lock:
+            # Un altro thread potrebbe averla caricata nel frattempo
+            return self._projections.setdefault(session_id, loaded)
+
+    def _load(self, db: Session, session_id: int) -> _Projection:
+        """Ultimo snapshot + eventi successivi"""
+        snapshot = db.query(SessionStateSnapshot).filter(
+            SessionStateSnapshot.session_id == session_id
+        ).order_by(SessionStateSnapshot.seq.desc()).first()
+
+        state = copy.deepcopy(snapshot.state) if snapshot else initial_state()
+        seq = snapshot.seq if snapshot else 0
+
+        events = self._events_after(db, session_id, seq)
+        for event_seq, kind, room, payload in events:
+            apply_event(state, kind, room, payload)
+            seq = event_seq
+
+        return _Projection(state, seq, since_snapshot=len(events))
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def recover(self, db: Session) -> int:
+        """Carica in memoria le proiezioni delle sessioni ancora aperte (avvio backend)"""
+        session_ids = [row[0] for row in db.query(GameSession.id).filter(GameSession.end_time.is_(None)).all()]
+        for session_id in session_ids:
+            self._projection(db, session_id)
+        logger.info(f"🧠 [SessionState] Recovered {len(session_ids)} session projections")
+        return len(session_ids)
+
+    def forget(self, session_id: int):
+        """Libera la proiezione di una sessione terminata"""
+        with self._lock:
+            self._projections.pop(session_id, None)
+
+    # ------------------------------------------------------------------ replay
+
+    def replay(self, db: Session, session_id: int, until_seq: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Rigioca la sessione dal primo evento (senza snapshot).
+
+        Returns:
+            Lista di step {seq, kind, room, payload, created_at, state} con lo stato dopo ogni evento
+        """
+        query = db.query(SessionStateEvent).filter(SessionStateEvent.session_id == session_id)
+        if until_seq is not None:
+            query = query.filter(SessionStateEvent.seq <= until_seq)
+
+        state = initial_state()
+        steps = []
+        for event in query.order_by(SessionStateEvent.seq).all():
+            apply_event(state, event.kind, event.room, event.payload)
+            steps.append({
+                "seq": event.seq,
+                "kind": event.kind,
+                "room": event.room,
+                "payload": event.payload,
+                "created_at": event.created_at,
+                "state": copy.deepcopy(state)
+            })
+        return steps
+
+
+session_state_store = SessionStateStore(snapshot_every=settings.session_snapshot_every)
@@ -1,6 +1,6 @@
 import asyncio
 import logging
-from typing import Dict, Any, Set
+from typing import Dict, Any, Optional, Set
 from datetime import datetime
 import socketio
 
@@ -32,6 +32,8 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     logger.info(f"Socket.IO client disconnected: {sid}")
+    from app.websocket.mqtt_bridge import mqtt_bridge
+    mqtt_bridge.drop(sid)
     if sid in player_info:
         info = player_info[sid]
         session_id = info.get('sessionId')
@@ -541,6 +543,121 @@ async def requestPlayersList(sid, data):
     }, to=sid)
 
 
+@sio.event
+async def requestStateSnapshot(sid, data):
+    """
+    Snapshot completo dello stato di gioco (puzzle, LED, completamento).
+    
+    Il client lo richiede quando rileva un buco di versione nei messaggi state_diff.
+    """
+    try:
+        session_id = int(data.get('sessionId'))
+    except (TypeError, ValueError):
+        logger.warning(f"requestStateSnapshot: invalid sessionId from {sid}: {data}")
+        return
+    if not _sid_in_session(sid, session_id):
+        # Stato completo e diff emessi nella sessione: solo per i socket che vi sono entrati
+        logger.warning(f"requestStateSnapshot: {sid} is not in session {session_id} - ignored")
+        return
+    
+    from app.websocket.state_diff import state_diff_broadcaster
+    try:
+        snapshot = await state_diff_broadcaster.snapshot(session_id)
+    except Exception as e:
+        logger.error(f"❌ requestStateSnapshot failed for session {session_id}: {e}")
+        return
+    
+    await sio.emit('state_snapshot', snapshot, to=sid)
+
+
+@sio.event
+async def requestMqttSnapshot(sid, data):
+    """
+    Ultimo valore di ogni topic MQTT della sessione, in una risposta sola.
+    
+    Dopo una riconnessione il client ha subito il quadro dei device, senza polling REST.
+    Solo le radici topic dei device della sessione, e solo per una sessione a cui
+    il socket si è unito: un client non può leggere i device di un'altra casa.
+    """
+    from app.mqtt.last_value import mqtt_last_values
+    from app.services.device_session_router import device_session_router
+    
+    try:
+        session_id = int((data or {}).get('sessionId'))
+    except (AttributeError, TypeError, ValueError):
+        logger.warning(f"requestMqttSnapshot: invalid sessionId from {sid}: {data}")
+        return
+    if not _sid_in_session(sid, session_id):
+        logger.warning(f"requestMqttSnapshot: {sid} is not in session {session_id} - ignored")
+        return
+    
+    roots = device_session_router.topic_roots(session_id)
+    await sio.emit('mqtt_snapshot', {'topics': mqtt_last_values.snapshot(roots)}, to=sid)
+
+
+def _sid_in_session(sid: str, session_id: int) -> bool:
+    """Il socket è entrato nella sessione (joinSession/registerPlayer/joinLobby)?"""
+    info = player_info.get(sid) or {}
+    if str(info.get('sessionId')) == str(session_id):
+        return True
+    return f"session_{session_id}" in sio.rooms(sid)
+
+
+@sio.event
+async def subscribeMqtt(sid, data):
+    """
+    Abbona il socket a pattern MQTT relativi alla radice della casa (es. ['esterno/#']).
+    
+    I messaggi arrivano raggruppati nell'evento mqtt_batch, solo per i topic
+    della sessione. Senza patterns e con room: tutti i topic della stanza.
+    Solo per la sessione a cui il socket si è unito: un client non può
+    leggere i device di un'altra casa cambiando sessionId.
+    """
+    from app.mqtt.last_value import mqtt_last_values
+    from app.services.device_session_router import device_session_router
+    from app.websocket.mqtt_bridge import mqtt_bridge
+    
+    data = data if isinstance(data, dict) else {}
+    patterns = data.get('patterns') or ([f"{data['room']}/#"] if data.get('room') else [])
+    try:
+        session_id = int(data.get('sessionId'))
+        if not _sid_in_session(sid, session_id):
+            raise ValueError(f"Socket not in session {session_id}")
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        full_patterns = mqtt_bridge.expand(patterns, device_session_router.topic_roots(session_id))
+        added = mqtt_bridge.subscribe(sid, full_patterns)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"subscribeMqtt rejected for {sid}: {data} ({e})")
+        await sio.emit('mqttSubscriptionFailed', {'error': str(e), 'patterns': patterns}, to=sid)
+        return
+    
+    # Quadro iniziale: ultimi valori noti dei nuovi pattern nel primo batch
+    mqtt_bridge.queue_last_values(sid, added, mqtt_last_values.snapshot())
+    await sio.emit('mqttSubscribed', {'patterns': mqtt_bridge.patterns(sid)}, to=sid)
+
+
+@sio.event
+async def unsubscribeMqtt(sid, data):
+    """Disabbona il socket dai pattern indicati (relativi alla radice), da tutti se patterns manca"""
+    from app.services.device_session_router import device_session_router
+    from app.websocket.mqtt_bridge import mqtt_bridge
+    
+    data = data if isinstance(data, dict) else {}
+    patterns = data.get('patterns')
+    if patterns is None:
+        mqtt_bridge.unsubscribe(sid)
+    else:
+        try:
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            mqtt_bridge.unsubscribe(sid, mqtt_bridge.expand(patterns, device_session_router.topic_roots(int(data.get('sessionId')))))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"unsubscribeMqtt: invalid request from {sid}: {data} ({e})")
+            return
+    await sio.emit('mqttSubscribed', {'patterns': mqtt_bridge.patterns(sid)}, to=sid)
+
+
 @sio.event
 async def toggleTestBypass(sid, data):
     """Sincronizza il test bypass (tasto K) tra tutti i giocatori della stessa stanza"""
@@ -727,52 +844,46 @@ async def releaseInteractionLock(sid, data):
 
 @sio.event
 async def adminResetGame(sid, data):
-    """Admin resetta TUTTE le sessioni ed espelle TUTTI i giocatori"""
-    session_id = data.get('sessionId')
+    """Admin resetta la SUA sessione ed espelle i giocatori di quella sessione (le altre case continuano)"""
+    try:
+        # I giocatori sono indicizzati con l'id numerico: "7" dalla dashboard non deve mancare session_players[7]
+        session_id = int(data.get('sessionId'))
+    except (TypeError, ValueError):
+        logger.warning(f"⚠️ adminResetGame without a valid sessionId ({data.get('sessionId')!r}) - ignored")
+        return
     
-    logger.info(f"🔴 ADMIN RESET ALL SESSIONS - Triggered from session {session_id}")
+    logger.info(f"🔴 ADMIN RESET SESSION {session_id}")
     
-    # BROADCAST GLOBALE a TUTTI i socket connessi (inclusi quelli che hanno URL diretti)
-    logger.info(f"Broadcasting gameReset to ALL connected sockets")
+    # Broadcast solo ai socket della sessione
     await sio.emit('gameReset', {
-        'message': '🔴 TUTTE le sessioni sono state chiuse dall\'admin. Torna alla pagina di inserimento PIN.',
-        'reason': 'admin_reset_all'
-    })  # Nessun parametro room = broadcast a tutti
-    
-    # Ottieni tutte le session_id attive
-    all_sessions = list(session_players.keys())
-    
-    logger.info(f"Found {len(all_sessions)} active sessions to reset: {all_sessions}")
-    
-    # Resetta TUTTE le sessioni
-    for sid_to_reset in all_sessions:
-        logger.info(f"Resetting session {sid_to_reset}")
-        
-        # Rimuovi tutti i giocatori dalla sessione
-        if sid_to_reset in session_players:
-            for nickname, player_sid in session_players[sid_to_reset].items():
-                if player_sid in player_info:
-                    del player_info[player_sid]
-            
-            # Svuota la sessione
-            session_players[sid_to_reset] = {}
-        
-        # Aggiorna la lista giocatori (ora vuota)
-        await sio.emit('updatePlayersList', {
-            'players': [],
-            'count': 0
-        }, room=f"session_{sid_to_reset}")
-    
-    # Svuota anche active_sessions
-    active_sessions.clear()
+        'message': '🔴 La sessione è stata chiusa dall\'admin. Torna alla pagina di inserimento PIN.',
+        'reason': 'admin_reset_session',
+        'sessionId': session_id
+    }, room=f"session_{session_id}")
     
-    # Pulisci anche player_info (tutti i socket)
-    player_info.clear()
+    # Rimuovi i giocatori della sessione (registrati in lobby o entrati in una stanza)
+    for player_sid in list(session_players.get(session_id, {}).values()):
+        player_info.pop(player_sid, None)
+    for player_sid in [s for s, info in player_info.items() if info.get('sessionId') == session_id]:
+        del player_info[player_sid]
+    session_players[session_id] = {}
+    active_sessions.pop(session_id, None)
+    for lock_key in [k for k in interaction_locks if k.startswith(f"{session_id}:")]:
+        task = interaction_locks.pop(lock_key).get('timeout_task')
+        if task:
+            task.cancel()
+    
+    # Aggiorna la lista giocatori (ora vuota)
+    await sio.emit('updatePlayersList', {
+        'players': [],
+        'count': 0
+    }, room=f"session_{session_id}")
     
-    logger.info(f"✅ All {len(all_sessions)} sessions reset - ALL sockets expelled - player_info cleared")
+    logger.info(f"✅ Session {session_id} reset - its sockets expelled")
 
 
-async def broadcast_element_update(room_name: str, element: str, action: str, value: Any):
+async def broadcast_element_update(room_name: str, element: str, action: str, value: Any, session_id: Optional[int] = None):
+    """Aggiornamento di un elemento hardware ai client della sessione del device (a tutti se session_id è None)"""
     message = {
         'type': 'element_update',
         'room': room_name,
@@ -781,10 +892,13 @@ async def broadcast_element_update(room_name: str, element: str, action: str, va
         'value': value,
         'timestamp': datetime.utcnow().isoformat() + 'Z'
     }
+    target = f"session_{session_id}" if session_id is not None else None
+    if session_id is not None:
+        message['session_id'] = session_id
     await sio.emit('globalNotification', {
         'message': f'{element} in {room_name}: {action}'
-    })
-    await sio.emit('globalStateUpdate', message)
+    }, room=target)
+    await sio.emit('globalStateUpdate', message, room=target)
 
 
 async def broadcast_to_session(session_id: str, event: str, data: Dict[str, Any]):
@@ -902,7 +1016,7 @@ async def broadcast_game_completion_update(session_id: int, completion_state):
     game_won = completion_state.get('game_won', False)
     try:
         from app.mqtt_client import MQTTClient
-        await MQTTClient.publish_game_won(game_won)
+        await MQTTClient.publish_game_won(game_won, session_id)
         logger.info(f"✅ MQTT publish successful: game_won={game_won}")
     except Exception as e:
         logger.error(f"⚠️ MQTT publish failed (non-blocking): {e}")
@@ -939,8 +1053,8 @@ class WebSocketHandler:
         self.sio = sio
         self.socket_app = socket_app
 
-    async def broadcast_element_update(self, room_name: str, element: str, action: str, value: Any):
-        await broadcast_element_update(room_name, element, action, value)
+    async def broadcast_element_update(self, room_name: str, element: str, action: str, value: Any, session_id: Optional[int] = None):
+        await broadcast_element_update(room_name, element, action, value, session_id)
 
     async def broadcast_to_session(self, session_id: str, event: str, data: Dict[str, Any]):
         await broadcast_to_session(session_id, event, data)
@@ -0,0 +1,227 @@
+"""
+MQTT → Socket.IO Bridge - ogni socket riceve solo i topic MQTT che ha chiesto
+
+Le scene che leggono i device (animazione del cancello da escape/esterno/...)
+ricevevano tutto tramite globalStateUpdate, anche i messaggi che non le
+riguardano. Con il bridge il client si abbona ai pattern che gli servono:
+
+    socket.emit('subscribeMqtt', {sessionId: 7, patterns: ['esterno/#']})
+    socket.on('mqtt_batch', ({messages}) => ...)
+
+- i pattern sono relativi alla radice della casa e vengono espansi sulle
+  radici topic della sessione (escape/esterno/#, escape2/esterno/#, ...):
+  un client non riceve i device di un'altra casa
+- indice con refcount: un pattern compare una volta sola nel trie
+  (TopicRouter), qualunque sia il numero di socket abbonati; esce dal trie
+  quando l'ultimo socket si disabbona o si disconnette
+- nel router MQTT del backend il bridge registra solo i pattern abbonati
+  (sul topic canonico): senza abbonati i topic non entrano nemmeno in coda
+- i messaggi vengono raccolti per socket e inviati ogni `tick_ms` in un
+  unico evento mqtt_batch; nello stesso tick l'ultimo valore di un topic vince
+- all'abbonamento il socket riceve subito gli ultimi valori noti (LastValueCache)
+
+Il lavoro è proporzionale ai socket interessati, non ai socket connessi.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.config import get_settings
+from app.mqtt.router import TopicRouter, mqtt_router, validate_pattern
+from app.services.device_session_router import canonical_topic
+from app.websocket.handler import sio
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class MQTTSocketBridge:
+    """pattern MQTT completo → socket abbonati (refcount), batch per socket a ogni tick"""
+
+    def __init__(self, tick_ms: int = 50, max_patterns: int = 32, router: Optional[TopicRouter] = None):
+        self.tick = tick_ms / 1000
+        self.max_patterns = max_patterns
+        # Router MQTT del backend: riceve una route per pattern canonico abbonato
+        self.router = router
+        self._routed: Dict[str, int] = {}               # pattern canonico → pattern completi abbonati
+        self._index = TopicRouter()
+        self._subscribers: Dict[str, Set[str]] = {}      # pattern → sid
+        self._patterns: Dict[str, Set[str]] = {}         # sid → pattern
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}  # sid → topic → messaggio
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"matched": 0, "forwarded": 0, "coalesced": 0, "batches": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🌉 [MQTTBridge] Started (batch every {self.tick * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._pending.clear()
+        logger.info(f"🌉 [MQTTBridge] Stopped: {self.stats}")
+
+    # ------------------------------------------------------------ abbonamenti
+
+    @staticmethod
+    def expand(patterns: Iterable[str], roots: Iterable[str]) -> List[str]:
+        """Pattern relativi ("esterno/#") → pattern completi sulle radici della sessione"""
+        expanded = []
+        for pattern in patterns:
+            if not isinstance(pattern, str) or not pattern.strip("/"):
+                raise ValueError(f"Invalid MQTT pattern {pattern!r}")
+            pattern = pattern.strip("/")
+            for root in roots:
+                full = f"{root}/{pattern}"
+                validate_pattern(full)
+                expanded.append(full)
+        return expanded
+
+    def subscribe(self, sid: str, patterns: Iterable[str]) -> List[str]:
+        """Abbona il socket ai pattern completi; restituisce quelli nuovi per il socket"""
+        current = self._patterns.get(sid, set())
+        added = [pattern for pattern in dict.fromkeys(patterns) if pattern not in current]
+        if len(current) + len(added) > self.max_patterns:
+            raise ValueError(f"Too many MQTT patterns for one socket (max {self.max_patterns})")
+        if added:
+            self._patterns[sid] = current
+        for pattern in added:
+            current.add(pattern)
+            subscribers = self._subscribers.get(pattern)
+            if subscribers is None:
+                # Primo abbonato: il pattern entra nel trie
+                subscribers = self._subscribers[pattern] = set()
+                self._index.add(pattern, self._route_handler(pattern), name=pattern)
+                self._route(pattern, +1)
+            subscribers.add(sid)
+        return added
+
+    def unsubscribe(self, sid: str, patterns: Optional[Iterable[str]] = None) -> int:
+        """Disabbona il socket dai pattern (tutti se None); i pattern senza abbonati escono dal trie"""
+        current = self._patterns.get(sid, set())
+        removed = [pattern for pattern in (current.copy() if patterns is None else patterns) if pattern in current]
+        for pattern in removed:
+            current.discard(pattern)
+            subscribers = self._subscribers.get(pattern)
+            if subscribers is None:
+                continue
+            subscribers.discard(sid)
+            if not subscribers:
+                del self._subscribers[pattern]
+                self._index.remove(pattern)
+                self._route(pattern, -1)
+        if not current:
+            self._patterns.pop(sid, None)
+            self._pending.pop(sid, None)
+        return len(removed)
+
+    def _route(self, pattern: str, delta: int):
+        """Refcount dei pattern canonici nel router del backend (escape/... ed escape2/... → una route)"""
+        if self.router is None:
+            return
+        canonical = canonical_topic(pattern)
+        count = self._routed.get(canonical, 0) + delta
+        if count > 0:
+            if canonical not in self._routed:
+                self.router.add(canonical, self.handle_message, name=f"socket_bridge:{canonical}")
+            self._routed[canonical] = count
+        else:
+            self._routed.pop(canonical, None)
+            self.router.remove(f"socket_bridge:{canonical}")
+
+    def drop(self, sid: str):
+        """Socket disconnesso: via tutti i suoi abbonamenti"""
+        self.unsubscribe(sid)
+
+    def patterns(self, sid: str) -> List[str]:
+        return sorted(self._patterns.get(sid, ()))
+
+    # ---------------------------------------------------------------- messaggi
+
+    def _route_handler(self, pattern: str):
+        async def forward(data: Dict[str, Any]):
+            for sid in self._subscribers.get(pattern, ()):
+                self._queue(sid, data)
+        return forward
+
+    async def handle_message(self, data: Dict[str, Any]):
+        """Handler per il router MQTT: topic reale (con la radice della casa) contro l'indice dei pattern"""
+        topic = data.get("raw_topic")
+        if not topic or not self._subscribers:
+            return
+        await self._index.dispatch(data, topic)
+
+    def _queue(self, sid: str, data: Dict[str, Any], received_at: Optional[float] = None):
+        topic = data["raw_topic"]
+        pending = self._pending.setdefault(sid, {})
+        if topic in pending:
+            # Pattern sovrapposti o valore più recente nello stesso tick: un solo messaggio
+            self.stats["coalesced"] += 1
+        pending[topic] = {
+            "topic": topic,
+            "value": data.get("value"),
+            "received_at": received_at if received_at is not None else time.time()
+        }
+        self.stats["matched"] += 1
+        if self._wake is not None:
+            self._wake.set()
+
+    def queue_last_values(self, sid: str, patterns: Iterable[str], last_values: Dict[str, Dict[str, Any]]):
+        """Ultimi valori noti dei topic dei pattern appena abbonati, nel prossimo batch"""
+        wanted = set(patterns)
+        for topic, entry in last_values.items():
+            # I pattern sono già nel trie: basta il match del topic
+            if any(route.pattern in wanted for route in self._index.match(topic)):
+                self._queue(sid, {"raw_topic": topic, "value": entry["value"]}, entry["received_at"])
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Finestra del tick: i messaggi arrivati nel frattempo viaggiano nello stesso batch
+            await asyncio.sleep(self.tick)
+            self._wake.clear()
+            await self._flush()
+
+    async def _flush(self):
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        await asyncio.gather(*(self._emit(sid, messages) for sid, messages in batch.items()))
+
+    async def _emit(self, sid: str, messages: Dict[str, Dict[str, Any]]):
+        try:
+            await sio.emit('mqtt_batch', {'messages': list(messages.values())}, to=sid)
+            self.stats["batches"] += 1
+            self.stats["forwarded"] += len(messages)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ [MQTTBridge] Emit to {sid} failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "sockets": len(self._patterns),
+            "patterns": {pattern: len(sids) for pattern, sids in sorted(self._subscribers.items())},
+            "pending": sum(len(messages) for messages in self._pending.values())
+        }
+
+
+mqtt_bridge = MQTTSocketBridge(
+    tick_ms=settings.mqtt_bridge_tick_ms,
+    max_patterns=settings.mqtt_bridge_max_patterns,
+    router=mqtt_router
+)
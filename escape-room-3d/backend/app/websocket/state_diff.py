@@ -0,0 +1,219 @@
+"""State Diff Broadcaster - un solo messaggio versionato per ogni cambio di stato"""
+import asyncio
+import copy
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from app.database import SessionLocal
+from app.websocket.handler import sio
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Letture del documento dal DB per uno snapshot se nel frattempo arrivano publish()
+SNAPSHOT_ATTEMPTS = 3
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Differenza ricorsiva: solo le chiavi di `new` il cui valore è cambiato.
+
+    Le chiavi non vengono mai rimosse dal documento (le risposte delle stanze
+    hanno forma fissa), quindi un diff contiene solo aggiunte/modifiche.
+    """
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif previous is _MISSING or previous != value:
+            changes[key] = value
+    return changes
+
+
+def merge(document: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Applica un diff al documento (in place): stessa logica del client"""
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(document.get(key), dict):
+            merge(document[key], value)
+        else:
+            document[key] = copy.deepcopy(value)
+    return document
+
+
+def room_document(room_state: Any) -> Dict[str, Any]:
+    """Risposta di una stanza (schema Pydantic o dict) → documento JSON senza session_id"""
+    document = jsonable_encoder(room_state)
+    document.pop("session_id", None)
+    return document
+
+
+def completion_document(state) -> Dict[str, Any]:
+    """GameCompletionState → documento (LED porta derivati dalla bitmask, nessuna query)"""
+    from app.services.game_completion_service import GameCompletionService
+
+    document = jsonable_encoder(GameCompletionService.state_document(state))
+    document.pop("session_id", None)
+    document.pop("updated_at", None)
+    return document
+
+
+def build_session_document(db, session_id: int) -> Dict[str, Any]:
+    """Documento completo della sessione letto dal DB (usato per gli snapshot richiesti dai client)"""
+    from app.services.kitchen_puzzle_service import KitchenPuzzleService
+    from app.services.bedroom_puzzle_service import BedroomPuzzleService
+    from app.services.bathroom_puzzle_service import BathroomPuzzleService
+    from app.services.livingroom_puzzle_service import LivingRoomPuzzleService
+    from app.services.game_completion_service import GameCompletionService
+
+    livingroom = LivingRoomPuzzleService.get_or_create(db, session_id)
+    return {
+        "rooms": {
+            "cucina": room_document(KitchenPuzzleService.get_state_response(db, session_id)),
+            "camera": room_document(BedroomPuzzleService.get_state_response(db, session_id)),
+            "bagno": room_document(BathroomPuzzleService.get_state_response(db, session_id)),
+            "soggiorno": room_document(LivingRoomPuzzleService._build_response(livingroom))
+        },
+        "completion": completion_document(GameCompletionService.get_or_create_state(db, session_id))
+    }
+
+
+class StateDiffBroadcaster:
+    """
+    Documento composito per sessione {rooms: {stanza: stato}, completion: {...}}
+    e broadcast incrementale.
+
+    Ogni transizione produce UN messaggio `state_diff` con tutto ciò che è
+    cambiato (stati puzzle, LED, LED porta, completamento) e un numero di
+    versione per sessione. Il client applica il diff se `base_version`
+    coincide con la sua versione; altrimenti (messaggio perso, riavvio del
+    backend → `epoch` diverso) emette `requestStateSnapshot` e riceve
+    `state_snapshot` con il documento completo.
+    """
+
+    def __init__(self):
+        self.epoch = int(time.time() * 1000)
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        self._versions: Dict[int, int] = {}
+
+    def version(self, session_id: int) -> int:
+        return self._versions.get(session_id, 0)
+
+    def _commit(self, session_id: int, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Applica il diff al documento del server e assegna la nuova versione (nessun await: atomico nel loop)"""
+        merge(self._documents.setdefault(session_id, {}), changes)
+        version = self.version(session_id) + 1
+        self._versions[session_id] = version
+        return {
+            "type": "state_diff",
+            "session_id": session_id,
+            "epoch": self.epoch,
+            "version": version,
+            "base_version": version - 1,
+            "changes": changes
+        }
+
+    async def publish(
+        self,
+        session_id: int,
+        room: Optional[str] = None,
+        room_state: Any = None,
+        completion=None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Calcola ed emette il diff di una transizione.
+
+        Args:
+            room / room_state: stanza e nuova risposta (schema o dict)
+            completion: GameCompletionState già caricato, se la transizione ha toccato il completamento
+
+        Returns:
+            Il messaggio emesso, None se non è cambiato nulla
+        """
+        rooms = {room: room_state} if room is not None and room_state is not None else {}
+        return await self.publish_rooms(session_id, rooms, completion)
+
+    async def publish_rooms(
+        self,
+        session_id: int,
+        rooms: Dict[str, Any],
+        completion=None
+    ) -> Optional[Dict[str, Any]]:
+        """Come publish() ma per più stanze insieme (es. reset globale): sempre UN solo messaggio"""
+        update: Dict[str, Any] = {}
+        if rooms:
+            update["rooms"] = {room: room_document(room_state) for room, room_state in rooms.items()}
+        if completion is not None:
+            update["completion"] = completion_document(completion)
+
+        changes = diff(self._documents.get(session_id, {}), update)
+        message = self._commit(session_id, changes) if changes else None
+
+        broadcasts = []
+        if completion is not None:
+            broadcasts.append(self._publish_game_won(completion.game_won, session_id))
+        if message is not None:
+            logger.info(f"📡 [StateDiff] Session {session_id} v{message['version']}: {list(changes)}")
+            broadcasts.append(sio.emit("state_diff", message, room=f"session_{session_id}"))
+        # MQTT (ESP32) e Socket.IO (browser) in parallelo
+        await asyncio.gather(*broadcasts)
+        return message
+
+    async def snapshot(self, session_id: int) -> Dict[str, Any]:
+        """
+        Documento completo riletto dal DB.
+
+        Se differisce da quello in memoria (es. dopo un riavvio) la differenza
+        viene prima emessa come diff, così tutti i client restano allineati.
+        Un publish() arrivato durante la lettura rende il documento letto
+        vecchio: viene scartato e la lettura ripetuta (mai un diff all'indietro).
+        """
+        for _ in range(SNAPSHOT_ATTEMPTS):
+            version = self.version(session_id)
+            document = await asyncio.to_thread(self._load_document, session_id)
+            if self.version(session_id) != version:
+                logger.info(f"📡 [StateDiff] Session {session_id} changed during snapshot load, reloading")
+                continue
+            changes = diff(self._documents.get(session_id, {}), document)
+            if changes:
+                message = self._commit(session_id, changes)
+                await sio.emit("state_diff", message, room=f"session_{session_id}")
+            break
+
+        return {
+            "type": "state_snapshot",
+            "session_id": session_id,
+            "epoch": self.epoch,
+            "version": self.version(session_id),
+            "state": copy.deepcopy(self._documents.get(session_id, {}))
+        }
+
+    def forget(self, session_id: int):
+        self._documents.pop(session_id, None)
+        self._versions.pop(session_id, None)
+
+    @staticmethod
+    def _load_document(session_id: int) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return build_session_document(db, session_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    async def _publish_game_won(game_won: bool, session_id: int):
+        # 🏆 MQTT: stato vittoria agli ESP32 (NON-BLOCKING, come broadcast_game_completion_update)
+        try:
+            from app.mqtt_client import MQTTClient
+            await MQTTClient.publish_game_won(game_won, session_id)
+        except Exception as e:
+            logger.error(f"⚠️ MQTT publish failed (non-blocking): {e}")
+
+
+state_diff_broadcaster = StateDiffBroadcaster()
@@ -0,0 +1,253 @@
+"""
+Benchmark Ingest MQTT - quanti messaggi al secondo assorbe il backend
+
+Riproduce il traffico di più schede sul broker in-process (tests/mqtt_broker.py)
+e lo fa passare per il percorso completo del backend:
+
+    scheda → broker → MQTTHandler (router, coda di ingest, codec)
+           → handle_mqtt_message (indice topic, merge stato, event_sink)
+           → Socket.IO emit
+
+Misura il throughput e la latenza dal publish della scheda all'emit
+Socket.IO (p50/p95/p99/max). Il mix di traffico ricalca le schede reali:
+sensori veloci (fotocellula, peso pentola), servo, LED e topic senza elemento
+(heartbeat, scartati dall'indice).
+
+Senza --database il passo DB (merge dello stato nel threadpool, batch di
+event_sink) è un'attesa di --db-latency-ms: misura il percorso asincrono con un
+database di latenza nota. Con --database usa il PostgreSQL di DATABASE_URL
+(schema e seed già presenti, indice topic ricostruito dalla tabella elements,
+almeno una sessione attiva: senza sessione il backend non emette nulla).
+
+Uso (dalla cartella backend):
+    python -m tests.bench_mqtt_ingest --boards 6 --seconds 10 --rate 5
+    python -m tests.bench_mqtt_ingest --flood --messages 20000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+import aiomqtt
+
+from app import main as app_main
+from app.mqtt import handler as handler_module
+from app.mqtt.handler import MQTTHandler
+from app.mqtt.router import TopicRouter
+from app.services.element_topic_index import element_topic_index
+from app.services.event_sink import event_sink
+from app.websocket import handler as ws_module
+from tests.mqtt_broker import InProcessBroker
+
+# profilo scheda → [(topic, messaggi/s, generatore del payload)]; i topic .../heartbeat non hanno elemento
+TRAFFIC_MIX: Dict[str, List[Tuple[str, float, Callable[[], dict]]]] = {
+    "esterno": [
+        ("escape/esterno/ir-sensor/stato", 10, lambda: {"libero": random.random() < 0.5, "raw_value": random.randint(0, 1)}),
+        ("escape/esterno/cancello1/posizione", 2, lambda: {"position": random.randint(0, 90), "target": 90}),
+        ("escape/esterno/led/stato", 1, lambda: {"color": random.choice(["rosso", "verde"])}),
+        ("escape/esterno/heartbeat", 1, lambda: {"uptime": int(time.monotonic())}),
+    ],
+    "cucina": [
+        ("escape/kitchen/pot/weight", 5, lambda: {"weight": random.randint(0, 2000)}),
+        ("escape/kitchen/fridge/door", 1, lambda: {"open": random.random() < 0.2}),
+        ("escape/kitchen/heartbeat", 1, lambda: {"uptime": int(time.monotonic())}),
+    ],
+    "soggiorno": [
+        ("escape/livingroom/sofa/cushion", 2, lambda: {"pressed": random.random() < 0.3}),
+        ("escape/livingroom/tv/state", 0.5, lambda: {"on": True, "channel": random.randint(1, 9)}),
+    ],
+    "camera": [
+        ("escape/bedroom/bed/state", 1, lambda: {"occupied": random.random() < 0.5}),
+        ("escape/bedroom/nightstand/drawer", 1, lambda: {"open": random.random() < 0.5}),
+    ],
+    "bagno": [
+        ("escape/bathroom/sink/state", 2, lambda: {"water_running": random.random() < 0.5}),
+    ],
+    "serra": [
+        ("escape/greenhouse/temperature/value", 1, lambda: {"temperature": round(random.uniform(18, 30), 1), "humidity": 60}),
+    ],
+}
+
+INDEXED_TOPICS = [
+    topic
+    for topics in TRAFFIC_MIX.values()
+    for topic, _, _ in topics
+    if not topic.endswith("/heartbeat")
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class EmitRecorder:
+    """Sostituisce sio.emit: registra la latenza publish → emit dei globalStateUpdate"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.last_emit = 0.0
+
+    async def emit(self, event, data=None, **kwargs):
+        if event != "globalStateUpdate":
+            return
+        value = data.get("value") if isinstance(data, dict) else None
+        if isinstance(value, dict) and "bench_ts" in value:
+            now = time.perf_counter()
+            self.latencies.append(now - value["bench_ts"])
+            self.last_emit = now
+
+
+def simulate_database(db_latency_ms: float):
+    """Passo DB a latenza fissa: merge dello stato (threadpool) e batch di eventi"""
+    delay = db_latency_ms / 1000
+
+    def apply_mqtt_update(element_id: int, data: dict):
+        time.sleep(delay)
+        return True, 1
+
+    app_main.apply_mqtt_update = apply_mqtt_update
+    event_sink._write_batch = lambda rows: time.sleep(delay)
+    for element_id, topic in enumerate(INDEXED_TOPICS, start=1):
+        element_topic_index.upsert(SimpleNamespace(id=element_id, name=topic.split("/")[2], room_id=1, mqtt_topic=topic))
+
+
+def board_streams(boards: int) -> List[Tuple[str, List[Tuple[str, float, Callable[[], dict]]]]]:
+    """N schede: i profili del mix ripetuti ciclicamente, ognuna col suo device_id"""
+    profiles = itertools.cycle(TRAFFIC_MIX.items())
+    return [(f"esp32-{name}-{i}", topics) for i, (name, topics) in zip(range(boards), profiles)]
+
+
+async def publish_at_rate(client: aiomqtt.Client, device_id: str, topic: str, rate: float, payload: Callable, until: float, counter: dict):
+    interval = 1 / rate
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.perf_counter() < until:
+        value = {**payload(), "device_id": device_id, "bench_ts": time.perf_counter()}
+        await client.publish(topic, json.dumps(value))
+        counter["published"] += 1
+        counter["indexed"] += topic in INDEXED_TOPICS
+        await asyncio.sleep(interval)
+
+
+async def publish_flood(client: aiomqtt.Client, device_id: str, topics, messages: int, counter: dict):
+    for topic, _, payload in itertools.islice(itertools.cycle(topics), messages):
+        value = {**payload(), "device_id": device_id, "bench_ts": time.perf_counter()}
+        await client.publish(topic, json.dumps(value))
+        counter["published"] += 1
+        counter["indexed"] += topic in INDEXED_TOPICS
+
+
+async def run(args) -> dict:
+    recorder = EmitRecorder()
+    ws_module.sio.emit = recorder.emit
+    if args.database:
+        db = app_main.SessionLocal()
+        try:
+            element_topic_index.rebuild(db)
+        finally:
+            db.close()
+    else:
+        simulate_database(args.db_latency_ms)
+    await event_sink.start()
+
+    async with InProcessBroker() as broker:
+        handler_module.settings.mqtt_host = broker.host
+        handler_module.settings.mqtt_port = broker.port
+        router = TopicRouter()
+        router.add("escape/#", app_main.handle_mqtt_message, name="elements")
+        handler = MQTTHandler(router=router)
+        handler_task = asyncio.create_task(handler.connect())
+        while not handler.connected:
+            await asyncio.sleep(0.01)
+
+        counter = {"published": 0, "indexed": 0}
+        streams = board_streams(args.boards)
+        clients = [aiomqtt.Client(broker.host, port=broker.port, identifier=device_id) for device_id, _ in streams]
+        for client in clients:
+            await client.__aenter__()
+
+        started = time.perf_counter()
+        if args.flood:
+            per_board = max(1, args.messages // len(streams))
+            await asyncio.gather(*(
+                publish_flood(client, device_id, topics, per_board, counter)
+                for client, (device_id, topics) in zip(clients, streams)
+            ))
+        else:
+            until = started + args.seconds
+            await asyncio.gather(*(
+                publish_at_rate(client, device_id, topic, rate * args.rate, payload, until, counter)
+                for client, (device_id, topics) in zip(clients, streams)
+                for topic, rate, payload in topics
+            ))
+        published_at = time.perf_counter()
+
+        # Attende lo svuotamento della coda (messaggi scartati per overflow esclusi)
+        deadline = time.perf_counter() + args.drain_timeout
+        while time.perf_counter() < deadline:
+            ingest = handler.ingest.metrics()
+            expected = counter["indexed"] - ingest["dropped"] - ingest["coalesced"]
+            if len(recorder.latencies) >= expected and ingest["depth"] == 0:
+                break
+            await asyncio.sleep(0.02)
+
+        for client in clients:
+            await client.__aexit__(None, None, None)
+        await handler.disconnect()
+        handler_task.cancel()
+        try:
+            await handler_task
+        except asyncio.CancelledError:
+            pass
+        ingest = handler.ingest.metrics()
+    await event_sink.stop()
+
+    latencies_ms = [latency * 1000 for latency in recorder.latencies]
+    elapsed = max(recorder.last_emit, published_at) - started
+    return {
+        "mode": "flood" if args.flood else f"rate x{args.rate}",
+        "boards": len(streams),
+        "published": counter["published"],
+        "published_per_s": round(counter["published"] / (published_at - started), 1),
+        "emitted": len(latencies_ms),
+        "emitted_per_s": round(len(latencies_ms) / elapsed, 1) if elapsed else 0.0,
+        "dropped": ingest["dropped"],
+        "coalesced": ingest["coalesced"],
+        "queue_wait_avg_ms": ingest["queue_wait_avg_ms"],
+        "queue_wait_max_ms": ingest["queue_wait_max_ms"],
+        "latency_p50_ms": round(percentile(latencies_ms, 0.50), 2),
+        "latency_p95_ms": round(percentile(latencies_ms, 0.95), 2),
+        "latency_p99_ms": round(percentile(latencies_ms, 0.99), 2),
+        "latency_max_ms": round(max(latencies_ms, default=0.0), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT ingest benchmark (in-process broker)")
+    parser.add_argument("--boards", type=int, default=len(TRAFFIC_MIX), help="schede simulate (profili del mix ripetuti)")
+    parser.add_argument("--seconds", type=float, default=10, help="durata in modalità a frequenza")
+    parser.add_argument("--rate", type=float, default=1.0, help="moltiplicatore delle frequenze del mix")
+    parser.add_argument("--flood", action="store_true", help="pubblica il più velocemente possibile")
+    parser.add_argument("--messages", type=int, default=10000, help="messaggi totali in modalità flood")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="latenza del passo DB simulato")
+    parser.add_argument("--database", action="store_true", help="usa il PostgreSQL di DATABASE_URL")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="attesa massima dello svuotamento coda (s)")
+    parser.add_argument("--log-level", default="WARNING", help="livello di log durante il benchmark")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    results = asyncio.run(run(args))
+    print("📊 MQTT ingest benchmark")
+    for key, value in results.items():
+        print(f"  {key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
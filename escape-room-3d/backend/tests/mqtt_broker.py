@@ -0,0 +1,283 @@
+"""
+Broker MQTT 3.1.1 in-process - sostituto di Mosquitto per test e benchmark
+
+Niente container né schede: un server asyncio su 127.0.0.1 (porta libera)
+che parla abbastanza MQTT 3.1.1 per aiomqtt/paho e per le ESP32:
+
+- CONNECT/CONNACK (un client id già connesso viene disconnesso, come Mosquitto)
+- PUBLISH QoS 0/1/2 in ingresso, consegna con QoS min(pubblicazione, subscription)
+- messaggi retained (payload vuoto = cancellazione)
+- SUBSCRIBE/UNSUBSCRIBE con wildcard + e # (i topic $... esclusi dalle wildcard al primo livello)
+- shared subscription $share/<gruppo>/<filtro>: ogni messaggio a un solo membro del gruppo (round-robin)
+- PINGREQ/PINGRESP, DISCONNECT
+
+Uso:
+
+    async with InProcessBroker() as broker:
+        async with aiomqtt.Client("127.0.0.1", port=broker.port) as client:
+            ...
+"""
+import asyncio
+import itertools
+import logging
+import struct
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Corrispondenza MQTT di un topic con un filtro (+ un livello, # tutti i livelli rimanenti)"""
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def shared_group(topic_filter: str) -> Tuple[Optional[str], str]:
+    """"$share/backend/escape/#" → ("backend", "escape/#"); filtro normale → (None, filtro)"""
+    if topic_filter.startswith("$share/"):
+        _, group, real_filter = topic_filter.split("/", 2)
+        return group, real_filter
+    return None, topic_filter
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _read_string(body: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", body, offset)
+    start = offset + 2
+    return body[start:start + length].decode("utf-8"), start + length
+
+
+class _Connection:
+    def __init__(self, broker: "InProcessBroker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id: Optional[str] = None
+        self.subscriptions: Dict[str, int] = {}
+        self._packet_ids = itertools.cycle(range(1, 65536))
+        self.closed = False
+
+    def send(self, data: bytes):
+        if not self.closed:
+            self.writer.write(data)
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool = False):
+        body = _string(topic)
+        if qos:
+            body += struct.pack("!H", next(self._packet_ids))
+        body += payload
+        self.send(_packet(PUBLISH, (qos << 1) | int(retain), body))
+        self.broker.stats["delivered"] += 1
+
+    async def _read_packet(self) -> Tuple[int, int, bytes]:
+        header = await self.reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await self.reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    async def run(self):
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet()
+                if packet_type == CONNECT:
+                    self._on_connect(body)
+                elif packet_type == PUBLISH:
+                    self._on_publish(flags, body)
+                elif packet_type == PUBREL:
+                    self.send(_packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    self._on_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._on_unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.send(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                # PUBACK/PUBREC/PUBCOMP dei client: consegna best-effort, nessuna ritrasmissione
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.close()
+
+    def _on_connect(self, body: bytes):
+        _, offset = _read_string(body, 0)          # "MQTT"
+        offset += 4                                # livello protocollo, flag, keepalive
+        self.client_id, _ = _read_string(body, offset)
+        if not self.client_id:
+            # Client id vuoto (clean session): il broker ne assegna uno
+            self.client_id = f"auto-{id(self):x}"
+        self.broker._register(self)
+        self.send(_packet(CONNACK, 0, b"\x00\x00"))
+
+    def _on_publish(self, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic, offset = _read_string(body, 0)
+        packet_id = body[offset:offset + 2] if qos else b""
+        payload = body[offset + 2:] if qos else body[offset:]
+        if qos == 1:
+            self.send(_packet(PUBACK, 0, packet_id))
+        elif qos == 2:
+            self.send(_packet(PUBREC, 0, packet_id))
+        self.broker.publish(topic, payload, qos, retain)
+
+    def _on_subscribe(self, body: bytes):
+        packet_id, offset = body[:2], 2
+        granted = []
+        new_filters = []
+        while offset < len(body):
+            topic_filter, offset = _read_string(body, offset)
+            qos = min(body[offset] & 0x03, 2)
+            offset += 1
+            self.subscriptions[topic_filter] = qos
+            new_filters.append((topic_filter, qos))
+            granted.append(qos)
+        self.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+        for topic_filter, qos in new_filters:
+            group, real_filter = shared_group(topic_filter)
+            if group is not None:
+                # Come Mosquitto: niente retained sulle shared subscription
+                continue
+            for topic, (payload, retained_qos) in self.broker.retained.items():
+                if topic_matches(real_filter, topic):
+                    self.deliver(topic, payload, min(qos, retained_qos), retain=True)
+
+    def _on_unsubscribe(self, body: bytes):
+        packet_id, offset = body[:2], 2
+        while offset < len(body):
+            topic_filter, offset = _read_string(body, offset)
+            self.subscriptions.pop(topic_filter, None)
+        self.send(_packet(UNSUBACK, 0, packet_id))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.broker._unregister(self)
+        self.writer.close()
+
+
+class InProcessBroker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.retained: Dict[str, Tuple[bytes, int]] = {}
+        self.stats = {"connections": 0, "published": 0, "delivered": 0}
+        self._share_turns: Dict[Tuple[str, str], int] = {}
+        self._clients: Dict[str, _Connection] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: List[_Connection] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self) -> "InProcessBroker":
+        self._server = await asyncio.start_server(self._accept, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for connection in list(self._connections):
+            connection.close()
+        # Le connessioni chiuse terminano alla lettura successiva (EOF)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "InProcessBroker":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    @property
+    def client_ids(self) -> List[str]:
+        return sorted(self._clients)
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        connection = _Connection(self, reader, writer)
+        self._connections.append(connection)
+        self.stats["connections"] += 1
+        await connection.run()
+
+    def _register(self, connection: _Connection):
+        previous = self._clients.get(connection.client_id)
+        if previous is not None and previous is not connection:
+            # Stesso client id: il vecchio viene buttato fuori (comportamento Mosquitto)
+            previous.close()
+        self._clients[connection.client_id] = connection
+
+    def _unregister(self, connection: _Connection):
+        if connection in self._connections:
+            self._connections.remove(connection)
+        if self._clients.get(connection.client_id) is connection:
+            del self._clients[connection.client_id]
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        """Instrada un messaggio a tutti i client con una subscription corrispondente"""
+        self.stats["published"] += 1
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        deliveries: Dict[_Connection, int] = {}
+        shared: Dict[Tuple[str, str], List[Tuple[_Connection, int]]] = {}
+        for connection in list(self._connections):
+            for topic_filter, sub_qos in connection.subscriptions.items():
+                group, real_filter = shared_group(topic_filter)
+                if not topic_matches(real_filter, topic):
+                    continue
+                if group is None:
+                    # Sovrapposizioni di filtri: una sola copia con la QoS più alta
+                    deliveries[connection] = max(deliveries.get(connection, 0), sub_qos)
+                else:
+                    shared.setdefault((group, real_filter), []).append((connection, sub_qos))
+        for key, members in shared.items():
+            # Un solo membro per gruppo, a turno
+            turn = self._share_turns.get(key, 0)
+            self._share_turns[key] = turn + 1
+            connection, sub_qos = members[turn % len(members)]
+            deliveries[connection] = max(deliveries.get(connection, 0), sub_qos)
+        for connection, granted in deliveries.items():
+            connection.deliver(topic, payload, min(qos, granted))
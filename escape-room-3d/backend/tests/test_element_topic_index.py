@@ -0,0 +1,74 @@
+"""
+Test Element Topic Index - topic condiviso da più elementi
+
+Come la vecchia query `.first()`: il topic risolve sempre all'elemento con
+l'id più basso, anche dopo upsert/remove. Niente database.
+"""
+from types import SimpleNamespace
+
+from app.services.element_topic_index import ElementTopicIndex
+
+TOPIC = "escape/cucina/pentola/stato"
+
+
+def element(id, topic=TOPIC, room_id=1):
+    return SimpleNamespace(id=id, name=f"element-{id}", room_id=room_id, mqtt_topic=topic)
+
+
+def test_lowest_id_wins_regardless_of_upsert_order():
+    index = ElementTopicIndex()
+    index.upsert(element(5))
+    index.upsert(element(3))
+    index.upsert(element(9))
+    assert index.resolve(TOPIC).id == 3
+    assert index.topics() == [TOPIC]
+
+
+def test_remove_falls_back_to_next_lowest_id():
+    index = ElementTopicIndex()
+    for id in (3, 5, 9):
+        index.upsert(element(id))
+    index.remove(3)
+    assert index.resolve(TOPIC).id == 5
+    index.remove(9)
+    assert index.resolve(TOPIC).id == 5
+    index.remove(5)
+    assert index.resolve(TOPIC) is None
+    assert index.topics() == []
+
+
+def test_topic_change_releases_old_topic():
+    index = ElementTopicIndex()
+    index.upsert(element(3))
+    index.upsert(element(5))
+    index.upsert(element(3, topic="escape/cucina/frigo/stato"))
+    assert index.resolve(TOPIC).id == 5
+    assert index.resolve("escape/cucina/frigo/stato").id == 3
+    index.upsert(element(5, topic=None))
+    assert index.resolve(TOPIC) is None
+    assert len(index) == 1
+
+
+def test_listeners_notified_on_change():
+    index = ElementTopicIndex()
+    calls = []
+    index.add_listener(lambda: calls.append(index.topics()))
+    index.upsert(element(3))
+    index.remove(3)
+    assert calls == [[TOPIC], []]
+
+
+def test_remove_room_drops_its_elements_with_one_notification():
+    index = ElementTopicIndex()
+    calls = []
+    index.upsert(element(3, room_id=1))
+    index.upsert(element(4, topic="escape/cucina/frigo/stato", room_id=1))
+    index.upsert(element(5, room_id=2))
+    index.add_listener(lambda: calls.append(index.topics()))
+
+    assert index.remove_room(1) == 2
+    # Il topic condiviso passa all'elemento dell'altra stanza
+    assert index.resolve(TOPIC).id == 5
+    assert index.resolve("escape/cucina/frigo/stato") is None
+    assert calls == [[TOPIC]]
+    assert index.remove_room(1) == 0 and len(calls) == 1
@@ -0,0 +1,185 @@
+"""
+Test Game Completion - completed_mask / ROOM_BITS
+
+- letture derivate dalla bitmask (LED porta, vittoria, conteggio) confrontate
+  con la vecchia logica per stanza su tutte le 16 combinazioni
+- upsert di stage_room_completion compilato per PostgreSQL: bit impostato o
+  azzerato, version incrementata, game_won ricavato dalla nuova maschera
+
+L'upsert usa ON CONFLICT e JSONB (solo PostgreSQL): qui si verifica lo
+statement generato, non serve lo stack Docker.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.game_completion import ALL_ROOMS_MASK, ROOM_BITS, GameCompletionState
+from app.services import game_completion_service
+from app.services.game_completion_service import GameCompletionService
+
+ROOMS = ["cucina", "camera", "bagno", "soggiorno"]
+
+
+def baseline_door_leds(completed_rooms, game_won):
+    # Logica storica: vittoria → tutte verdi, stanza completata → lampeggio, altrimenti rosso
+    return {
+        room: "green" if game_won else "blinking" if room in completed_rooms else "red"
+        for room in ROOMS
+    }
+
+
+def state_for(mask):
+    return GameCompletionState(session_id=1, completed_mask=mask, game_won=mask == ALL_ROOMS_MASK)
+
+
+def test_room_bits_are_distinct_and_cover_all_rooms():
+    assert sorted(ROOM_BITS) == sorted(ROOMS)
+    assert sum(ROOM_BITS.values()) == ALL_ROOMS_MASK
+    assert all(bit & (bit - 1) == 0 for bit in ROOM_BITS.values())
+
+
+@pytest.mark.parametrize("mask", range(ALL_ROOMS_MASK + 1))
+def test_mask_reads_match_baseline(mask):
+    completed_rooms = {room for room in ROOMS if mask & ROOM_BITS[room]}
+    state = state_for(mask)
+
+    assert {room for room in ROOMS if state.is_room_completed(room)} == completed_rooms
+    assert state.get_completed_rooms_count() == len(completed_rooms)
+    assert state.is_game_complete() == (len(completed_rooms) == 4)
+    assert state.door_led_states() == baseline_door_leds(completed_rooms, state.game_won)
+
+
+def test_unknown_room_is_never_completed():
+    assert not state_for(ALL_ROOMS_MASK).is_room_completed("garage")
+
+
+# ------------------------------------------------------ upsert compilato
+
+class CapturingDB:
+    """Session finta: registra lo statement e restituisce la riga di RETURNING"""
+
+    def __init__(self, updated=True):
+        self.statements = []
+        self.updated = updated
+        self.existing = GameCompletionState(session_id=7, completed_mask=ALL_ROOMS_MASK, version=4, game_won=True)
+
+    def scalars(self, stmt, execution_options=None):
+        self.statements.append(stmt)
+        updated = self.updated
+
+        class Result:
+            def one_or_none(self):
+                if not updated:
+                    return None   # ramo UPDATE escluso dalla WHERE
+                return GameCompletionState(session_id=7, completed_mask=0, version=1, game_won=False)
+
+        return Result()
+
+    def query(self, model):
+        existing = self.existing
+
+        class Query:
+            def filter(self, *criteria):
+                return self
+
+            def first(self):
+                return existing
+
+        return Query()
+
+
+@pytest.fixture
+def staged(monkeypatch):
+    staged = {"analytics": [], "events": []}
+    monkeypatch.setattr(
+        game_completion_service.GameAnalyticsService, "stage_room_completed",
+        lambda *args: staged["analytics"].append(args)
+    )
+
+    def stage_event(*args, **kwargs):
+        staged["events"].append(args)
+        return ("event", args)
+
+    monkeypatch.setattr(game_completion_service.session_state_store, "stage", stage_event)
+    return staged
+
+
+@pytest.fixture
+def db(staged):
+    return CapturingDB()
+
+
+def compile_upsert(stmt):
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+@pytest.mark.parametrize("room", ROOMS)
+def test_mark_sets_the_room_bit(db, room):
+    state, event = GameCompletionService.stage_room_completion(db, 7, room, True)
+
+    assert state is not None and event is not None
+    sql, params = compile_upsert(db.statements[0])
+    bit = ROOM_BITS[room]
+    assert "ON CONFLICT (session_id) DO UPDATE" in sql
+    assert "game_completion_states.completed_mask | %(completed_mask_1)s" in sql
+    assert params["completed_mask_1"] == bit
+    # Riga nuova: solo il bit della stanza
+    assert params["completed_mask"] == bit
+    assert "version = (game_completion_states.version + %(version_1)s)" in sql
+    # game_won ricavato dalla nuova maschera; victory_time solo alla prima vittoria
+    assert "game_won = ((game_completion_states.completed_mask | %(completed_mask_1)s) = %(param_2)s)" in sql
+    assert params["param_2"] == ALL_ROOMS_MASK
+    assert "CASE WHEN (game_completion_states.game_won IS false AND" in sql
+    # Stanza già completata: il ramo UPDATE non scatta
+    assert "WHERE (game_completion_states.completed_mask & %(completed_mask_2)s) = %(param_6)s RETURNING" in sql
+    assert params["completed_mask_2"] == bit and params["param_6"] == 0
+
+
+@pytest.mark.parametrize("room", ROOMS)
+def test_unmark_clears_only_the_room_bit(db, room):
+    GameCompletionService.stage_room_completion(db, 7, room, False)
+
+    sql, params = compile_upsert(db.statements[0])
+    assert "game_completion_states.completed_mask & %(completed_mask_1)s" in sql
+    assert params["completed_mask_1"] == ALL_ROOMS_MASK & ~ROOM_BITS[room]
+    assert params["completed_mask"] == 0
+    assert "game_won = %(param_2)s, victory_time = %(param_3)s" in sql
+    assert params["param_2"] is False
+    assert params["param_3"] is None
+
+
+def test_mark_merges_room_status_into_rooms_status(db):
+    GameCompletionService.stage_room_completion(db, 7, "bagno", True)
+
+    sql, params = compile_upsert(db.statements[0])
+    assert "game_completion_states.rooms_status || CAST(" in sql
+    initial = params["rooms_status"]
+    assert initial["bagno"]["completed"] is True
+    datetime.fromisoformat(initial["bagno"]["completion_time"])
+    assert all(initial[room] == {"completed": False} for room in ROOMS if room != "bagno")
+
+
+def test_already_completed_room_stages_nothing(staged):
+    db = CapturingDB(updated=False)
+
+    state, event = GameCompletionService.stage_room_completion(db, 7, "cucina", True)
+
+    # Stato attuale restituito, niente evento né analytics (version e completion_time intatti)
+    assert state is db.existing and event is None
+    assert staged == {"analytics": [], "events": []}
+
+
+def test_mark_room_completed_twice_does_not_commit(staged, monkeypatch):
+    commits = []
+    monkeypatch.setattr(game_completion_service.persistence, "commit", commits.append)
+    db = CapturingDB(updated=False)
+
+    assert GameCompletionService.mark_room_completed(db, 7, "cucina") is db.existing
+    assert commits == []
+
+
+def test_invalid_room_writes_nothing(db):
+    assert GameCompletionService.stage_room_completion(db, 7, "garage", True) == (None, None)
+    assert db.statements == []
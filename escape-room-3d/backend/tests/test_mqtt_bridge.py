@@ -0,0 +1,100 @@
+"""
+Test MQTT Bridge - abbonamenti Socket.IO ai topic MQTT (refcount, batch per tick)
+
+sio.emit sostituito da un registratore: niente server Socket.IO né broker.
+"""
+import asyncio
+
+import pytest
+
+from app.websocket import mqtt_bridge as bridge_module
+from app.websocket.mqtt_bridge import MQTTSocketBridge
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit(event, data=None, to=None, **kwargs):
+        sent.append((event, to, data))
+
+    monkeypatch.setattr(bridge_module.sio, "emit", emit)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_bridge_forwards_only_subscribed_topics_in_batches(emitted):
+    bridge = MQTTSocketBridge(tick_ms=10)
+    await bridge.start()
+    bridge.subscribe("gate", bridge.expand(["esterno/#"], ["escape"]))
+    bridge.subscribe("kitchen", bridge.expand(["cucina/+/peso"], ["escape"]))
+
+    for position in (10, 45, 90):
+        await bridge.handle_message({"raw_topic": "escape/esterno/cancello1/posizione", "value": {"position": position}})
+    await bridge.handle_message({"raw_topic": "escape/esterno/ir-sensor/stato", "value": {"libero": True}})
+    await bridge.handle_message({"raw_topic": "escape2/esterno/ir-sensor/stato", "value": {"libero": False}})
+    await asyncio.sleep(0.05)
+    await bridge.stop()
+
+    # Un solo batch, solo al socket del cancello; l'ultimo valore del tick vince
+    assert [(event, to) for event, to, _ in emitted] == [("mqtt_batch", "gate")]
+    messages = {m["topic"]: m["value"] for m in emitted[0][2]["messages"]}
+    assert messages == {
+        "escape/esterno/cancello1/posizione": {"position": 90},
+        "escape/esterno/ir-sensor/stato": {"libero": True},
+    }
+
+
+def test_bridge_refcounts_patterns():
+    bridge = MQTTSocketBridge()
+    pattern = bridge.expand(["esterno/#"], ["escape"])
+    bridge.subscribe("a", pattern)
+    bridge.subscribe("b", pattern)
+    assert bridge.metrics()["patterns"] == {"escape/esterno/#": 2}
+
+    bridge.drop("a")
+    assert bridge.metrics()["patterns"] == {"escape/esterno/#": 1}
+    bridge.unsubscribe("b", pattern)
+    assert bridge.metrics()["patterns"] == {} and bridge.metrics()["sockets"] == 0
+
+    with pytest.raises(ValueError):
+        bridge.expand(["esterno/#/x"], ["escape"])
+
+
+def test_bridge_registers_only_subscribed_patterns_in_the_backend_router():
+    from app.mqtt.router import TopicRouter
+
+    router = TopicRouter()
+    bridge = MQTTSocketBridge(router=router)
+    assert not router.matches("escape/esterno/cancello1/posizione")
+
+    bridge.subscribe("a", ["escape/esterno/#"])
+    bridge.subscribe("b", ["escape/esterno/#"])
+    assert router.matches("escape/esterno/cancello1/posizione")
+
+    bridge.drop("a")
+    assert router.matches("escape/esterno/cancello1/posizione")
+    bridge.drop("b")
+    assert not router.matches("escape/esterno/cancello1/posizione")
+
+
+@pytest.mark.asyncio
+async def test_subscribe_requires_the_socket_to_be_in_the_session(emitted, monkeypatch):
+    from app.websocket import handler
+    from app.websocket.mqtt_bridge import mqtt_bridge
+
+    monkeypatch.setattr(handler.sio, "rooms", lambda sid, namespace=None: [sid])
+    monkeypatch.setitem(handler.player_info, "intruder", {"sessionId": 8})
+    monkeypatch.setitem(handler.player_info, "player", {"sessionId": 7})
+    try:
+        await handler.subscribeMqtt("intruder", {"sessionId": 7, "patterns": ["esterno/#"]})
+        await handler.subscribeMqtt("player", {"sessionId": "7", "patterns": ["esterno/#"]})
+
+        assert [(event, to) for event, to, _ in emitted] == [
+            ("mqttSubscriptionFailed", "intruder"),
+            ("mqttSubscribed", "player"),
+        ]
+        assert mqtt_bridge.patterns("intruder") == []
+        assert mqtt_bridge.patterns("player") == ["escape/esterno/#"]
+    finally:
+        mqtt_bridge.drop("player")
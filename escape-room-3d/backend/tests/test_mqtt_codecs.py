@@ -0,0 +1,55 @@
+"""
+Test MQTT Codecs - codec per prefisso e fallback JSON
+
+Un payload JSON corto non deve mai essere letto come struct binario: il
+codec del topic lo rifiuta e il registro ritenta in JSON.
+"""
+import pytest
+
+from app.mqtt.codecs import CODECS, Codec, CodecRegistry
+
+SERVO_TOPIC = "escape2/esterno/cancello1/posizione"
+IR_TOPIC = "escape/esterno/ir-sensor/stato"
+
+
+@pytest.fixture
+def registry():
+    registry = CodecRegistry()
+    registry.configure("esterno/cancello=servo,esterno/ir-sensor=ir")
+    return registry
+
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        Codec()
+
+
+def test_struct_round_trip(registry):
+    servo = registry.encode(SERVO_TOPIC, {"position": 90, "target": 0})
+    assert len(servo) == 3
+    assert registry.decode(SERVO_TOPIC, servo) == {"position": 90, "target": 0}
+    ir = registry.encode(IR_TOPIC, {"libero": True, "raw_value": 1})
+    assert registry.decode(IR_TOPIC, ir) == {"libero": True, "raw_value": 1}
+    assert registry.stats["fallbacks"] == 0
+
+
+@pytest.mark.parametrize("topic,payload,expected", [
+    (SERVO_TOPIC, b"90", 90),                       # 2 byte come "<BB": resta JSON
+    (SERVO_TOPIC, b'{"position": 90, "target": 0}', {"position": 90, "target": 0}),
+    (IR_TOPIC, b"10", 10),
+    (IR_TOPIC, b"true", True),
+])
+def test_short_json_falls_back(registry, topic, payload, expected):
+    assert registry.decode(topic, payload) == expected
+    assert registry.stats["fallbacks"] == 1
+
+
+def test_servo_rejects_out_of_range_angles():
+    with pytest.raises(ValueError):
+        CODECS["servo"].decode(b"\xb1\xff\x00")
+
+
+def test_wrong_magic_is_rejected():
+    ir = CODECS["ir"].encode({"libero": False, "raw_value": 0})
+    with pytest.raises(ValueError):
+        CODECS["servo"].decode(ir)
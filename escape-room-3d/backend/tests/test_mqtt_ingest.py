@@ -0,0 +1,183 @@
+"""
+Test MQTT Ingest - percorso MQTT reale su broker in-process
+
+Connessione, subscribe, router, coda di ingest, codec e outbox del
+publisher contro tests/mqtt_broker.py: non servono Mosquitto, Node
+(simulate-esp32.cjs) né le schede.
+"""
+import asyncio
+import json
+
+import aiomqtt
+import pytest
+import pytest_asyncio
+
+from app.mqtt import handler as handler_module
+from app.mqtt.handler import MQTTHandler
+from app.mqtt.publisher import MQTTPublisher
+from app.mqtt.router import TopicRouter
+from tests.mqtt_broker import InProcessBroker
+
+
+async def wait_until(predicate, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+@pytest_asyncio.fixture
+async def broker(monkeypatch):
+    async with InProcessBroker() as broker:
+        monkeypatch.setattr(handler_module.settings, "mqtt_host", broker.host)
+        monkeypatch.setattr(handler_module.settings, "mqtt_port", broker.port)
+        monkeypatch.setattr(handler_module.settings, "mqtt_reconnect_min_seconds", 0.05)
+        monkeypatch.setattr(handler_module.settings, "mqtt_reconnect_max_seconds", 0.2)
+        yield broker
+
+
+@pytest_asyncio.fixture
+async def run_handler():
+    tasks = []
+
+    async def start(handler: MQTTHandler):
+        tasks.append((handler, asyncio.create_task(handler.connect())))
+        await wait_until(lambda: handler.connected)
+
+    yield start
+
+    for handler, task in tasks:
+        await handler.disconnect()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+@pytest.mark.asyncio
+async def test_broker_routes_wildcards_and_retained(broker):
+    broker.publish("escape/esterno/ir-sensor/stato", b'{"libero": true}', retain=True)
+
+    async with aiomqtt.Client(broker.host, port=broker.port) as board, \
+            aiomqtt.Client(broker.host, port=broker.port) as frontend:
+        await frontend.subscribe("escape/+/ir-sensor/stato")
+        await board.publish("escape/cucina/pentola/peso", "120")
+        await board.publish("escape/bagno/ir-sensor/stato", "false")
+
+        received = []
+        async with asyncio.timeout(2):
+            async for message in frontend.messages:
+                received.append((str(message.topic), message.payload, message.retain))
+                if len(received) == 2:
+                    break
+
+    assert received == [
+        ("escape/esterno/ir-sensor/stato", b'{"libero": true}', True),
+        ("escape/bagno/ir-sensor/stato", b"false", False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_handler_dispatches_only_routed_topics(broker, run_handler):
+    router = TopicRouter()
+    received = []
+
+    async def on_esterno(data):
+        received.append(data)
+
+    router.add("escape/esterno/#", on_esterno, name="esterno")
+    handler = MQTTHandler(router=router)
+    await run_handler(handler)
+
+    async with aiomqtt.Client(broker.host, port=broker.port) as board:
+        await board.publish("escape/cucina/pentola/peso", "120")
+        await board.publish(
+            "escape/esterno/ir-sensor/stato",
+            json.dumps({"libero": True, "raw_value": 1, "device_id": "esp32-esterno"})
+        )
+        await wait_until(lambda: received)
+
+    data = received[0]
+    assert data["room"] == "esterno" and data["element"] == "ir-sensor" and data["action"] == "stato"
+    assert data["value"] == {"libero": True, "raw_value": 1, "device_id": "esp32-esterno"}
+    assert data["device_id"] == "esp32-esterno"
+    # Il topic senza route è scartato prima della coda di ingest
+    assert handler.ingest.stats["enqueued"] == 1
+
+
+@pytest.mark.asyncio
+async def test_publisher_replays_outbox_after_reconnect(broker, run_handler, tmp_path):
+    handler = MQTTHandler(router=TopicRouter())
+    publisher = MQTTPublisher(
+        flush_interval_ms=5,
+        outbox_path=str(tmp_path / "outbox.jsonl"),
+        command_prefixes=("game-completion/",)
+    )
+    await publisher.start(handler.send)
+    handler.add_connect_listener(publisher.replay)
+
+    # Broker non ancora raggiunto: il comando resta nell'outbox (anche su disco)
+    await publisher.publish("escape/game-completion/won", "true")
+    await wait_until(lambda: publisher.metrics()["outbox"] == 1)
+    assert (tmp_path / "outbox.jsonl").exists()
+
+    async with aiomqtt.Client(broker.host, port=broker.port) as board:
+        await board.subscribe("escape/game-completion/#", qos=1)
+        await run_handler(handler)
+
+        async with asyncio.timeout(2):
+            async for message in board.messages:
+                assert (str(message.topic), message.payload, message.qos) == ("escape/game-completion/won", b"true", 1)
+                break
+
+    await wait_until(lambda: publisher.metrics()["outbox"] == 0)
+    assert publisher.stats["replayed"] == 1
+    await publisher.stop()
+
+
+def test_shared_subscription_is_refused(monkeypatch):
+    # $share darebbe a ogni replica solo parte del traffico: cache e bridge incompleti
+    monkeypatch.setattr(handler_module.settings, "mqtt_shared_group", "backend")
+    with pytest.raises(ValueError, match="MQTT_SHARED_GROUP"):
+        MQTTHandler(router=TopicRouter())
+
+
+@pytest.mark.asyncio
+async def test_replica_ring_splits_domain_routes_but_not_replica_wide_ones(broker, run_handler, monkeypatch):
+    monkeypatch.setattr(handler_module.settings, "mqtt_replica_count", 2)
+    domain = {0: [], 1: []}
+    last_values = {0: [], 1: []}
+    replicas = []
+    for index in domain:
+        monkeypatch.setattr(handler_module.settings, "mqtt_replica_index", index)
+        router = TopicRouter()
+
+        async def on_element(data, index=index):
+            domain[index].append(data["raw_topic"])
+
+        async def on_last_value(data, index=index):
+            last_values[index].append(data["raw_topic"])
+
+        router.add("escape/#", on_element, name="elements")
+        router.add("escape/#", on_last_value, name="last_value")
+        replica = MQTTHandler(router=router)
+        # Stesso processo: client id distinti come su due host
+        replica.identifier = f"escape-backend-{index}"
+        replicas.append(replica)
+    for replica in replicas:
+        await run_handler(replica)
+
+    topics = [f"escape/cucina/sensore{i}/stato" for i in range(10)]
+    async with aiomqtt.Client(broker.host, port=broker.port) as board:
+        for topic in topics:
+            await board.publish(topic, "1")
+        await wait_until(lambda: len(last_values[0]) == len(last_values[1]) == 10)
+        await wait_until(lambda: len(domain[0]) + len(domain[1]) == 10)
+
+    # Handler di dominio: ogni topic sulla sola replica proprietaria
+    assert sorted(domain[0] + domain[1]) == sorted(topics)
+    assert all(replicas[0].replica_ring.node_for(topic) == 0 for topic in domain[0])
+    # Cache ultimi valori (per processo): tutto il traffico su ogni replica
+    assert sorted(last_values[0]) == sorted(last_values[1]) == sorted(topics)
@@ -0,0 +1,92 @@
+"""
+Test MQTT Router - trie dei pattern (+, #), dispatch a tutti gli handler, route per elemento
+
+Puro Python: niente broker né database.
+"""
+import pytest
+
+from app.mqtt.router import TopicRouter, validate_pattern
+
+
+def names(router: TopicRouter, topic: str):
+    return [route.name for route in router.match(topic)]
+
+
+def test_wildcards_and_exact_patterns():
+    router = TopicRouter()
+
+    async def handler(data):
+        pass
+
+    router.add("escape/esterno/ir-sensor/stato", handler, name="gate")
+    router.add("escape/+/+/state", handler, name="tracking")
+    router.add("escape/cucina/#", handler, name="kitchen")
+
+    assert names(router, "escape/esterno/ir-sensor/stato") == ["gate"]
+    assert names(router, "escape/gate/ir-sensor/state") == ["tracking"]
+    assert names(router, "escape/cucina/pentola/state") == ["tracking", "kitchen"]
+    assert names(router, "escape/cucina") == ["kitchen"]
+    # Nessuna route: il topic viene scartato prima della coda
+    assert not router.matches("escape/esterno/heartbeat")
+    assert not router.matches("escape/gate/ir-sensor/state/extra")
+
+
+def test_dollar_topics_skip_root_wildcards():
+    router = TopicRouter()
+
+    async def handler(data):
+        pass
+
+    router.add("#", handler, name="all")
+    router.add("+/broker/uptime", handler, name="plus")
+    router.add("$SYS/#", handler, name="sys")
+
+    assert names(router, "$SYS/broker/uptime") == ["sys"]
+    assert names(router, "escape/broker/uptime") == ["all", "plus"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_reaches_every_handler_and_isolates_errors():
+    router = TopicRouter()
+    calls = []
+
+    async def failing(data):
+        raise RuntimeError("boom")
+
+    async def tracking(data):
+        calls.append(data["raw_topic"])
+
+    router.add("escape/#", failing, name="failing")
+    router.add("escape/+/+/state", tracking, name="tracking")
+
+    await router.dispatch({"raw_topic": "escape/bagno/doccia/state"})
+    await router.dispatch({"raw_topic": "escape/bagno/doccia"}, "other/topic")
+
+    assert calls == ["escape/bagno/doccia/state"]
+    assert router.stats == {"dispatched": 1, "unmatched": 1, "errors": 1}
+
+
+def test_replace_and_remove_invalidate_the_cache():
+    router = TopicRouter()
+
+    async def handler(data):
+        pass
+
+    router.add("escape/esterno/ir-sensor/stato", handler, name="gate")
+    router.replace("elements", ["escape/cucina/frigo/door", "escape/bagno/doccia/state"], handler)
+    assert names(router, "escape/cucina/frigo/door") == ["elements"]
+
+    # Catalogo elementi modificato: nuova lista, un solo ricompilo
+    router.replace("elements", ["escape/bagno/doccia/state"], handler)
+    assert not router.matches("escape/cucina/frigo/door")
+    assert names(router, "escape/bagno/doccia/state") == ["elements"]
+    assert [route["handler"] for route in router.describe()] == ["gate", "elements"]
+
+    assert router.remove("gate") == 1
+    assert not router.matches("escape/esterno/ir-sensor/stato")
+
+
+@pytest.mark.parametrize("pattern", ["escape/#/stato", "escape/cucina#", "escape/+x/stato"])
+def test_invalid_patterns_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        validate_pattern(pattern)
@@ -0,0 +1,115 @@
+"""
+Test Persistence Statements - Round-trip SQL per operazione
+
+Verifica che i service non facciano più SELECT di refresh dopo il commit:
+ogni scrittura costa solo gli statement strettamente necessari e l'istanza
+restituita resta leggibile senza altre query.
+
+Usa SQLite in memoria (solo tabelle rooms, game_sessions, players):
+non serve lo stack Docker.
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Room, GameSession, Player, DeviceSessionBinding
+from app.schemas.game_session import GameSessionCreate, GameSessionUpdate
+from app.services.player_service import PlayerService
+from app.services.session_service import SessionService
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Room.__table__, GameSession.__table__, Player.__table__, DeviceSessionBinding.__table__])
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def counter(engine):
+    return StatementCounter(engine)
+
+
+@pytest.fixture
+def game_session(db):
+    db.add(Room(name="cucina"))
+    db.commit()
+    return SessionService(db).create(GameSessionCreate(room_id=1, expected_players=2), pin="1234")
+
+
+def test_session_create_is_single_insert(db, counter):
+    db.add(Room(name="camera"))
+    db.commit()
+    counter.reset()
+
+    session = SessionService(db).create(GameSessionCreate(room_id=1), pin="4321")
+
+    # INSERT ... RETURNING (id + start_time server_default) e basta
+    assert counter.count == 1, counter.statements
+    assert session.id is not None
+    assert session.pin == "4321"
+    assert session.start_time is not None
+    assert counter.count == 1, "Lettura dopo il commit non deve ricaricare l'istanza"
+
+
+def test_session_update_has_no_refresh(db, counter, game_session):
+    counter.reset()
+
+    session = SessionService(db).update(game_session.id, GameSessionUpdate(connected_players=3))
+
+    # SELECT + UPDATE (prima: + SELECT di refresh)
+    assert counter.count == 2, counter.statements
+    assert session.connected_players == 3
+    assert session.expected_players == 2
+    assert counter.count == 2
+
+
+def test_player_update_room_has_no_refresh(db, counter, game_session):
+    player = PlayerService(db).create_player(game_session.id, "Mario")
+    counter.reset()
+
+    updated = PlayerService(db).update_player_room(player.id, "cucina")
+
+    assert counter.count == 2, counter.statements
+    assert updated.current_room == "cucina"
+    assert updated.nickname == "Mario"
+    assert updated.connected_at is not None
+    assert counter.count == 2
+
+
+def test_end_session_keeps_instance_loaded(db, counter, game_session):
+    counter.reset()
+
+    session = SessionService(db).end_session(game_session.id)
+
+    # SELECT + DELETE dei binding device + UPDATE, nessun refresh
+    assert counter.count == 3, counter.statements
+    assert session.end_time is not None
+    assert session.room_id == 1
+    assert counter.count == 3
+
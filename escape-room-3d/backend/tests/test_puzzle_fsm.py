@@ -0,0 +1,188 @@
+"""
+Test Puzzle FSM - Tabelle compilate delle RoomSpec contro il comportamento storico
+
+Percorre ogni stanza lungo la sua sequenza di trigger e confronta stati,
+LED, flag hardware e completes_room con la logica dei vecchi service
+(riportata qui sotto come riferimento). Solo lookup: niente database.
+"""
+import itertools
+
+import pytest
+
+from app.services.puzzle_fsm import (
+    BATHROOM_FSM,
+    BEDROOM_FSM,
+    KITCHEN_FSM,
+    LIVINGROOM_FSM,
+    ROOM_FSMS,
+)
+
+
+# ------------------------------------------------- LED dei vecchi service
+
+def chain(status, done="done"):
+    return "green" if status == done else "red" if status == "active" else "off"
+
+
+def kitchen_leds(s):
+    # porta: calcolata da game_completion, non dalla stanza
+    return {"fornelli": chain(s["fornelli"]), "frigo": chain(s["frigo"]), "serra": chain(s["serra"])}
+
+
+def bedroom_leds(s):
+    return {
+        "porta": "green" if s["porta"] == "unlocked" else "red",
+        "materasso": "green" if s["materasso"] == "done" else "red",
+        "poltrona": chain(s["poltrona"]),
+        "ventola": chain(s["ventola"]),
+    }
+
+
+def bathroom_leds(s):
+    specchio_done = s["specchio"] == "done"
+    return {
+        "specchio": "green" if specchio_done else "red",
+        "specchio_white": "on" if specchio_done else "off",
+        "porta_finestra": chain(s["doccia"]),
+        "ventola": chain(s["ventola"]),
+    }
+
+
+def livingroom_leds(s):
+    return {"pianta": chain(s["pianta"], "completed"), "condizionatore": chain(s["condizionatore"], "completed")}
+
+
+BASELINE_LEDS = [
+    (KITCHEN_FSM, kitchen_leds),
+    (BEDROOM_FSM, bedroom_leds),
+    (BATHROOM_FSM, bathroom_leds),
+    (LIVINGROOM_FSM, livingroom_leds),
+]
+
+
+def walk(fsm, triggers):
+    statuses = fsm.initial_state()
+    transitions = []
+    for trigger in triggers:
+        transition = fsm.next(statuses, trigger)
+        assert transition is not None, f"{fsm.room}/{trigger} rejected from {statuses}"
+        statuses = transition.statuses
+        transitions.append(transition)
+    return statuses, transitions
+
+
+def test_all_rooms_registered():
+    assert set(ROOM_FSMS) == {"cucina", "camera", "bagno", "soggiorno"}
+
+
+@pytest.mark.parametrize("fsm,baseline", BASELINE_LEDS, ids=lambda value: getattr(value, "room", ""))
+def test_led_table_matches_baseline_for_every_state(fsm, baseline):
+    names = list(fsm.spec.puzzles)
+    for combo in itertools.product(*fsm.spec.puzzles.values()):
+        statuses = dict(zip(names, combo))
+        assert fsm.leds(statuses) == baseline(statuses), statuses
+
+
+@pytest.mark.parametrize("fsm,baseline", BASELINE_LEDS, ids=lambda value: getattr(value, "room", ""))
+def test_transition_leds_match_new_statuses(fsm, baseline):
+    for combo in itertools.product(*fsm.spec.puzzles.values()):
+        statuses = dict(zip(fsm.spec.puzzles, combo))
+        for trigger in fsm.spec.triggers:
+            transition = fsm.next(statuses, trigger)
+            if transition is not None:
+                assert transition.leds == baseline(transition.statuses)
+
+
+def test_kitchen_sequence():
+    statuses, (fornelli, frigo, serra) = walk(KITCHEN_FSM, ["fornelli", "frigo", "serra"])
+
+    assert fornelli.changed == {"fornelli": "done", "frigo": "active"}
+    assert fornelli.leds == {"fornelli": "green", "frigo": "red", "serra": "off"}
+    assert frigo.changed == {"frigo": "done", "serra": "active"}
+    assert serra.changed == {"serra": "done", "porta": "unlocked"}
+    assert serra.actuators == {"strip_led": {"is_on": True}}
+    assert [t.completes_room for t in (fornelli, frigo, serra)] == [False, False, True]
+    assert statuses == {"fornelli": "done", "frigo": "done", "serra": "done", "porta": "unlocked"}
+
+
+def test_bedroom_sequence():
+    statuses, (comodino, materasso, poltrona, ventola) = walk(
+        BEDROOM_FSM, ["comodino", "materasso", "poltrona", "ventola"]
+    )
+
+    # TASTO K: marker senza guardia, non sblocca nulla e non cambia i LED
+    assert comodino.changed == {"comodino": "done"}
+    assert comodino.leds == BEDROOM_FSM.leds(BEDROOM_FSM.initial_state())
+    assert materasso.changed == {"materasso": "done", "poltrona": "active"}
+    assert poltrona.changed == {"poltrona": "done", "ventola": "active"}
+    assert ventola.changed == {"ventola": "done", "porta": "unlocked"}
+    assert ventola.leds == {"porta": "green", "materasso": "green", "poltrona": "green", "ventola": "green"}
+    assert [t.completes_room for t in (comodino, materasso, poltrona, ventola)] == [False, False, False, True]
+    assert statuses["porta"] == "unlocked"
+
+
+def test_bedroom_comodino_has_no_guard_but_fires_once():
+    statuses, _ = walk(BEDROOM_FSM, ["materasso", "poltrona"])
+    transition = BEDROOM_FSM.next(statuses, "comodino")
+    assert transition is not None and transition.changed == {"comodino": "done"}
+    # Pressione ripetuta: nessuna transizione (niente evento né tempo di risoluzione ~0)
+    assert BEDROOM_FSM.next(transition.statuses, "comodino") is None
+
+
+@pytest.mark.parametrize("fsm", list(ROOM_FSMS.values()), ids=lambda fsm: fsm.room)
+def test_no_transition_without_changes(fsm):
+    for combo in itertools.product(*fsm.spec.puzzles.values()):
+        statuses = dict(zip(fsm.spec.puzzles, combo))
+        for trigger in fsm.spec.triggers:
+            transition = fsm.next(statuses, trigger)
+            assert transition is None or transition.changed
+
+
+def test_bathroom_sequence():
+    statuses, (specchio, doccia, ventola) = walk(BATHROOM_FSM, ["specchio", "doccia", "ventola"])
+
+    assert specchio.changed == {"specchio": "done", "doccia": "active"}
+    assert specchio.leds["specchio_white"] == "on"
+    assert doccia.changed == {"doccia": "done", "ventola": "active"}
+    assert ventola.changed == {"ventola": "done"}
+    assert ventola.actuators == {"window_servo_should_close": True, "fan_should_run": True}
+    assert [t.completes_room for t in (specchio, doccia, ventola)] == [False, False, True]
+    assert statuses == {"specchio": "done", "doccia": "done", "ventola": "done"}
+
+
+def test_livingroom_sequence():
+    statuses, (tv, pianta, condizionatore) = walk(LIVINGROOM_FSM, ["tv", "pianta", "condizionatore"])
+
+    assert tv.changed == {"tv": "completed", "pianta": "active"}
+    assert tv.leds == {"pianta": "red", "condizionatore": "off"}
+    assert pianta.changed == {"pianta": "completed", "condizionatore": "active"}
+    assert condizionatore.changed == {"condizionatore": "completed"}
+    assert condizionatore.actuators == {"door_servo_should_close": True, "fan_should_run": True}
+    assert [t.completes_room for t in (tv, pianta, condizionatore)] == [False, False, True]
+    assert statuses == {"tv": "completed", "pianta": "completed", "condizionatore": "completed"}
+
+
+@pytest.mark.parametrize("fsm,trigger", [
+    (KITCHEN_FSM, "frigo"),
+    (KITCHEN_FSM, "serra"),
+    (BEDROOM_FSM, "poltrona"),
+    (BATHROOM_FSM, "ventola"),
+    (LIVINGROOM_FSM, "condizionatore"),
+])
+def test_out_of_order_trigger_is_rejected(fsm, trigger):
+    assert fsm.next(fsm.initial_state(), trigger) is None
+
+
+@pytest.mark.parametrize("fsm", list(ROOM_FSMS.values()), ids=lambda fsm: fsm.room)
+def test_repeated_trigger_is_rejected(fsm):
+    guarded = [name for name, spec in fsm.spec.triggers.items() if spec.requires is not None]
+    statuses, _ = walk(fsm, guarded[:1])
+    assert fsm.next(statuses, guarded[0]) is None
+
+
+def test_unknown_status_has_no_transition():
+    statuses = KITCHEN_FSM.initial_state()
+    statuses["fornelli"] = "broken"
+    assert KITCHEN_FSM.encode(statuses) is None
+    assert KITCHEN_FSM.next(statuses, "fornelli") is None
+    assert KITCHEN_FSM.next(KITCHEN_FSM.initial_state(), "unknown") is None
@@ -0,0 +1,60 @@
+"""
+Test Request Dedup - debounce per device degli endpoint ESP32
+
+App ASGI finta che conta le esecuzioni: niente FastAPI né database.
+"""
+import pytest
+
+from app.core.request_dedup import RequestDeduplicationMiddleware
+
+PHOTOCELL = "/api/sessions/1/gate-puzzles/photocell/update"
+
+
+class CountingApp:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, scope, receive, send):
+        self.calls.append(scope["query_string"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": scope["query_string"]})
+
+
+async def post(middleware, path: str, query: bytes, device: bytes = b"esp32-esterno"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": path, "query_string": query,
+        "headers": [(b"x-device-id", device)], "client": ("10.0.0.2", 1234)
+    }
+    await middleware(scope, receive, send)
+    return dict(sent[0]["headers"]).get(b"idempotency-replayed") == b"true"
+
+
+@pytest.mark.asyncio
+async def test_identical_burst_is_answered_from_cache():
+    app = CountingApp()
+    middleware = RequestDeduplicationMiddleware(app, routes=((r"/photocell/update$", 500),))
+
+    replayed = [await post(middleware, PHOTOCELL, b"is_clear=true") for _ in range(3)]
+
+    assert replayed == [False, True, True]
+    assert app.calls == [b"is_clear=true"]
+
+
+@pytest.mark.asyncio
+async def test_state_flap_is_not_replayed():
+    app = CountingApp()
+    middleware = RequestDeduplicationMiddleware(app, routes=((r"/photocell/update$", 500),))
+
+    for query in (b"is_clear=true", b"is_clear=false", b"is_clear=true"):
+        assert not await post(middleware, PHOTOCELL, query)
+
+    # Ogni cambio di stato viene eseguito: il DB finisce sull'ultimo valore
+    assert app.calls == [b"is_clear=true", b"is_clear=false", b"is_clear=true"]
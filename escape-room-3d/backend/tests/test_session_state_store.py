@@ -0,0 +1,105 @@
+"""
+Test Session State Store - proiezione in memoria dell'event log
+
+Gli eventi arrivano ad apply() nell'ordine in cui i chiamanti finiscono:
+la proiezione deve avanzare solo per seq consecutivi. Il log è una lista
+in memoria; l'allocazione dei seq usa SQLite in memoria (tabelle rooms,
+game_sessions).
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import GameSession, Room
+from app.services.session_state_store import PendingEvent, SessionStateStore, _Projection, initial_state
+
+
+class LogStore(SessionStateStore):
+    """Store con il log in una lista: `_events_after` legge solo gli eventi committati"""
+
+    def __init__(self, snapshot_every: int = 50):
+        super().__init__(snapshot_every)
+        self.log = []
+        self.snapshots = []
+        self._projections[7] = _Projection(initial_state(), 0)
+
+    def commit(self, seq, statuses):
+        event = PendingEvent(7, seq, "puzzle_transition", "cucina", {"statuses": statuses, "leds": {"fornelli": statuses["fornelli"]}})
+        self.log.append(event)
+        return event
+
+    def _events_after(self, db, session_id, seq):
+        return [(e.seq, e.kind, e.room, e.payload) for e in sorted(self.log) if e.seq > seq]
+
+    def _write_snapshot(self, db, session_id, seq, state):
+        self.snapshots.append((seq, state["rooms"]["cucina"]["puzzles"]["fornelli"]))
+
+
+def fornelli(store):
+    return store._projections[7].state["rooms"]["cucina"]["puzzles"]["fornelli"]
+
+
+def test_out_of_order_apply_keeps_the_newest_state():
+    store = LogStore()
+    older = store.commit(1, {"fornelli": "active"})
+    newer = store.commit(2, {"fornelli": "done"})
+
+    # Il thread con seq 2 finisce per primo: riallineamento dal log (1 e 2)
+    store.apply(None, newer)
+    store.apply(None, older)
+
+    assert store.seq(7) == 2
+    assert fornelli(store) == "done"
+
+
+def test_snapshot_only_covers_a_gap_free_prefix():
+    store = LogStore(snapshot_every=2)
+    first = store.commit(1, {"fornelli": "active"})
+    second = store.commit(2, {"fornelli": "done"})
+    third = store.commit(3, {"fornelli": "active"})
+
+    store.apply(None, second)   # buco su 1 → entrambi dal log, snapshot @2 con l'evento 1 incluso
+    store.apply(None, first)
+    store.apply(None, third)
+
+    assert store.snapshots == [(2, "done")]
+    assert store.seq(7) == 3
+
+
+def test_in_order_apply_does_not_read_the_log():
+    store = LogStore()
+    event = store.commit(1, {"fornelli": "done"})
+    store.log.clear()
+
+    store.apply(None, event)
+
+    assert store.seq(7) == 1
+    assert fornelli(store) == "done"
+
+
+# ------------------------------------------------------ seq dal database
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Room.__table__, GameSession.__table__])
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.add(Room(id=1, name="cucina"))
+    session.add(GameSession(id=7, room_id=1, pin="1234"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_state_seq_is_allocated_by_the_database(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    # Due store = due processi/repliche: il contatore è sulla riga della sessione, non in memoria
+    first, second = SessionStateStore(), SessionStateStore()
+    seqs = [first._next_seq(db, 7), second._next_seq(db, 7), first._next_seq(db, 7)]
+
+    assert seqs == [1, 2, 3]
+    assert len(statements) == 3, "Un solo UPDATE ... RETURNING per seq"
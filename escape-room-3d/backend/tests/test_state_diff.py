@@ -0,0 +1,63 @@
+"""
+Test State Diff - snapshot dal DB contro i publish() concorrenti
+
+sio.emit sostituito da un registratore e lettura dal DB finta: niente
+server Socket.IO né database.
+"""
+import pytest
+
+from app.websocket import state_diff
+from app.websocket.state_diff import StateDiffBroadcaster
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit(event, data=None, room=None, to=None, **kwargs):
+        sent.append((event, data))
+
+    monkeypatch.setattr(state_diff.sio, "emit", emit)
+    return sent
+
+
+def kitchen(status):
+    return {"rooms": {"cucina": {"states": {"fornelli": {"status": status}}}}}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_discards_a_document_loaded_during_a_publish(emitted, monkeypatch):
+    broadcaster = StateDiffBroadcaster()
+    await broadcaster.publish(7, "cucina", kitchen("active")["rooms"]["cucina"])
+    loads = []
+
+    async def load_in_thread(function, session_id):
+        loads.append(session_id)
+        if len(loads) == 1:
+            # Transizione committata e pubblicata mentre la lettura era in corso
+            await broadcaster.publish(7, "cucina", kitchen("done")["rooms"]["cucina"])
+            return kitchen("active")
+        return kitchen("done")
+
+    monkeypatch.setattr(state_diff.asyncio, "to_thread", load_in_thread)
+    snapshot = await broadcaster.snapshot(7)
+
+    assert len(loads) == 2
+    assert snapshot["state"] == kitchen("done")
+    assert snapshot["version"] == 2
+    # Nessun diff all'indietro verso lo stato letto prima della transizione
+    assert [data["version"] for event, data in emitted if event == "state_diff"] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_emits_the_missing_part_as_a_diff(emitted, monkeypatch):
+    broadcaster = StateDiffBroadcaster()
+
+    async def load_in_thread(function, session_id):
+        return kitchen("done")
+
+    monkeypatch.setattr(state_diff.asyncio, "to_thread", load_in_thread)
+    snapshot = await broadcaster.snapshot(7)
+
+    assert snapshot["version"] == 1
+    assert emitted[0][1]["changes"] == kitchen("done")
@@ -103,6 +103,8 @@ void publishMQTT() {
   
   // Pubblica stato fotocellula
   client.publish("escape/esterno/ir-sensor/stato", irLibero ? "LIBERO" : "OCCUPATO");
+  // Lettura per il backend (topic solo della scheda: il backend pubblica su ir-sensor/stato)
+  client.publish("escape/esterno/ir-sensor/lettura", irLibero ? "LIBERO" : "OCCUPATO");
   
   // Pubblica posizioni servo (per sync scena 3D)
   char buffer[8];
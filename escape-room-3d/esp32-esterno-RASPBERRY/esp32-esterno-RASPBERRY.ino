@@ -135,6 +135,8 @@ void publishMQTT() {
   String base = "escape/esterno/" + String(session_id) + "/";
   client.publish((base + "led/stato").c_str(), irLibero ? "VERDE" : "ROSSO");
   client.publish((base + "ir-sensor/stato").c_str(), irLibero ? "LIBERO" : "OCCUPATO");
+  // Lettura per il backend (topic solo della scheda: il backend pubblica su ir-sensor/stato)
+  client.publish("escape/esterno/ir-sensor/lettura", irLibero ? "LIBERO" : "OCCUPATO");
 }
 
 void setup() {
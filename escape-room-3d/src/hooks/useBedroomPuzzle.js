@@ -100,6 +100,11 @@ export function useBedroomPuzzle(sessionId, socket) {
         return
       }
       
+      // Only camera updates (lo stesso socket riceve gli aggiornamenti di tutte le stanze)
+      if (data.room && data.room !== 'camera') {
+        return
+      }
+      
       // Update puzzle states
       setPuzzleStates({
         comodino: data.states.comodino.status,
@@ -110,6 +110,11 @@ export function useKitchenPuzzle(sessionId, socket) {
         return
       }
       
+      // Only cucina updates (lo stesso socket riceve gli aggiornamenti di tutte le stanze)
+      if (data.room && data.room !== 'cucina') {
+        return
+      }
+      
       // ✅ FIX: Valida struttura dati PRIMA di accedere
       if (!data.states || !data.led_states) {
         console.error('❌ [useKitchenPuzzle] Invalid WebSocket data structure:', data)
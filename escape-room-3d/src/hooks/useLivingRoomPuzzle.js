@@ -242,6 +242,9 @@ export function useLivingRoomPuzzle(sessionId) {
   // WebSocket listener for real-time updates
   useEffect(() => {
     const handlePuzzleUpdate = (event) => {
+      if (event.detail?.room && event.detail.room !== 'soggiorno') {
+        return;
+      }
       if (event.detail?.session_id === sessionId) {
         console.log('[useLivingRoomPuzzle] 📡 WebSocket update received:', event.detail);
         setPuzzleState(event.detail);
@@ -1,5 +1,6 @@
 import { useState, useEffect, useRef } from 'react'
 import { io } from 'socket.io-client'
+import { attachStateDiffClient } from '../utils/stateDiffClient'
 
 // In produzione (Docker) usa percorso relativo, nginx proxya /socket.io/
 // In dev locale usa http://localhost:3000 se VITE_WS_URL non è impostato
@@ -27,6 +28,9 @@ function useWebSocket(sessionId, room, playerName) {
 
     socketRef.current = socket
 
+    // state_diff versionati → eventi puzzle_state_update / game_completion_update per gli hook
+    const detachStateDiff = attachStateDiffClient(socket, sessionId)
+
     socket.on('connect', () => {
       console.log('WebSocket: Connected with ID', socket.id)
       setConnected(true)
@@ -105,6 +109,7 @@ function useWebSocket(sessionId, room, playerName) {
 
     return () => {
       console.log('WebSocket: Cleaning up connection')
+      detachStateDiff()
       socket.disconnect()
     }
   }, [sessionId, room, playerName])
@@ -0,0 +1,112 @@
+/**
+ * State Diff Client
+ *
+ * Il backend invia UN messaggio `state_diff` per ogni cambio di stato
+ * (puzzle stanza + LED + LED porta + completamento) con un numero di versione.
+ * Questo client:
+ * - mantiene una copia locale del documento di sessione
+ * - applica i diff in ordine (base_version === versione locale)
+ * - se rileva un buco di versione o un riavvio del backend (epoch diverso)
+ *   chiede `requestStateSnapshot` e riparte dallo `state_snapshot`
+ * - ri-espone lo stato aggiornato come eventi `puzzle_state_update` /
+ *   `game_completion_update` ai listener già registrati sul socket,
+ *   così gli hook delle stanze non devono cambiare
+ */
+
+const merge = (target, changes) => {
+  Object.entries(changes).forEach(([key, value]) => {
+    if (value && typeof value === 'object' && !Array.isArray(value) &&
+        target[key] && typeof target[key] === 'object') {
+      merge(target[key], value)
+    } else {
+      target[key] = value
+    }
+  })
+  return target
+}
+
+export function attachStateDiffClient(socket, sessionId) {
+  const mirror = { epoch: null, version: 0, state: {} }
+  let awaitingSnapshot = false
+
+  const dispatchLocal = (event, payload) => {
+    socket.listeners(event).forEach((listener) => {
+      try {
+        listener(payload)
+      } catch (error) {
+        console.error(`[stateDiff] ${event} listener failed:`, error)
+      }
+    })
+  }
+
+  const emitLegacy = (changes) => {
+    const session_id = parseInt(sessionId)
+
+    Object.keys(changes.rooms || {}).forEach((room) => {
+      const payload = {
+        type: 'puzzle_state_update',
+        session_id,
+        room,
+        ...mirror.state.rooms[room]
+      }
+      dispatchLocal('puzzle_state_update', payload)
+      // useLivingRoomPuzzle ascolta su window (solo il soggiorno: non filtra le altre stanze)
+      if (room === 'soggiorno') {
+        window.dispatchEvent(new CustomEvent('puzzle_state_update', { detail: payload }))
+      }
+    })
+
+    if (changes.completion) {
+      dispatchLocal('game_completion_update', { session_id, ...mirror.state.completion })
+    }
+  }
+
+  const requestSnapshot = () => {
+    if (awaitingSnapshot) return
+    awaitingSnapshot = true
+    socket.emit('requestStateSnapshot', { sessionId })
+  }
+
+  const handleDiff = (message) => {
+    if (String(message.session_id) !== String(sessionId)) return
+    if (awaitingSnapshot) return
+
+    if (message.epoch !== mirror.epoch || message.base_version !== mirror.version) {
+      console.warn(`[stateDiff] Version gap (local v${mirror.version}, base v${message.base_version}) - requesting snapshot`)
+      requestSnapshot()
+      return
+    }
+
+    merge(mirror.state, message.changes)
+    mirror.version = message.version
+    emitLegacy(message.changes)
+  }
+
+  const handleSnapshot = (snapshot) => {
+    if (String(snapshot.session_id) !== String(sessionId)) return
+    awaitingSnapshot = false
+    mirror.epoch = snapshot.epoch
+    mirror.version = snapshot.version
+    mirror.state = snapshot.state || {}
+    emitLegacy({
+      rooms: mirror.state.rooms || {},
+      completion: mirror.state.completion
+    })
+  }
+
+  const handleConnect = () => {
+    // Dopo ogni (ri)connessione potremmo aver perso dei diff
+    awaitingSnapshot = false
+    requestSnapshot()
+  }
+
+  socket.on('state_diff', handleDiff)
+  socket.on('state_snapshot', handleSnapshot)
+  socket.on('connect', handleConnect)
+
+  return () => {
+    socket.off('state_diff', handleDiff)
+    socket.off('state_snapshot', handleSnapshot)
+    socket.off('connect', handleConnect)
+  }
+}